@@ -17,7 +17,6 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from threading import Timer
 import time
 import os
 import settings
@@ -31,29 +30,35 @@ import json
 from PySide6.QtUiTools import QUiLoader
 from PySide6.QtWidgets import QApplication, QTabWidget, QWidget, QMessageBox, QComboBox, QLineEdit, QTreeView, QAbstractItemView, \
                 QPlainTextEdit, QDialogButtonBox
-from PySide6.QtCore import Qt, QFile, QIODevice, QCoreApplication, QDir, Slot, Signal, QObject, QRegularExpression, QTime, QEventLoop
+from PySide6.QtCore import Qt, QFile, QIODevice, QCoreApplication, QDir, Slot, Signal, QObject, QRegularExpression, QTime, QEventLoop, QTimer
 from PySide6.QtGui import QStandardItemModel, QStandardItem, QAction, QRegularExpressionValidator
 
+from MIDIQueue import MIDICoalescer
+from MIDIDispatch import MIDIDispatcher, handles, REALTIME, NON_REALTIME
+from GNXSession import Correlator, Task, RequestTimeout, RequestRejected, RequestCancelled, ACK, response_key
+from devicestate import DeviceSnapshot, BLOCK_KEYS
+from devicemodel import DeviceModel
+from patchschema import SECTIONS, BY_NAME, LFO
+from uploader import Uploader, delta
+from scheduler import Scheduler, Watchdog
+import stats
 from customwidgets.styledial import StyleDial
 from customwidgets.ampface import AmpFace
 from customwidgets.cabface import CabFace
 
-from customwidgets.factory import factory_pickup_names
-from customwidgets.factory import factory_wah_types
-from customwidgets.factory import factory_onoff
-from customwidgets.factory import factory_compressor_attack
-from customwidgets.factory import factory_compressor_ratio
-from customwidgets.factory import factory_whammy_shift
-from customwidgets.factory import factory_ips_shift
-from customwidgets.factory import factory_ips_scale
-from customwidgets.factory import factory_ips_key
-from customwidgets.factory import factory_waveforms
 from customwidgets.factory import factory_expression_assignments
 
 from customwidgets.utils import get_expression_assignment_index
-from customwidgets.utils import getnum, skip_bytes, compile_number, pack_data, build_sysex, compare_array
+from customwidgets.utils import compile_number, compare_array
+import sysex
+import blobstore
+import librarydb
 
 from treeview import findByData, add_category_to_tree
+
+# device state is kept in the model, read and written here under the old names
+def model_attribute(name):
+    return property(lambda self: getattr(self.model, name), lambda self, value: setattr(self.model, name, value))
                           
 class GNX1(QObject):
 
@@ -66,29 +71,52 @@ class GNX1(QObject):
     midiChannelChanged = Signal(int)
     midiPatchChange = Signal(int)      # MIDI patch change 0xCn
     deviceConnectedChanged = Signal(bool)
+    deviceStateStale = Signal(bool)     # True while the faces show the snapshot, not yet confirmed by the device
 
     watchDogBite = Signal(bool)
 
     midi_watchdog = None
     midi_watchdog_time = 1  # time between watchdog timeouts
-    midi_watchdog_bite_count = 0    # count timeouts before biting
     midi_watchdog_bite_count_limit = 5 # number of timeouts before biting
+    midi_watchdog_backoff_max = 30     # seconds, longest wait between bites while the device stays silent
+
+    parameter_coalescer = None
+    encoder = None
+    parameter_flush_timer = None
+    parameter_flush_rate = 30       # Hz, rate at which coalesced parameter changes are sent
 
     commsMode = None
     commsPhase = None
+    session = None                  # request/response correlator
+    scheduler = None                # keep-alives and other timed jobs
+    poll_timer = None               # runs the session and the scheduler
+    poll_ms = 50
+    comms_task = None               # running sync or upload
+    comms_task_started = None
+    pipelined_sync = True           # overlap the independent sync requests, cleared if the device can't cope
+    incremental_sync = True         # reconnect from the device snapshot when it is still valid
+    snapshot = None
+    startup_cache = True            # fill the editor from the snapshot before the device answers
+    patch_from_cache = False        # current patch came from the snapshot and needs reconciling
+    delta_upload = True             # library patches close to the edit buffer sent as parameter changes
+    delta_sent = None               # (first, last) numbers in the send queue of a delta upload not yet known to be out
     resync_callback = None
     midicontrol = None
     mnfr_id = [0x00, 0x00, 0x10]
     device_id = 0x56
 
     midi_channel_offset = 4     # offset in received message to MIDI channel
+    midi_channel = 0            # copy of the configured channel for the receive path
+    dispatch = None
     device_connected = False
-    current_patch_name = None
-    current_patch_number = None
-    current_patch_bank = None
-    user_patch_names = []
-    amp_names = {}
-    cab_names = {}
+    model = None                    # patch, names and current patch, the faces subscribe to it
+    current_patch_name = model_attribute("current_patch_name")
+    current_patch_number = model_attribute("current_patch_number")
+    current_patch_bank = model_attribute("current_patch_bank")
+    patch_names = model_attribute("patch_names")
+    user_amp_names = model_attribute("user_amp_names")
+    user_cab_names = model_attribute("user_cab_names")
+    user_patch_names = property(lambda self: self.model.patch_names.get(1, []))
 
     device_pickup = None
     device_wah = None
@@ -108,48 +136,9 @@ class GNX1(QObject):
     device_expression = None
     device_lfo = None
 
-    # for saving to library
-    code24data = None
-    code2Adata = None
-    code26data = None
-    code28data = None
-
     last_extra = None
     lastbytes = None
 
-    class watchdog(Exception):
-        def __init__(self, timeout = None, userHandler = None):  # timeout in seconds
-            self.handler = userHandler if userHandler is not None else self.defaultHandler
-            self.timer = None
-            if timeout == None:
-                self.timeout = 5
-            else:
-                self.timeout = timeout
-
-        def start(self):
-            if self.timer!= None:
-                self.timer.cancel()
-            self.timer = Timer(self.timeout, self.handler)
-            self.timer.daemon = True
-            self.timer.start()
-            #print("Watchdog started")
-
-        def reset(self):
-            if self.timer!= None:
-                self.timer.cancel()
-            self.timer = Timer(self.timeout, self.handler)
-            self.timer.start()
-            #print("Watchdog reset")
-
-        def stop(self):
-            if self.timer!= None:
-                self.timer.cancel()
-
-            #print("Watchdog stopped")
-
-        def defaultHandler(self):
-            raise self
-
     class gnx1_pickup:
 
         def __init__(self, parent, ui_device):
@@ -166,27 +155,7 @@ class GNX1(QObject):
             for k, arg in kwargs.items():
                 match k:
                     case "type":
-                        if arg not in factory_pickup_names.keys():
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Pickup type not recognised ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.setPickup(type = arg)
-
-        # extract pickup value from GNX1 data string and return next position
-        def get_values(self, n, unpacked):
-            n, nbytes = getnum(n, unpacked) # may be number of values
-            n, type = getnum(n, unpacked)
-            self.set_values(type = type)
-            
-            #print(f"Pickup: Type: {type}")
-            return n
-        
-        # individual parameter change from GNX1
-        parameter_names = ["type"]
-        def parameter_change(self, parameter, value):
-            # parameter is an index
-            name = self.parameter_names[parameter]
-            self.set_values(**{name: value})
+                        self.ui_device.setPickup(type = arg)
 
     class gnx1_wah:
 
@@ -217,61 +186,19 @@ class GNX1(QObject):
             for k, arg in kwargs.items():
                 match k:
                     case "type":
-                        if arg not in factory_wah_types.keys():
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Wah type ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.setWah(type = arg)
+                        self.ui_device.setWah(type = arg)
 
                     case "on":
-                        if arg not in factory_onoff.keys():
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Wah on/off ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.setWah(on = arg)
+                        self.ui_device.setWah(on = arg)
 
                     case "min":
-                        if arg < 0 or arg > 99:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Wah minimum value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_min.setValue(arg)
+                        self.ui_device.pot_min.setValue(arg)
 
                     case "max":
-                        if arg < 0 or arg > 99:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Wah maximum value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)        
-                        else:
-                            setattr(self, k, arg)
-                            self.ui_device.pot_max.setValue(arg)
+                        self.ui_device.pot_max.setValue(arg)
 
                     case "pedal":
-                        if arg < 0 or arg > 99:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Pedal maximum value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_pedal.setValue(arg)
-
-        # extract values from GNX1 data string and return next position
-        def get_values(self, n, unpacked):
-            n, nbytes = getnum(n, unpacked) # may be number of values
-            n, type = getnum(n, unpacked)
-            n, on = getnum(n, unpacked)
-            n, min = getnum(n, unpacked)
-            n, max = getnum(n, unpacked)
-            n, pedal = getnum(n, unpacked)
-
-            self.set_values(type = type, on = on, min = min, max = max, pedal = pedal)
-            
-            #print("WAH: {0}, Type: {1}, Min: {2}, Max: {3}, Pedal:{4}".format(factory_onoff[on], factory_wah_types[type], min, max, pedal))
-            return n
-
-        # individual parameter change from GNX1
-        parameter_names = ["type", "on", "min", "max", "pedal"]
-        def parameter_change(self, parameter, value):
-            # parameter is an index
-            name = self.parameter_names[parameter]
-            self.set_values(**{name: value})
+                        self.ui_device.pot_pedal.setValue(arg)
 
     class gnx1_compressor(QObject):
 
@@ -320,65 +247,20 @@ class GNX1(QObject):
             for k, arg in kwargs.items():
                 match k:
                     case "on":
-                        if arg not in factory_onoff.keys():
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Compressor on/off ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.setCompressor(on = arg)
+                        self.ui_device.setCompressor(on = arg)
                             
                     case "attack":
-                        if arg not in factory_compressor_attack.keys():
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Compressor Attack value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.setCompressor(attack = arg)
+                        self.ui_device.setCompressor(attack = arg)
 
                     case "ratio":
-                        if arg not in factory_compressor_ratio.keys():
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Compressor Ratio value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_ratio.setValue(arg)
-                            self.ui_device.updateLabel1()
+                        self.ui_device.pot_ratio.setValue(arg)
+                        self.ui_device.updateLabel1()
 
                     case "threshold":
-                        if arg < 0 or arg > 99:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Compressor Threshold value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_threshold.setValue(arg)
+                        self.ui_device.pot_threshold.setValue(arg)
 
                     case "gain":
-                        if arg < 0 or arg > 20:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Compressor Gain value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_gain.setValue(arg)
-
-        # extract values from GNX1 data string and return next position
-        def get_values(self, n, unpacked):
-            n, nbytes = getnum(n, unpacked)     # may be number of values
-            n, type = getnum(n, unpacked)       # always zero
-            n, on = getnum(n, unpacked)
-            n, attack = getnum(n, unpacked)
-            n, ratio = getnum(n, unpacked)
-            n, threshold = getnum(n, unpacked)
-            n, gain = getnum(n, unpacked)
-
-            self.set_values(on = on, attack = attack, ratio = ratio, threshold = threshold, gain = gain)
-            
-            #print("COMPRESSOR: {0}, Attack: {1}, Ratio: {2}, Threshold: {3}, Gain:{4}".format(
-            #      factory_onoff[on], factory_compressor_attack[attack], factory_compressor_ratio[ratio],
-            #        threshold, gain))
-            
-            return n
-        
-        # individual parameter change from GNX1
-        parameter_names = ["type", "on", "attack", "ratio", "threshold", "gain"]
-        def parameter_change(self, parameter, value):
-            # parameter is an index
-            name = self.parameter_names[parameter]
-            self.set_values(**{name: value})
+                        self.ui_device.pot_gain.setValue(arg)
 
     class gnx1_whammy(QObject):
 
@@ -471,113 +353,30 @@ class GNX1(QObject):
 
         # from GNX 1
         def set_values(self, **kwargs):
-            maxlimits = {   # by type
-                0: {"param_1": len(factory_whammy_shift) - 1, "param_2": 99, "param_3": 99, "param_4": 99},
-                1: {"param_1": len(factory_ips_shift) - 1, "param_2": len(factory_ips_scale) - 1, "param_3": len(factory_ips_key) - 1, "param_4": 99},
-                2: {"param_1": 24, "param_2": 99, "param_3": 99, "param_4": 99},
-                3: {"param_1": 48, "param_2": 99, "param_3": 99, "param_4": 99}
-            }
-                         
             for k, arg in kwargs.items():
                 match k:
                     case "on":
-                        if arg not in factory_onoff.keys():
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Whammy/IPS on/off ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.setWhammy(on = arg)
+                        self.ui_device.setWhammy(on = arg)
 
                     case "type":
-                        if arg < 0 or arg > 3:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Whammy Type value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.type = arg
-                            self.ui_device.setWhammy(type = arg)
+                        self.type = arg
+                        self.ui_device.setWhammy(type = arg)
 
                     case "param_1":
-                        if arg < 0 or arg > maxlimits[self.type]["param_1"]:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Whammy Param 1 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_1.setValue(arg)
-                            self.ui_device.updateLabel1()
+                        self.ui_device.pot_1.setValue(arg)
+                        self.ui_device.updateLabel1()
 
                     case "param_2":
-                        if arg < 0 or arg > maxlimits[self.type]["param_2"]:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Whammy Param 2 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_2.setValue(arg)
-                            self.ui_device.updateLabel2()
+                        self.ui_device.pot_2.setValue(arg)
+                        self.ui_device.updateLabel2()
 
                     case "param_3":
-                        if arg < 0 or arg > maxlimits[self.type]["param_3"]:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Whammy Param 3 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_3.setValue(arg)
-                            self.ui_device.updateLabel3()
+                        self.ui_device.pot_3.setValue(arg)
+                        self.ui_device.updateLabel3()
 
                     case "param_4":
-                        if arg < 0 or arg > maxlimits[self.type]["param_4"]:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Whammy Param 4 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_4.setValue(arg)
-
-        # extract values from GNX1 data string and return next position
-        def get_values(self, n, unpacked):
-            n, nbytes = getnum(n, unpacked)     # may be number of values
-            n, type = getnum(n, unpacked)
-            n, on = getnum(n, unpacked)
-
-            self.type = type
-            match type:             # variable number of parameters depending on type
-                case 0: # whammy
-                    n, param_1 = getnum(n, unpacked)
-                    n, param_2 = getnum(n, unpacked)
-                    n, param_3 = getnum(n, unpacked)
-                    self.set_values(on = on, type = type, param_1 = param_1, param_2 = param_2, param_3 = param_3)
-                    #print("WHAMMY: {0}, Shift {1}, Pedal {2}, Mix {3}".format(
-                    #    factory_onoff[on], factory_whammy_shift[param_1], param_2, param_3))
+                        self.ui_device.pot_4.setValue(arg)
 
-                case 1: # IPS
-                    n, param_1 = getnum(n, unpacked)
-                    n, param_2 = getnum(n, unpacked)
-                    n, param_3 = getnum(n, unpacked)
-                    n, param_4 = getnum(n, unpacked)
-                    self.set_values(on = on, type = type, param_1 = param_1, param_2 = param_2, param_3 = param_3, param_4 = param_4)
-                    #print("IPS: {0}, Shift {1}, Scale {2}, Key {3}, Level {4}".format(
-                    #    factory_onoff[on], factory_ips_shift[param_1], factory_ips_scale[param_2],
-                    #      factory_ips_key[param_3], param_4))
-
-                case 2: # detune
-                    n, param_1 = getnum(n, unpacked)
-                    n, param_2 = getnum(n, unpacked)
-                    self.set_values(on = on, type = type, param_1 = param_1, param_2 = param_2)
-                    #print("DETUNE: {0}, Shift {1}, Level {2}".format(
-                    #    factory_onoff[on], param_1, param_2))
-
-                case 3: # pitch
-                    n, param_1 = getnum(n, unpacked)
-                    n, param_2 = getnum(n, unpacked)
-                    self.set_values(on = on, type = type, param_1 = param_1, param_2 = param_2)
-                    #print("PITCH: {0}, Shift {1}, Level {2}".format(
-                    #    factory_onoff[on], param_1, param_2))
-                case _:
-                    e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Unrecognised Whammy/IPS type {type}", buttons = QMessageBox.Ok)
-                    self.parent.gnxAlert.emit(e)
-
-            return n
-        
-        # individual parameter change from GNX1
-        parameter_names = ["type", "on", "param_1", "param_2", "param_3", "param_4"]
-        def parameter_change(self, parameter, value):
-            # parameter is an index
-            name = self.parameter_names[parameter]
-            self.set_values(**{name: value})
-    
     class gnx1_warp(QObject):
 
         warpPotChanged = Signal(int, int, dict, str)    # section, parameter, pot, name
@@ -614,72 +413,16 @@ class GNX1(QObject):
             for k, arg in kwargs.items():
                 match k:
                     case "type":
-                        if arg < 0 or arg > 0:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Amp Type ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.setWarpFactor(type = arg)
-                            if sendToGNX:   # not implemented - crashes GNX1!!!
-                                #self.warp_changed(self.parameter_names.index(k), arg)
-                                pass
-
-                    case "amp_select":
-                        if arg < 0 or arg > 2:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Amp Select type ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)    
-                        else:
-                            self.ui_device.setWarpFactor(amp_select = arg)
-                            if sendToGNX:
-                                self.warp_changed(self.parameter_names.index(k), arg)
-
-                    case "amp_warp":
-                        if arg < 0 or arg > 99:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Amp Warp ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.setWarpFactor(amp_warp = arg)
-                            if sendToGNX:
-                                self.warp_changed(self.parameter_names.index(k), arg)
-
-                    case "cab_warp":
-                        if arg < 0 or arg > 99:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Cab Warp ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.setWarpFactor(cab_warp = arg)
-                            if sendToGNX:
-                                self.warp_changed(self.parameter_names.index(k), arg)         
-
-                    case "warpD":
-                        if arg < 0 or arg > 99:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Warp Param D ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:  
-                            self.ui_device.setWarpFactor(warpD = arg)
-                            if sendToGNX:
-                                self.warp_changed(self.parameter_names.index(k), arg)
-
-        # extract values from GNX1 data string and return next position
-        def get_values(self, n, unpacked):
-            n, nbytes = getnum(n, unpacked) # may be number of values
-            n, type = getnum(n, unpacked) # always zero
-            n, amp_select = getnum(n, unpacked)
-            n, amp_warp = getnum(n, unpacked)
-            n, cab_warp = getnum(n, unpacked)
-            n, warpD = getnum(n, unpacked)
-            
-            self.set_values(type = type, amp_select = amp_select, amp_warp = amp_warp, cab_warp = cab_warp, warpD = warpD)
-            
-            #print(f"WARP: Amp Select: {amp_select}, Amp Warp: {amp_warp}, Cab Warp: {cab_warp}, D: {warpD}")
-            return n
-        
-        # individual parameter change from GNX1
+                        self.ui_device.setWarpFactor(type = arg)
+                        if sendToGNX:   # not implemented - crashes GNX1!!!
+                            #self.warp_changed(self.parameter_names.index(k), arg)
+                            pass
+
+                    case "amp_select" | "amp_warp" | "cab_warp" | "warpD":
+                        self.ui_device.setWarpFactor(**{k: arg})
+                        if sendToGNX:
+                            self.warp_changed(self.parameter_names.index(k), arg)
 
-        def parameter_change(self, parameter, value):
-            # parameter is an index
-            name = self.parameter_names[parameter]
-            self.set_values(**{name: value})
-        
     class gnx1_amp(QObject):
 
         ampPotChanged = Signal(int, int, dict, str)     # section, parameter, pot, name
@@ -716,153 +459,30 @@ class GNX1(QObject):
         # from GNX1 and when sending amp to GNX1 (sendToGNX)
         def set_values(self, sendToGNX = False, **kwargs):
 
+            pots = {"gain": (self.ui_device.pot_gain, self.pot_gain_changed),
+                    "bass_freq": (self.ui_device.pot_bass_freq, self.pot_bass_freq_changed),
+                    "bass_level": (self.ui_device.pot_bass_level, self.pot_bass_level_changed),
+                    "mid_freq": (self.ui_device.pot_mid_freq, self.pot_mid_freq_changed),
+                    "mid_level": (self.ui_device.pot_mid_level, self.pot_mid_level_changed),
+                    "treble_freq": (self.ui_device.pot_treble_freq, self.pot_treble_freq_changed),
+                    "treble_level": (self.ui_device.pot_treble_level, self.pot_treble_level_changed),
+                    "level": (self.ui_device.pot_level, self.pot_level_changed)}
+
             for k, arg in kwargs.items():
 
                 if arg == None:
                     continue
 
-                match k:
-                    case "name":
-                        #print("Set amp style by name deprecated")
-                        pass    # deprecated
-
-                    case "type":
-                        if arg not in self.ui_device.AMP_STYLES.keys():
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Unrecognised amp type {arg}", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.setAmpStyle(arg)
-                            if sendToGNX:
-                                self.amp_style_changed(arg)
+                if k == "type":
+                    self.ui_device.setAmpStyle(arg)
+                    if sendToGNX:
+                        self.amp_style_changed(arg)
 
-                    case "gain":
-                        if arg < 0 or arg > 99:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Amp gain value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_gain.setValue(arg)
-                            if sendToGNX:
-                                self.pot_gain_changed(arg)
-                        
-                    case "bass_freq":
-                        if arg < 0 or arg > 250:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Amp bass frequency value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_bass_freq.setValue(arg)
-                            if sendToGNX:
-                                self.pot_bass_freq_changed(arg)
-
-                    case "bass_level":
-                        if arg < 0 or arg > 99:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Amp bass level value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_bass_level.setValue(arg)
-                            if sendToGNX:
-                                self.pot_bass_level_changed(arg)
-
-                    case "mid_freq":
-                        if arg < 0 or arg > 4700:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Amp mid frequency value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_mid_freq.setValue(arg)
-                            if sendToGNX:
-                                self.pot_mid_freq_changed(arg)
-
-                    case "mid_level":
-                        if arg < 0 or arg > 99:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Amp mid level value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_mid_level.setValue(arg)
-                            if sendToGNX:
-                                self.pot_mid_level_changed(arg)
-
-                    case "treble_freq":
-                        if arg < 0 or arg > 7500:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Amp treble frequency value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_treble_freq.setValue(arg)
-                            if sendToGNX:
-                                self.pot_treble_freq_changed(arg)
-
-                    case "treble_level":
-                        if arg < 0 or arg > 99:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Amp treble level value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_treble_level.setValue(arg)
-                            if sendToGNX:
-                                self.pot_treble_level_changed(arg)
-
-                    case "level":
-                        if arg < 0 or arg > 99:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Amp level value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_level.setValue(arg)
-                            if sendToGNX:
-                                self.pot_level_changed(arg)
-
-                    case "_":
-                        e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Unrecognised amp parameter ({arg})", buttons = QMessageBox.Ok)
-                        self.parent.gnxAlert.emit(e)
-
-        # extract values from GNX1 data string and return next position
-        def get_values(self, n, unpacked):
-            n, nbytes = getnum(n, unpacked) # may be number of values
-            n, type = getnum(n, unpacked)
-            n, gain = getnum(n, unpacked)
-            n, bass_freq = getnum(n, unpacked)
-            n, bass_level = getnum(n, unpacked)
-            n, mid_freq = getnum(n, unpacked)
-            n, mid_level = getnum(n, unpacked)
-            n, treble_freq = getnum(n, unpacked)
-            n, treble_level = getnum(n, unpacked)
-            n, level = getnum(n, unpacked)
-
-
-            self.set_values(type = type, gain = gain, bass_freq = bass_freq, bass_level = bass_level, mid_freq = mid_freq, mid_level = mid_level,
-                            treble_freq = treble_freq, treble_level = treble_level, level = level )
-            
-            #print("AMP: Type: {0}, Gain: {1}, Bass Freq: {2}, Bass level: {3}, Mid Freq: {4}, Mid Level: {5}, Treble Freq: {6}, Treble Level: {7}, Level: {8}".format(
-            #    type, gain, bass_freq, bass_level, mid_freq, mid_level, treble_freq, treble_level, level))
-            return n
-
-        # extract amp values from data string
-        # get values from code 2A response
-        def get_values2A(self, unpacked):
-            n = 7
-            name = ""
-            while unpacked[n] != 0:
-                name += chr(unpacked[n])
-                n += 1
-
-            n = 574 + len(name)   # hopefully this lines up
-
-            bass_freq = unpacked[n] * 256 + unpacked[n + 1]
-            n += 2
-            mid_freq = unpacked[n] * 256 + unpacked[n + 1]
-            n += 2
-            treble_freq = unpacked[n] * 256 + unpacked[n + 1]
-            n += 2
-
-            bass_level = unpacked[n]
-            n += 1
-            mid_level = unpacked[n]
-            n += 1
-            treble_level = unpacked[n]
-            n += 1
-            gain = unpacked[n]
-            n += 1
-            level = unpacked[n]
-            n += 1
-            # these are the default amp values - do not use, patch settings override
-            #self.set_values(name = name.lower(), gain = gain, level = level, bass_freq = bass_freq, bass_level = bass_level,
-            #                mid_freq = mid_freq, mid_level = mid_level, treble_freq = treble_freq, treble_level = treble_level)
+                elif k in pots:     # "name" is deprecated and ignored
+                    pot, changed = pots[k]
+                    pot.setValue(arg)
+                    if sendToGNX:
+                        changed(arg)
 
         # from ui_device
         def amp_style_changed(self, value):
@@ -902,13 +522,6 @@ class GNX1(QObject):
             #print(f"Pot Level {value}")
             self.parent.send_parameter_change(section = self.section, parameter = 0x08, value = value)
 
-        # individual parameter change from GNX1
-        parameter_names = ["type", "gain", "bass_freq", "bass_level", "mid_greq", "mid_level", "treble_freq", "treble_level", "level"]
-        def parameter_change(self, parameter, value):
-            # parameter is an index
-            name = self.parameter_names[parameter]
-            self.set_values(**{name: value})
-            
     class gnx1_cab:
 
         def __init__(self, parent, ui_device, section):
@@ -928,46 +541,14 @@ class GNX1(QObject):
 
                 match k:
                     case "type":
-                        if arg not in self.ui_device.CAB_STYLES.keys():
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Unrecognised cab type {arg}", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.setCabStyle(arg)
-                            if sendToGNX:
-                                self.cab_style_changed(arg)
+                        self.ui_device.setCabStyle(arg)
+                        if sendToGNX:
+                            self.cab_style_changed(arg)
 
                     case "tuning":
-                        if arg < 0 or arg > 48:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Cabinet tuning value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_tuning.setValue(arg)
-                            if sendToGNX:
-                                self.pot_tuning_changed(arg)
-
-
-        # extract values from GNX1 data string and return next position
-        def get_values(self, n, unpacked):
-            n, nbytes = getnum(n, unpacked) # may be number of values
-            n, type = getnum(n, unpacked)
-            n, tuning = getnum(n, unpacked)
-
-            self.set_values(type = type, tuning = tuning)
-            
-            #print("CAB: Type: {0}, Tuning: {1}".format(type, tuning))
-            return n
-
-        # get values from code 2A response
-        def get_values2A(self, unpacked):
-            n = 7
-            name = ""
-            while unpacked[n] != 0:
-                name += chr(unpacked[n])
-                n += 1
-
-            # cab tuning?
-
-            self.set_values(name = name)
+                        self.ui_device.pot_tuning.setValue(arg)
+                        if sendToGNX:
+                            self.pot_tuning_changed(arg)
 
         # from ui_device
         def cab_style_changed(self, value):
@@ -979,13 +560,6 @@ class GNX1(QObject):
             #print(f"Tuing {value}")
             self.parent.send_parameter_change(section = self.section, parameter = 0x01, value = value)
 
-        # individual parameter change from GNX1
-        parameter_names = ["type", "tuning"]
-        def parameter_change(self, parameter, value):
-            # parameter is an index
-            name = self.parameter_names[parameter]
-            self.set_values(**{name: value})
-
     class gnx1_gate(QObject):
 
         gatePotChanged = Signal(int, int, dict, str) # section, parameter, pot, name
@@ -1044,79 +618,23 @@ class GNX1(QObject):
 
         # from GNX1
         def set_values(self, **kwargs):
-                         
             for k, arg in kwargs.items():
                 match k:
                     case "on":
-                        if arg not in factory_onoff.keys():
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Gate on/off ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.setGate(on = arg)
+                        self.ui_device.setGate(on = arg)
 
                     case "type":
-                        if arg < 0 or arg > 1:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Gate Type value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.type = arg
-                            self.ui_device.setGate(type = arg)
+                        self.type = arg
+                        self.ui_device.setGate(type = arg)
 
                     case "param_1":
-                        if arg < 0 or arg > 40:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Gate Threshold value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_1.setValue(arg)
+                        self.ui_device.pot_1.setValue(arg)
 
                     case "param_2":
-                        if arg < 0 or arg > 9:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Gate Attack value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_2.setValue(arg)
+                        self.ui_device.pot_2.setValue(arg)
 
                     case "param_3":
-                        if arg < 0 or arg > 99:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Gate Sensitivity value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_3.setValue(arg)
-
-        # extract values from GNX1 data string and return next position
-        def get_values(self, n, unpacked):
-            n, nbytes = getnum(n, unpacked)     # may be number of values
-            n, type = getnum(n, unpacked)
-            n, on = getnum(n, unpacked)
-
-            self.type = type
-            match type:             # variable number of parameters depending on type
-                case 0: # silencer
-                    n, param_1 = getnum(n, unpacked)
-                    n, param_2 = getnum(n, unpacked)
-                    self.set_values(on = on, type = type, param_1 = param_1, param_2 = param_2)
-                    #print("GATE: {0}, Threshold {1}, Attack {2}".format(
-                    #    factory_onoff[on], param_1, param_1))
-
-                case 1: # pluck
-                    n, param_1 = getnum(n, unpacked)
-                    n, param_2 = getnum(n, unpacked)
-                    n, param_3 = getnum(n, unpacked)
-                    self.set_values(on = on, type = type, param_1 = param_1, param_2 = param_2, param_3 = param_3)
-                    #print("GATE: {0}, Threshold {1}, Attack {2}, Sensitivity {3}".format(
-                    #    factory_onoff[on], param_1, param_2, param_3))
-                    
-                case _:
-                    e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Unrecognised Gate type {type}", buttons = QMessageBox.Ok)
-                    self.parent.gnxAlert.emit(e)
-            return n
-        
-        # individual parameter change from GNX1
-        parameter_names = ["type", "on", "param_1", "param_2", "param_3"]
-        def parameter_change(self, parameter, value):
-            # parameter is an index
-            name = self.parameter_names[parameter]
-            self.set_values(**{name: value})
+                        self.ui_device.pot_3.setValue(arg)
 
     class gnx1_mod(QObject):
 
@@ -1187,117 +705,21 @@ class GNX1(QObject):
 
         # from GNX1
         def set_values(self, **kwargs):
-            maxlimits = {   # by type
-                0: {"param_1": 98, "param_2": 98, "param_3": 19, "param_4": 2, "param_5": 198, "param_6": 99},
-                1: {"param_1": 98, "param_2": 98, "param_3": 99, "param_4": 2, "param_5": 198, "param_6": 99},
-                2: {"param_1": 98, "param_2": 98, "param_3": 99, "param_4": 2, "param_5": 198, "param_6": 99},
-                3: {"param_1": 98, "param_2": 98, "param_3": 99, "param_4": 99},
-                4: {"param_1": 98, "param_2": 98, "param_3": 99, "param_4": 99},
-                5: {"param_1": 98, "param_2": 99, "param_3": 2},
-                6: {"param_1": 98, "param_2": 99, "param_3": 2},
-                7: {"param_1": 98, "param_2": 98, "param_3": 2},
-                8: {"param_1": 99, "param_2": 99, "param_3": 99, "param_4": 130, "param_5": 198, "param_6": 99},
-                9: {"param_1": 98, "param_2": 98, "param_3": 50, "param_4": 198, "param_5": 99},
-                10: {"param_1": 99, "param_2": 98, "param_3": 50, "param_4": 198, "param_5": 99},
-                11: {"param_1": 99, "param_2": 100, "param_3": 99, "param_4": 198, "param_5": 99},
-                12: {"param_1": 98, "param_2": 98, "param_3": 198, "param_4": 99},
-                13: {"param_1": 48, "param_2": 198, "param_3": 99},
-                14: {"param_1": 36, "param_2": 198, "param_3": 99},
-            }
-                         
             for k, arg in kwargs.items():
+
                 if arg == None:
                     continue
+
                 match k:
                     case "on":
-                        if arg not in factory_onoff.keys():
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Mod on/off ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.setMod(on = arg)
+                        self.ui_device.setMod(on = arg)
 
                     case "type":
-                        if arg < 0 or arg > 14:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Mod Type value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.type = arg
-                            self.ui_device.setMod(type = arg)
+                        self.type = arg
+                        self.ui_device.setMod(type = arg)
 
-                    case "param_1":
-                        if arg < 0 or arg > maxlimits[self.type]["param_1"]:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Mod Param 1 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_1.setValue(arg)
-
-                    case "param_2":
-                        if arg < 0 or arg > maxlimits[self.type]["param_2"]:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Mod Param 2 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_2.setValue(arg)
-
-                    case "param_3":
-                        if arg < 0 or arg > maxlimits[self.type]["param_3"]:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Mod Param 3 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_3.setValue(arg)
-
-                    case "param_4":
-                        if arg < 0 or arg > maxlimits[self.type]["param_4"]:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Mod Param 4 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_4.setValue(arg)
-
-                    case "param_5":
-                        if arg < 0 or arg > maxlimits[self.type]["param_5"]:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Mod Param 5 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_5.setValue(arg)
-
-                    case "param_6":
-                        if arg < 0 or arg > maxlimits[self.type]["param_6"]:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Mod Param 6 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_6.setValue(arg)
-
-        # extract values from GNX1 data string and return next position
-        def get_values(self, n, unpacked):
-            n, nbytes = getnum(n, unpacked)     # may be number of values
-            n, type = getnum(n, unpacked)
-            n, on = getnum(n, unpacked)
-
-            param_1 = param_2 = param_3 = param_4 = param_5 = param_6 = None
-
-            self.type = type
-            nparams = [6, 6, 6, 4, 4, 3, 3, 3, 6, 5, 5, 5, 4, 3, 3]
-            n, param_1 = getnum(n, unpacked)
-            n, param_2 = getnum(n, unpacked)
-            n, param_3 = getnum(n, unpacked)
-            if nparams[self.type] > 3:
-                n, param_4 = getnum(n, unpacked)
-            if nparams[self.type] > 4:
-                n, param_5 = getnum(n, unpacked)
-            if nparams[self.type] > 5:
-                n, param_6 = getnum(n, unpacked)
-                
-            self.set_values(on = on, type = type, param_1 = param_1, param_2 = param_2, param_3 = param_3, param4 = param_4, param_5 = param_5, param_6 = param_6)
-            #print("MOD: {0}, Param 1 {1}, Param 2 {2}, Param 3 {3}, Param 4 {4}, Param 5 {5}, Param 6 {6}".format(
-            #            factory_onoff[on], param_1, param_2, param_3, param_4, param_5, param_6))
-               
-            return n
-        
-        # individual parameter change from GNX1
-        parameter_names = ["type", "on", "param_1", "param_2", "param_3", "param_4,", "param_5", "param_6"]
-        def parameter_change(self, parameter, value):
-            # parameter is an index
-            name = self.parameter_names[parameter]
-            self.set_values(**{name: value})
+                    case "param_1" | "param_2" | "param_3" | "param_4" | "param_5" | "param_6":
+                        getattr(self.ui_device, "pot_" + k[-1]).setValue(arg)
 
     class gnx1_delay(QObject):
 
@@ -1350,96 +772,21 @@ class GNX1(QObject):
 
         # from GNX1
         def set_values(self, **kwargs):
-                         
             for k, arg in kwargs.items():
+
                 if arg == None:
                     continue
+
                 match k:
                     case "on":
-                        if arg not in factory_onoff.keys():
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Delay on/off ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.setDelay(on = arg)
+                        self.ui_device.setDelay(on = arg)
 
                     case "type":
-                        if arg < 0 or arg > 3:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Delay Type value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.type = arg
-                            self.ui_device.setDelay(type = arg)
-
-                    case "param_1":
-                        if arg < 0 or arg > 2000:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Delay Param 1 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_1.setValue(arg)
+                        self.type = arg
+                        self.ui_device.setDelay(type = arg)
 
-                    case "param_2":
-                        if arg < 0 or arg > 100:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Delay Param 2 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_2.setValue(arg)
-
-                    case "param_3":
-                        if arg < 0 or arg > 99:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Delay Param 3 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_3.setValue(arg)
-
-                    case "param_4":
-                        if arg < 0 or arg > 99:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Delay Param 4 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_4.setValue(arg)
-
-                    case "param_5":
-                        if arg < 0 or arg > 198:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Delay Param 5 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_5.setValue(arg)
-
-                    case "param_6":
-                        if arg < 0 or arg > 99:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Delay Param 6 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_6.setValue(arg)
-
-        # extract values from GNX1 data string and return next position
-        def get_values(self, n, unpacked):
-            n, nbytes = getnum(n, unpacked)     # may be number of values
-            n, type = getnum(n, unpacked)
-            n, on = getnum(n, unpacked)
-
-            param_1 = param_2 = param_3 = param_4 = param_5 = param_6 = None
-
-            self.type = type
-            n, param_1 = getnum(n, unpacked)
-            n, param_2 = getnum(n, unpacked)
-            n, param_3 = getnum(n, unpacked)
-            n, param_4 = getnum(n, unpacked)
-            n, param_5 = getnum(n, unpacked)
-            n, param_6 = getnum(n, unpacked)
-                
-            self.set_values(on = on, type = type, param_1 = param_1, param_2 = param_2, param_3 = param_3, param4 = param_4, param_5 = param_5, param_6 = param_6)
-            #print("DELAY: {0}, Param 1 {1}, Param 2 {2}, Param 3 {3}, Param 4 {4}, Param 5 {5}, Param 6 {6}".format(
-            #            factory_onoff[on], param_1, param_2, param_3, param_4, param_5, param_6))
-               
-            return n
-        
-        # individual parameter change from GNX1
-        parameter_names = ["type", "on", "param_1", "param_2", "param_3", "param_4,", "param_5", "param_6"]
-        def parameter_change(self, parameter, value):
-            # parameter is an index
-            name = self.parameter_names[parameter]
-            self.set_values(**{name: value})
+                    case "param_1" | "param_2" | "param_3" | "param_4" | "param_5" | "param_6":
+                        getattr(self.ui_device, "pot_" + k[-1]).setValue(arg)
 
     class gnx1_reverb(QObject):
 
@@ -1488,89 +835,22 @@ class GNX1(QObject):
 
         # from GNX1
         def set_values(self, **kwargs):
-                         
             for k, arg in kwargs.items():
+
                 if arg == None:
                     continue
+
                 match k:
                     case "on":
-                        if arg not in factory_onoff.keys():
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Reverb on/off ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.setReverb(on = arg)
+                        self.ui_device.setReverb(on = arg)
 
                     case "type":
-                        if arg < 0 or arg > 9:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Reverb Type value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.type = arg
-                            self.ui_device.setReverb(type = arg)
-
-                    case "param_1":
-                        if arg < 0 or arg > 15:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Reverb Param 1 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_1.setValue(arg)
-
-                    case "param_2":
-                        if arg < 0 or arg > 98:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Reverb Param 2 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_2.setValue(arg)
+                        self.type = arg
+                        self.ui_device.setReverb(type = arg)
 
-                    case "param_3":
-                        if arg < 0 or arg > 99:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Reverb Param 3 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_3.setValue(arg)
+                    case "param_1" | "param_2" | "param_3" | "param_4" | "param_5":
+                        getattr(self.ui_device, "pot_" + k[-1]).setValue(arg)
 
-                    case "param_4":
-                        if arg < 0 or arg > 198:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Reverb Param 4 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_4.setValue(arg)
-
-                    case "param_5":
-                        if arg < 0 or arg > 99:
-                            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in Reverb Param 5 value ({arg})", buttons = QMessageBox.Ok)
-                            self.parent.gnxAlert.emit(e)
-                        else:
-                            self.ui_device.pot_5.setValue(arg)
-
-        # extract values from GNX1 data string and return next position
-        def get_values(self, n, unpacked):
-            n, nbytes = getnum(n, unpacked)     # may be number of values
-            n, type = getnum(n, unpacked)
-            n, on = getnum(n, unpacked)
-
-            param_1 = param_2 = param_3 = param_4 = param_5 = None
-
-            self.type = type
-            n, param_1 = getnum(n, unpacked)
-            n, param_2 = getnum(n, unpacked)
-            n, param_3 = getnum(n, unpacked)
-            n, param_4 = getnum(n, unpacked)
-            n, param_5 = getnum(n, unpacked)
-                
-            self.set_values(on = on, type = type, param_1 = param_1, param_2 = param_2, param_3 = param_3, param4 = param_4, param_5 = param_5)
-            #print("DELAY: {0}, Param 1 {1}, Param 2 {2}, Param 3 {3}, Param 4 {4}, Param 5 {5}".format(
-            #            factory_onoff[on], param_1, param_2, param_3, param_4, param_5))
-               
-            return n
-        
-        # individual parameter change from GNX1
-        parameter_names = ["type", "on", "param_1", "param_2", "param_3", "param_4,", "param_5"]
-        def parameter_change(self, parameter, value):
-            # parameter is an index
-            name = self.parameter_names[parameter]
-            self.set_values(**{name: value})
-        
     class gnx1_expression(QObject):
 
         def __init__(self, parent, ui_device):
@@ -1579,10 +859,10 @@ class GNX1(QObject):
             self.parent = parent
             self.ui_device = ui_device
         
-            self.ui_device.expChanged.connect(self.parent.sendcode26message)
+            self.ui_device.expChanged.connect(self.parent.queue_code26message)
             for x in range(0, 3):
                 for m in ["min", "max"]:
-                    self.ui_device.pots[x][m].valueChanged.connect(self.parent.sendcode26message)
+                    self.ui_device.pots[x][m].valueChanged.connect(self.parent.queue_code26message)
                     pass
 
         # from GNX1
@@ -1610,25 +890,15 @@ class GNX1(QObject):
                             self.ui_device.setParameters(x, arg[x])
                             pass
 
-        # extract values from GNX1 data string and return next position
-        def get_values(self, n, unpacked):
+        # to the model, as the face shows it
+        def store(self):
             assignment = []
             params = []
-            for i in range(0, 3):
-                assignment.append({"section": unpacked[n], "parameter": unpacked[n + 1]})
-                n += 2
-                n, nmax = getnum(n, unpacked)
-                n, nmin = getnum(n, unpacked)
-                params.append({"min": nmin, "max": nmax})
-
-            self.set_values(assignment = assignment, params = params)
-            # one of these print statements allows dial signal blocking to work!
-            # otherwise setting pot value triggers code 26 message to be sent
-            #print(f"EXPR1: Assignment {assignment[0]}, Min {params[0]['min']}, Max {params[0]['max']}")
-            #print(f"EXPR2: Assignment {assignment[1]}, Min {params[1]['min']}, Max {params[1]['max']}")
-            #print(f"EXPR3: Assignment {assignment[2]}, Min {params[2]['min']}, Max {params[2]['max']}")
-
-            return n
+            for x in range(0, 3):
+                a = factory_expression_assignments[self.ui_device._types[x]]
+                assignment.append({"section": a["section"], "parameter": a["parameter"]})
+                params.append({"min": self.ui_device.pots[x]["min"].value(), "max": self.ui_device.pots[x]["max"].value()})
+            self.parent.model.patch.store_expression(assignment, params)
 
     class gnx1_lfo(QObject):
 
@@ -1641,10 +911,10 @@ class GNX1(QObject):
             self.ui_device = ui_device
 
             self.ui_device.lfoPotChanged.connect(self.sendExpPots)
-            self.ui_device.lfoChanged.connect(self.parent.sendcode26message)
+            self.ui_device.lfoChanged.connect(self.parent.queue_code26message)
             for x in range(0, 2):
                 for m in ["min", "max", "speed","waveform"]:
-                    self.ui_device.pots[x][m].valueChanged.connect(self.parent.sendcode26message)
+                    self.ui_device.pots[x][m].valueChanged.connect(self.parent.queue_code26message)
                     pass
 
         def sendExpPots(self, parameter, pot):  # for expression from ui_device
@@ -1655,13 +925,10 @@ class GNX1(QObject):
         def set_values(self, lfos):
             a = {}
             for index, lfo in lfos.items():
-                if lfo["speed"] < 0 or lfo["speed"] > 185:
-                    e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in LFO Speed ({lfo["speed"]})", buttons = QMessageBox.Ok)
-                    self.parent.gnxAlert.emit(e)
-
-                if lfo["waveform"] < 0 or lfo["waveform"] > 2:
-                    e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in LFO Waveform ({lfo["waveform"]})", buttons = QMessageBox.Ok)
-                    self.parent.gnxAlert.emit(e)
+                for p in LFO:
+                    if not p.valid(lfo[p.name]):
+                        e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Error in LFO {p.name.title()} ({lfo[p.name]})", buttons = QMessageBox.Ok)
+                        self.parent.gnxAlert.emit(e)
 
                 a[index] = get_expression_assignment_index(lfo["section"], lfo["parameter"] if lfo["section"] != 0xFF else 0xFF) # make parameter 0xFF id section is 0xFF
                 if a[index] == None:
@@ -1672,26 +939,16 @@ class GNX1(QObject):
                 lfos[index]["assignment"] = a[index]
 
             self.ui_device.setParameters(lfos)
-                
-        # decode code 26 values from GNX1
-        def get_values(self, n, unpacked):
-            n = skip_bytes(n, unpacked, [0x8A, 0x02])
-            n, lfo1  = self.get_lfo(n, unpacked, 0)
-            n = skip_bytes(n, unpacked, [0x8B, 0x02])
-            n, lfo2 = self.get_lfo(n, unpacked, 1)
-            self.set_values({0: lfo1, 1: lfo2})
-            return n
-
-        def get_lfo(self, n, unpacked, index):
-            n, speed = getnum(n, unpacked)
-            n, waveform = getnum(n, unpacked)
-            n = skip_bytes(n, unpacked, [0x01]) # might be another parameter
-            section = unpacked[n]
-            parameter = unpacked[n + 1]
-            n += 2
-            n, max = getnum(n, unpacked)
-            n, min = getnum(n, unpacked)
-            return n, {"speed": speed, "waveform": waveform, "section": section, "parameter": parameter, "max": max, "min": min}
+
+        # to the model, as the face shows it
+        def store(self):
+            lfos = {}
+            for x in range(0, 2):
+                a = factory_expression_assignments[self.ui_device._types[x]]
+                lfos[x] = {"speed": self.ui_device.pots[x]["speed"].value(), "waveform": self.ui_device.pots[x]["waveform"].value(),
+                           "section": a["section"], "parameter": a["parameter"],
+                           "max": self.ui_device.pots[x]["max"].value(), "min": self.ui_device.pots[x]["min"].value()}
+            self.parent.model.patch.store_lfo(lfos)
 
     # return UI
     def getUI(self):
@@ -1728,10 +985,47 @@ class GNX1(QObject):
         if self.ui == None:
             e = GNXError(icon = QMessageBox.Critical, title = "System Error", text = "No window specified for GNX1", buttons = QMessageBox.Ok)
             self.gnxAlert.emit(e)    
+        self.midi_channel = common.GNXEDIT_CONFIG["midi"]["channel"]
+        self.model = DeviceModel(self.midi_channel)
+        self.dispatch = MIDIDispatcher()
+        self.dispatch.bind(self)
+
+        # sync and upload requests, retried and timed out by the session timer
+        self.session = Correlator(lambda msg: self.midicontrol.send_message(msg, common.SEND_PRIORITY_STATE),
+                                  timeout = common.GNXEDIT_CONFIG["midi"].get("request_timeout_ms", 1000) / 1000,
+                                  retries = common.GNXEDIT_CONFIG["midi"].get("request_retries", 2))
+        self.uploader = Uploader(self.session, self.midi_channel)
+        self.scheduler = Scheduler()
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(self.poll_ms)
+        self.poll_timer.timeout.connect(self.poll)
+
+        # keep-alive every midi_watchdog_time, resync when the device has been silent for midi_watchdog_bite_count_limit of them
+        self.midi_watchdog_time = common.GNXEDIT_CONFIG["midi"].get("watchdog_interval_ms", self.midi_watchdog_time * 1000) / 1000
+        self.midi_watchdog_bite_count_limit = common.GNXEDIT_CONFIG["midi"].get("watchdog_limit", self.midi_watchdog_bite_count_limit)
+        self.midi_watchdog_backoff_max = common.GNXEDIT_CONFIG["midi"].get("watchdog_backoff_max_ms", self.midi_watchdog_backoff_max * 1000) / 1000
+        self.midi_watchdog = Watchdog(self.scheduler, self.midi_watchdog_time, self.midi_watchdog_bite_count_limit,
+                                      beat = self.midi_watchdog_beat, bite = self.midi_watchdog_bite, backoff_max = self.midi_watchdog_backoff_max)
+        self.pipelined_sync = common.GNXEDIT_CONFIG["midi"].get("pipelined_sync", self.pipelined_sync)
+        self.incremental_sync = common.GNXEDIT_CONFIG["midi"].get("incremental_sync", self.incremental_sync)
+        self.startup_cache = common.GNXEDIT_CONFIG["midi"].get("startup_cache", self.startup_cache)
+        self.delta_upload = common.GNXEDIT_CONFIG["midi"].get("delta_upload", self.delta_upload)
+        self.snapshot = DeviceSnapshot.load() if self.incremental_sync or self.startup_cache else None
         self.midicontrol.register_input_target(self.dispatcher)
+        self.round_trips = stats.RoundTrips()       # request to response latency per opcode pair
+        self.midicontrol.register_output_target(self.round_trips.sent)
         self.midicontrol.register_ports_open(self.ports_open)
         self.midicontrol.register_ports_closed(self.ports_closed)
 
+        self.encoder = sysex.Encoder()
+
+        # dial drags are coalesced to the latest value per parameter and sent at parameter_flush_rate
+        self.parameter_coalescer = MIDICoalescer(self.send_coalesced)
+        self.parameter_flush_rate = common.GNXEDIT_CONFIG["midi"].get("parameter_flush_rate", self.parameter_flush_rate)
+        self.parameter_flush_timer = QTimer(self)
+        self.parameter_flush_timer.setInterval(max(1, int(1000 / self.parameter_flush_rate)))
+        self.parameter_flush_timer.timeout.connect(self.flush_parameter_changes)
+
         self.device_pickup = self.gnx1_pickup(self, self.ui.pickupFace)
         self.device_wah = self.gnx1_wah(self, self.ui.wahFace)
         self.device_compressor = self.gnx1_compressor(self, self.ui.compressorFace)
@@ -1748,6 +1042,19 @@ class GNX1(QObject):
         self.device_expression = self.gnx1_expression(self, self.ui.expFace)
         self.device_lfo= self.gnx1_lfo(self, self.ui.lfoFace)
 
+        # the faces show the model, decoded frames reach them through it
+        views = {0x01: self.device_pickup, 0x02: self.device_wah, 0x03: self.device_compressor, 0x04: self.device_whammy, 0x05: self.device_warp,
+                 0x06: self.device_green_amp, 0x07: self.device_green_cab, 0x08: self.device_red_amp, 0x09: self.device_red_cab,
+                 0x0A: self.device_gate, 0x0B: self.device_mod, 0x0C: self.device_delay, 0x0D: self.device_reverb}
+        for section, view in views.items():
+            name = SECTIONS[section].name
+            self.model.patch.subscribe(name, lambda values, view = view, name = name: view.set_values(**self.checked(name, values)))
+        self.model.patch.subscribe("expression", lambda values: self.device_expression.set_values(**values))
+        self.model.patch.subscribe("lfo", self.device_lfo.set_values)
+        self.model.subscribe("amp_names", self.show_amp_names)
+        self.model.subscribe("cab_names", self.show_cab_names)
+        self.model.subscribe("patch_names", self.gnxPatchNamesUpdated.emit)
+
         # link up expression pots
         self.device_compressor.compressorPotChanged.connect(self.device_expression.ui_device.devicePotChanged)
         self.device_compressor.compressorPotChanged.connect(self.device_lfo.ui_device.devicePotChanged)
@@ -1788,10 +1095,32 @@ class GNX1(QObject):
 
         self.patchNameChanged.connect(self.updatePatchName) # update name in list
 
+        # guarantee the final value of a drag is sent as soon as the mouse is released
+        for dial in self.ui.findChildren(StyleDial):
+            dial.sliderReleased.connect(self.flush_parameter_changes)
+
     @Slot()
     def updatePatchName(self, name, bank, patch):
         if bank == 1:        #user
-            self.user_patch_names[patch] = name
+            self.model.rename_patch(bank, patch, name)
+
+    # values for a face, out of range ones (by the schema, for the patch's type) alerted and left out
+    def checked(self, name, values):
+        valid, errors = BY_NAME[name].validate(values, self.model.patch.value(name, "type"))
+        for error in errors:
+            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = error, buttons = QMessageBox.Ok)
+            self.gnxAlert.emit(e)
+        return valid
+
+    def show_amp_names(self, names):
+        for idx, name in names.items():
+            self.device_green_amp.ui_device.set_user_name(idx, name)
+            self.device_red_amp.ui_device.set_user_name(idx, name)
+
+    def show_cab_names(self, names):
+        for idx, name in names.items():
+            self.device_green_cab.ui_device.set_user_name(idx, name)
+            self.device_red_cab.ui_device.set_user_name(idx, name)
 
     def setCommsPhase(self, newphase):
         changed = self.commsPhase != newphase
@@ -1810,48 +1139,139 @@ class GNX1(QObject):
             self.commsModeChanged.emit(oldmode, newmode)
             self.setCommsPhase(phase)
 
+    # reconnect, incremental when the snapshot allows
     def midi_resync(self):
         self.setDeviceConnected(False)
-        if self.commsMode == common.COMMS_MODE_SYNC:
+        if self.incremental_sync and self.snapshot != None and self.snapshot.usable():
+            self.start_sync(common.SYNC_INCREMENTAL)
+        else:
+            self.start_sync(common.SYNC_FULL)
+
+    # everything fetched again from the device (Resync menu)
+    def full_resync(self):
+        self.setDeviceConnected(False)
+        self.start_sync(common.SYNC_FULL)
+
+    def start_sync(self, scope = common.SYNC_PATCH):
+        self.discard_parameter_changes()    # the model is about to be read back from the device
+        self.delta_sent = None
+        self.stop_comms_task()
+        self.setCommsMode(common.COMMS_MODE_SYNC, phase = 5 if scope == common.SYNC_PATCH else 0)
+        self.comms_task_started = time.perf_counter()
+        self.comms_task = Task(self.sync_steps(scope), "sync")
+        self.comms_task.future.add_done_callback(self.comms_task_done)
+
+    def start_upload(self):
+        self.discard_parameter_changes()
+        self.stop_comms_task()
+        self.setCommsMode(common.COMMS_MODE_UPLOADING)
+        self.comms_task = Task(self.upload_steps(), "upload")
+        self.comms_task.future.add_done_callback(self.comms_task_done)
+
+    def stop_comms_task(self):
+        if self.comms_task != None:
+            self.comms_task.cancel()
+            self.comms_task = None
+        self.session.cancel_all()
+        if self.commsMode != common.COMMS_MODE_NONE:
             self.setCommsMode(common.COMMS_MODE_NONE)
-        self.setCommsMode(common.COMMS_MODE_SYNC)
-        self.sync_control()
+
+    def comms_task_done(self, future):
+        if isinstance(future.exception, (RequestTimeout, RequestRejected)) and self.commsMode == common.COMMS_MODE_UPLOADING:
+            self.setCommsMode(common.COMMS_MODE_NONE)
+            e = GNXError(icon = QMessageBox.Warning, title = "Upload Error", text = f"Patch upload failed.\n{future.exception}", \
+                    buttons = QMessageBox.Ok)
+            self.gnxAlert.emit(e)
+            self.midi_resync()
+        # a sync that timed out or was rejected stays in sync mode, the watchdog will bite and resync
+        elif future.exception != None and not isinstance(future.exception, (RequestTimeout, RequestRejected, RequestCancelled)):
+            self.setCommsMode(common.COMMS_MODE_NONE)
+            e = GNXError(icon = QMessageBox.Warning, title = "GNX Communication Error", text = f"{future.exception}", \
+                    buttons = QMessageBox.Ok)
+            self.gnxAlert.emit(e)
+
+    def setStateStale(self, stale):
+        self.patch_from_cache = stale
+        self.deviceStateStale.emit(stale)
 
     def setDeviceConnected(self, connected):
         self.device_connected = connected
         self.deviceConnectedChanged.emit(connected)
 
+    # latency and decoder histograms as saved by the MIDI menu
+    def save_timing_stats(self, file):
+        stats.dump_json(file, self.round_trips.latency, self.dispatch.timings,
+                        {"unanswered": dict(self.round_trips.unanswered), "watchdog": self.midi_watchdog.stats(), "upload": self.uploader.stats.to_dict(),
+                         "database": librarydb.timings.to_dict(),
+                         "transport": common.GNXEDIT_CONFIG["midi"].get("transport"), "port": common.GNXEDIT_CONFIG["midi"]["output"]["name"]})
+
+    def reset_timing_stats(self):
+        self.round_trips.reset()
+        self.dispatch.timings.reset()
+        self.uploader.stats.reset()
+        librarydb.timings.reset()
+
+    # the watchdog and keep-alives keep going whatever a failed request's task does
+    def poll(self):
+        try:
+            self.session.poll()
+        finally:
+            self.scheduler.poll()
+
+    def midi_watchdog_beat(self):
+        self.watchDogBite.emit(False)
+        return self.send_keep_alive()
+
     def midi_watchdog_bite(self):
-        if self.midi_watchdog_bite_count > self.midi_watchdog_bite_count_limit:
-            #print("WATCHDOG HAS BITTEN")
-            self.midi_resync()
-            self.midi_watchdog_bite_count = 0
-            self.midi_watchdog.reset()
-            self.watchDogBite.emit(True)
-        else:
-            #print(self.midi_watchdog_bite_count, self.device_connected)
-            self.midi_watchdog_bite_count += 1
-            self.midi_watchdog.reset()
-            self.send_keep_alive()
-            self.watchDogBite.emit(False)
+        #print("WATCHDOG HAS BITTEN")
+        if common.GNXEDIT_CONFIG.get("logging", {}).get("watchdog_stats", False):
+            print(self.midi_watchdog.report())
+        self.midi_resync()
+        self.watchDogBite.emit(True)
 
     def send_parameter_change(self, section = None, parameter = None, value = None):
         if section == None or parameter == None or value == None:
             return
 
-        command = [0x2C]    # command prefix for parameter change
+        self.model.patch.store(section, parameter, value)
+        self.parameter_coalescer.update((section, parameter), value)
+        if not self.parameter_flush_timer.isActive():
+            self.parameter_flush_timer.start()
 
-        v = compile_number(value)
-        
-        data = pack_data([0x02, 0x00] + [section, parameter] + v)
-        msg = build_sysex(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, command + data)
-        #print("Sending Message:", msg)
-        self.midicontrol.send_message(msg)
-        dieTime= QTime.currentTime().addMSecs(50)
-        while QTime.currentTime() < dieTime:
-            QCoreApplication.processEvents(QEventLoop.AllEvents, 100)
+    # expression and LFO pots send the whole 0x26 block, built when flushed
+    def queue_code26message(self, *args):
+        self.device_expression.store()
+        self.device_lfo.store()
+        self.parameter_coalescer.update(0x26, None)
+        if not self.parameter_flush_timer.isActive():
+            self.parameter_flush_timer.start()
 
-        pass
+    @Slot()
+    def flush_parameter_changes(self):
+        self.parameter_coalescer.flush()
+        if not self.parameter_coalescer.has_pending():
+            self.parameter_flush_timer.stop()
+
+    # edits not yet sent are dropped when the edit buffer is about to be replaced, they would land on the new patch
+    def discard_parameter_changes(self):
+        self.parameter_coalescer.discard()
+        self.parameter_flush_timer.stop()
+
+    def send_coalesced(self, key, value):
+        if key == 0x26:
+            self.sendcode26message()
+        else:
+            section, parameter = key
+            self.send_parameter_change_now(section, parameter, value)
+
+    def send_parameter_change_now(self, section, parameter, value):
+        # code 0x2C parameter change, assembled in the reusable encoder buffer
+        self.encoder.begin(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, 0x2C)
+        self.encoder.write([0x02, 0x00, section, parameter])
+        self.encoder.write(compile_number(value))
+        msg = self.encoder.end()
+        #print("Sending Message:", msg)
+        return self.midicontrol.send_message(msg, common.SEND_PRIORITY_STATE)
 
     def setPatchName(self, name):
         if name != None:
@@ -1865,298 +1285,142 @@ class GNX1(QObject):
     def set_midi_channel(self, channel):
         common.GNXEDIT_CONFIG["midi"]["channel"] = channel
         settings.save_settings()
+        self.midi_channel = common.GNXEDIT_CONFIG["midi"]["channel"]    # save_settings may apply the lock
+        self.model.channel = self.midi_channel
+        self.uploader.channel = self.midi_channel
         self.midiChannelChanged.emit(channel + 1)
         #(f"GNX1 MIDI Channel: {channel:02X}")
 
     def ports_open(self):
+        self.midi_channel = common.GNXEDIT_CONFIG["midi"]["channel"]    # lock may have changed in the MIDI dialog
+        self.model.channel = self.midi_channel
+        self.uploader.channel = self.midi_channel
+        self.poll_timer.start()
         self.midi_resync()
-        self.midi_watchdog = self.watchdog(timeout = self.midi_watchdog_time, userHandler = self.midi_watchdog_bite)
         self.midi_watchdog.start()
 
     def ports_closed(self):
-        if self.midi_watchdog != None:
-            self.midi_watchdog.stop()
+        self.discard_parameter_changes()
+        self.stop_comms_task()
+        self.poll_timer.stop()
+        if self.midi_watchdog.running() and common.GNXEDIT_CONFIG.get("logging", {}).get("watchdog_stats", False):
+            print(self.midi_watchdog.report())
+        self.midi_watchdog.stop()
         self.setDeviceConnected(False)
         self.setCommsMode(common.COMMS_MODE_NONE)
 
     # syncing: 
-    # enquire_device -> 7E -> request_status (0x05) -> decode06 -> request_patch_names(0x12, 0) -> decode13 -> request_patch_names(0x12, 1) -> decode13 -> 
-    # request_ampcab_names(0x07) -> decode08 -> request_current_patch_name(0x20) -> decode 0x21-> acknowledge_patch_name(0x7E) -> patch data follows
+    # enquire_device -> 0x02 -> request_status (0x05) -> decode06 -> request_ampcab_names(0x07) -> decode08 -> request_patch_names(0x12, 0) -> decode13 -> 
+    # request_patch_names(0x12, 1) -> decode13 -> request_current_patch_name(0x20) -> decode 0x21-> acknowledge_patch_name(0x7E) -> patch data follows
+    # each request returns a future from self.session, resolved with the response frame
 
     # send code 0x01 device enquiry broadcast to all devices on all channels
     def enquire_device(self):
         #print("Enquiring")
-        self.midicontrol.send_message([0xF0, 0x00, 0x00, 0x10, 0x7E, 0x7F, 0x01, 0x00, 0x01, 0x00, 0x00, 0x11, 0xF7])
+        return self.session.request([0xF0, 0x00, 0x00, 0x10, 0x7E, 0x7F, 0x01, 0x00, 0x01, 0x00, 0x00, 0x11, 0xF7], 0x02, label = "enquiry 01")
 
     # send code 0x05 request
-    def request_status(self):
-        msg = build_sysex(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, [0x05, 0x00, 0x01])
-        self.midicontrol.send_message(msg)
+    def request_status(self, retries = None):
+        msg = sysex.encode(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, 0x05, [0x01])
+        return self.session.request(msg, 0x06, retries = retries, label = "status 05")
 
     # send code 0x12 request
-    def request_patch_names(self, bank):        # 0: factory, 1: user
+    def request_patch_names(self, bank, retries = None):        # 0: factory, 1: user
         self.requested_patch_bank = bank
-        msg = build_sysex(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, [0x12, 0x00, 0x01, bank, 0x00])
-        self.midicontrol.send_message(msg)
+        msg = sysex.encode(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, 0x12, [0x01, bank, 0x00])
+        return self.session.request(msg, 0x13, retries = retries, label = f"patch names 12 bank {bank}", context = bank)
 
     # send code 0x07 request
-    def request_ampcab_names(self, subcode):
-        msg = build_sysex(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, [0x07, 0x00, 0x01, subcode])
-        self.midicontrol.send_message(msg)
+    def request_ampcab_names(self, subcode, retries = None):
+        msg = sysex.encode(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, 0x07, [0x01, subcode])
+        return self.session.request(msg, 0x08, retries = retries, label = "amp/cab names 07")
 
     # send code 0x20 request
-    def request_current_patch_name(self):
-        msg = build_sysex(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, [0x20, 0x00, 0x01, 0x02, 0x00, 0x1F])
-        self.midicontrol.send_message(msg)
+    def request_current_patch_name(self, retries = None):
+        msg = sysex.encode(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, 0x20, [0x01, 0x02, 0x00, 0x1F])
+        return self.session.request(msg, 0x21, retries = retries, label = "patch name 20")
 
     def send_keep_alive(self):
         if self.commsMode == common.COMMS_MODE_NONE:
-            msg = build_sysex(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, [0x76, 0x20, 0x01, 0x7F])
-            self.midicontrol.send_message(msg)
+            msg = sysex.encode(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, 0x76, [0x01, 0xFF])
+            self.midicontrol.send_message(msg, common.SEND_PRIORITY_KEEP_ALIVE)
+            return True
+        return False
 
+    # the acknowledgement starts the dump, the future resolves with its first block 0x24
     def acknowledge_current_patch_name(self):
-        msg = build_sysex(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, [0x7E, 0x00, 0x01, 0x21])
-        self.midicontrol.send_message(msg)
+        msg = sysex.encode(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, 0x7E, [0x01, 0x21])
+        return self.session.request(msg, 0x24, label = "patch dump 24")
 
     def send_patch_change(self, bank, patch):
         if self.device_connected:
+            self.discard_parameter_changes()
             self.current_patch_bank = bank
             self.current_patch_number = patch
-            msg = build_sysex(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, [0x2D, 0x00, 0x01, bank, patch, 0x00])
+            msg = sysex.encode(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, 0x2D, [0x01, bank, patch, 0x00])
             self.midicontrol.send_message(msg)
 
     # save patch with patch name
     def save_patch(self, name, sourcebank, sourcepatch, targetbank, targetpatch):
+        self.flush_parameter_changes()      # the edits are part of what is saved, queued ahead of the 0x2E
         self.setPatchName(name)
         data = [0x01, sourcebank, sourcepatch, targetbank, targetpatch] + [ord(c) for c in name] + [0x00, 0xFF]
-        packed = pack_data(data)
-        msg = build_sysex(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, [0x2E] + packed)
+        msg = sysex.encode(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, 0x2E, data)
         #print("Sending Message:", msg)
         self.midicontrol.send_message(msg)
 
     # save amp/cab with patch name
     def save_ampcab(self, name, targetpatch):
+        self.flush_parameter_changes()
         #self.setPatchName(name)
 
         data = [0x01, 0x02, 0x00, 0x03, targetpatch] + [ord(c) for c in name] + [0x00, 0x00]
-        packed = pack_data(data)
-        msg = build_sysex(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, [0x2E] + packed)
+        msg = sysex.encode(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, 0x2E, data)
         self.midicontrol.send_message(msg)
 
         data = [0x01, 0x02, 0x00, 0x04, targetpatch] + [ord(c) for c in name] + [0x00, 0x00]
-        packed = pack_data(data)
-        msg = build_sysex(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, [0x2E] + packed)
-        self.midicontrol.send_message(msg)
-
-    # send patch name
-    def sendcode21message(self, name):
-        data = [0x01, 0x02, 0x00] + [ord(c) for c in name] + [0x00, 0x00, 0x08, 0x09, 0x7C]
-        packed = pack_data(data)
-        msg = build_sysex(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, [0x21] + packed)
-        self.midicontrol.send_message(msg)
-
-    # send end of patch dump
-    def sendcode22message(self):
-        data = [0x01]
-        packed = pack_data(data)
-        msg = build_sysex(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, [0x22] + packed)
+        msg = sysex.encode(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, 0x2E, data)
         self.midicontrol.send_message(msg)
 
     def sendcode26message(self):
-        
-        expheader = [0x02, 0x02, 0x00, 0x03, 0x80, 0x00, 0x03]
-        
-        exp1 = [0xFF, 0x00, 0x00, 0x00] # off
-        if self.device_expression.ui_device._types[0] != 0:
-            exp1 = [factory_expression_assignments[self.device_expression.ui_device._types[0]]["section"], 
-                    factory_expression_assignments[self.device_expression.ui_device._types[0]]["parameter"]] + \
-                    compile_number(self.device_expression.ui_device.pots[0]["max"].value()) + \
-                    compile_number(self.device_expression.ui_device.pots[0]["min"].value())
-            
-        exp2 = [0xFF, 0x00, 0x00, 0x00] # off
-        if self.device_expression.ui_device._types[1] != 0:
-            exp2 = [factory_expression_assignments[self.device_expression.ui_device._types[1]]["section"], 
-                    factory_expression_assignments[self.device_expression.ui_device._types[1]]["parameter"]] + \
-                    compile_number(self.device_expression.ui_device.pots[1]["max"].value()) + \
-                    compile_number(self.device_expression.ui_device.pots[1]["min"].value())
-            
-        exp3 = [0xFF, 0x00, 0x00, 0x00] # off
-        if self.device_expression.ui_device._types[2] != 0:
-            exp3 = [factory_expression_assignments[self.device_expression.ui_device._types[2]]["section"], 
-                    factory_expression_assignments[self.device_expression.ui_device._types[2]]["parameter"]] + \
-                    compile_number(self.device_expression.ui_device.pots[2]["max"].value()) + \
-                    compile_number(self.device_expression.ui_device.pots[2]["min"].value())
-            
-        exp = expheader + exp1 + exp2 + exp3
-            
-        lfo1header = [0x8A, 0x02]
-        lfo1 = compile_number(self.device_lfo.ui_device.pots[0]["speed"].value()) + \
-               compile_number(self.device_lfo.ui_device.pots[0]["waveform"].value()) + \
-               [0x01] + \
-               [factory_expression_assignments[self.device_lfo.ui_device._types[0]]["section"],
-                factory_expression_assignments[self.device_lfo.ui_device._types[0]]["parameter"]] + \
-                compile_number(self.device_lfo.ui_device.pots[0]["max"].value()) + \
-                compile_number(self.device_lfo.ui_device.pots[0]["min"].value())
-
-        lfo2header = [0x8B, 0x02]
-        lfo2 = compile_number(self.device_lfo.ui_device.pots[1]["speed"].value()) + \
-               compile_number(self.device_lfo.ui_device.pots[1]["waveform"].value()) + \
-               [0x01] + \
-               [factory_expression_assignments[self.device_lfo.ui_device._types[1]]["section"],
-                factory_expression_assignments[self.device_lfo.ui_device._types[1]]["parameter"]] + \
-                compile_number(self.device_lfo.ui_device.pots[1]["max"].value()) + \
-                compile_number(self.device_lfo.ui_device.pots[1]["min"].value())
-
-        lfo = lfo1header + lfo1 + lfo2header + lfo2
-
-        packed = pack_data(exp + lfo)
-        msg = build_sysex(common.GNXEDIT_CONFIG["midi"]["channel"], self.mnfr_id, self.device_id, [0x26] + packed)
+        msg = self.model.patch.encode26(common.GNXEDIT_CONFIG["midi"]["channel"])
         #print("Sending Message:", msg)
-        self.midicontrol.send_message(msg)
+        self.midicontrol.send_message(msg, common.SEND_PRIORITY_STATE)
 
+    # channel and connection checks are made once here, decoders are looked up in self.dispatch by (class, opcode)
     def dispatcher(self, msg):
 
         try:
             if type(msg) != type(None):
                 # check for patch change
-                if msg[0] == 0xC0 | common.GNXEDIT_CONFIG["midi"]["channel"]:
+                if msg[0] == 0xC0 | self.midi_channel:
                     self.midiPatchChange.emit(msg[1])
 
-                elif msg[0] == 0xF0:      # system exclusive
-                    #print("Message ({:d}): {:d} bytes received".format(received_count, len(sbytes)) )
-                    #print("MNFR ID: {:02X} DEVICE ID: {:02X} COMMAND: {:02X}".format(msg[3], msg[5], msg[6]) )
-
-                    if compare_array(msg[1:4], self.mnfr_id):             # mnfr code matches
-                        if msg[4] == 0x7E:                  # non-realtime
-                            if self.device_connected:
-                                if msg[5] == common.GNXEDIT_CONFIG["midi"]["channel"] or msg[5] == 0x7F:    # this or all channels
-                                    match msg[6]:
-                                        case 0x01:
-                                            self.decode01()
-                                            self.midi_watchdog_bite_count = 0
-                                            #self.midi_watchdog.reset()
-
-                                        case 0x02:                  # CODE 02: Device Response
-                                            self.decode02(msg)
-                                            self.midi_watchdog_bite_count = 0
-                                            self.sync_control()
-                                            #self.midi_watchdog.reset()
-                                        case _:
-                                            e = GNXError(icon = QMessageBox.Warning, title = "System Exclusive Error", \
-                                                    text = f"Non-Realtime Message [{msg[6]:02X}] code not recognised {msg}", \
-                                                    buttons = QMessageBox.Ok)
-                                            self.gnxAlert.emit(e)
-                                
-
-                        elif (msg[4] == 0x7F or msg[6] == 0x02 or msg[4] == common.GNXEDIT_CONFIG["midi"]["channel"]) and (msg[5] == self.device_id ):
-
-                            if self.device_connected:
-                                self.midi_watchdog_bite_count = 0
-                                #self.midi_watchdog.reset()
-
-                                match msg[6]:
-                                    case 0x02:                  # CODE 02: Device Response
-                                        self.decode02(msg)
-                                        self.sync_control()
-                                    
-                                    case 0x06:                  # CODE 06: Status Response
-                                        self.decode06(msg)
-                                        self.sync_control()
-                                    
-                                    case 0x08:                  # CODE 08: Amp/Cab Names
-                                        self.decode08(msg)
-                                        self.sync_control()
-
-                                    case 0x0A:                  # CODE 0A: Device Status
-                                        self.decode0A(msg)
-
-                                    case 0x13:                  # CODE 13: Patch Names
-                                        self.decode13(msg)
-                                        self.sync_control()
-
-                                    case 0x21:                  # CODE 21: Current Patch Name
-                                        self.decode21(msg)
-                                        self.sync_control()
-
-                                    case 0x22:                  # CODE 22: End of Patch Dump
-                                        self.decode22(msg)
-                                        self.sync_control()
-
-                                    case 0x24:
-                                        self.decode24(msg)      # CODE 24: Patch Dump
-                                        self.sync_control()
-
-                                    case 0x26:                  # CODE 26: LFO and Expression Pedals
-                                        self.decode26(msg)
-                                        self.sync_control()
-
-                                    case 0x28:                  # CODE 28: ???
-                                        self.decode28(msg)
-                                        self.sync_control()
-
-                                    case 0x2A:                  # CODE 2A: Custom Amps and Cabs
-                                        self.decode2A(msg)
-                                        self.sync_control()
-
-                                    case 0x2C:                  # CODE 2C: Parameters
-                                        self.decode2C(msg)
-
-                                    case 0x2D:                  # CODE 2D: Current patch number
-                                        self.decode2D(msg)
-
-                                    case 0x2E:                  # CODE 2E: Patch name changed (saved)
-                                        self.decode2E(msg)
-                                    
-                                    case 0x7E:
-                                        self.decode7E(msg)
-                                        pass                    # acknowledged
-
-                                    case 0x7F:                  # checksum error
-                                        self.setCommsMode(common.COMMS_MODE_NONE)
-                                        e = GNXError(icon = QMessageBox.Warning, title = "GNX System Exclusive Error", \
-                                                text = f"Error code received {msg}",\
-                                                buttons = QMessageBox.Ok)
-                                        self.gnxAlert.emit(e)
-
-
-                                    case _:
-                                        self.setCommsMode(common.COMMS_MODE_NONE)
-                                        e = GNXError(icon = QMessageBox.Warning, title = "GNX System Exclusive Error", \
-                                                text = f"Message[{msg[6]}] code not recognised {msg}",\
-                                                buttons = QMessageBox.Ok)
-                                        self.gnxAlert.emit(e)
-                    
-                            else:       # device not connected
-
-                                # ignore spurious codes when not (technically) connected 
-                                if msg[6] in [0x06, 0x08, 0x0A, 0x13, 0x21, 0x22, 0x24, 0x26, 0x28, 0x2C, 0x2D, 0x2E]:
-                                    return
-                                
-                                match msg[6]:
-                                    case 0x02:                  # CODE 02: Device Response
-                                        self.decode02(msg)
-                                        self.sync_control()
-                                                                       
-                                    case 0x7E:
-                                        self.decode7E(msg)
-                                        self.sync_control()
-                                        pass                    # acknowledged
-
-                                    case 0x7F:                  # checksum error
-                                        e = GNXError(icon = QMessageBox.Warning, title = "GNX System Exclusive Error", \
-                                                text = f"Error code received {msg}",\
-                                                buttons = QMessageBox.Ok)
-                                        self.gnxAlert.emit(e)
-
-                                    case _:
-                                        # message received when not synced?
-                                        e = GNXError(icon = QMessageBox.Warning, title = "GNX System Exclusive Error", \
-                                                text = f"Message {msg[6]:02X} code not recognised {msg}",\
-                                                buttons = QMessageBox.Ok)    
-                                        self.gnxAlert.emit(e)     
+                elif msg[0] == 0xF0 and len(msg) > 7 and compare_array(msg[1:4], self.mnfr_id):    # our system exclusive
+                    opcode = msg[6]
+                    if msg[4] == NON_REALTIME:
+                        if not self.device_connected or (msg[5] != self.midi_channel and msg[5] != 0x7F):    # this or all channels
+                            return False
+                        message_class = NON_REALTIME
+
+                    elif (msg[4] == 0x7F or opcode == 0x02 or msg[4] == self.midi_channel) and msg[5] == self.device_id:
+                        message_class = REALTIME
+
                     else:
-                        x  = compare_array(msg[1:4], self.mnfr_id)
-                        pass
+                        return False
+
+                    if self.device_connected:
+                        self.midi_watchdog.feed()
+                    self.round_trips.received(response_key(msg))
+
+                    handler = self.dispatch.lookup(message_class, opcode)
+                    if handler == None:
+                        self.unrecognised_message(message_class, msg)
+
+                    elif (self.device_connected or not handler.connected) and \
+                            (handler.broadcast or msg[self.midi_channel_offset] == self.midi_channel):
+                        handler(msg)
+                        self.session.feed(msg)          # completes any request waiting for this frame
 
         except GNXError as e:
             self.gnxAlert.emit(e)
@@ -2167,34 +1431,27 @@ class GNX1(QObject):
 
         return False
 
-    # unpack GNX1 message where 8-byte blocks contain 1 byte with most significant bits + 7 x 7-bit bytes
-    def unpack(self, pint):
-        unpacked = []
-        block = 0
-        mask = 0b10000000
-        n = 0
-
-        while (block + n) < len(pint):
-            if n == 0:
-                bit8 = pint[block + n]          # first byte contains MSBs of subsequent 7 bytes
-            else:
-                b8 = bit8 & (mask >> n)         # MSBs packed bit 7  = data byte 0, bit 0 = data byte 7
-                data = pint[block + n]
-                if b8:
-                    data = data | 0b10000000
-
-                unpacked.append(data)
-
-            n += 1
-            if n == 8:
-                n = 0
-                block += 8  
+    def unrecognised_message(self, message_class, msg):
+        if message_class == NON_REALTIME:
+            e = GNXError(icon = QMessageBox.Warning, title = "System Exclusive Error", \
+                    text = f"Non-Realtime Message [{msg[6]:02X}] code not recognised {msg}", \
+                    buttons = QMessageBox.Ok)
+        elif self.device_connected:
+            self.setCommsMode(common.COMMS_MODE_NONE)
+            e = GNXError(icon = QMessageBox.Warning, title = "GNX System Exclusive Error", \
+                    text = f"Message[{msg[6]}] code not recognised {msg}",\
+                    buttons = QMessageBox.Ok)
+        else:
+            # message received when not synced?
+            e = GNXError(icon = QMessageBox.Warning, title = "GNX System Exclusive Error", \
+                    text = f"Message {msg[6]:02X} code not recognised {msg}",\
+                    buttons = QMessageBox.Ok)
+        self.gnxAlert.emit(e)
 
-        return unpacked
-    
+    # unpack GNX1 message where 8-byte blocks contain 1 byte with most significant bits + 7 x 7-bit bytes
     def printpacked(self, msg, compareto, comment, logfile):
         
-        unpacked = self.unpack(msg[7:-1])
+        unpacked = sysex.unpack(msg, 7, -1)
         if comment == None:
             comment = "No comment"
 
@@ -2238,7 +1495,14 @@ class GNX1(QObject):
             self.lastbytes[compareto] = newbytes.copy()
 
 
+    # CODE 01: Device Enquiry, from another host
+    @handles(NON_REALTIME, 0x01)
+    def decode01(self, msg):
+        pass
+
     # CODE 02: Device Response
+    @handles(NON_REALTIME, 0x02)
+    @handles(REALTIME, 0x02, connected = False, broadcast = True)
     def decode02(self, msg):
         # switch to announced channel unless locked
         if not self.device_connected:
@@ -2249,384 +1513,130 @@ class GNX1(QObject):
 
 
     # CODE 06: Device Status
+    @handles(REALTIME, 0x06)
     def decode06(self, msg):
-        if not self.device_connected or msg[self.midi_channel_offset] != common.GNXEDIT_CONFIG["midi"]["channel"]:
-            return
-        
-        pint = msg[7:-1]
-        unpacked = self.unpack(pint[:-1])
-
-        self.current_patch_bank = unpacked[10]
-        self.current_patch_number = unpacked[11]
+        self.model.decode06(msg)
 
         #print("CODE 06: Setting Patch")
         self.setPatchName(None)
 
 
     # CODE 08: Amp/Cab Names
+    @handles(REALTIME, 0x08)
     def decode08(self, msg):
-        if not self.device_connected or msg[self.midi_channel_offset] != common.GNXEDIT_CONFIG["midi"]["channel"]:
-            return
-        
         # self.printpacked(msg, None, None, None)
-        pint = msg[7:-1]
-        unpacked = self.unpack(pint[:-1])       # chop off final 00 to avoid extra array element
-
-        ntype = unpacked[1]                     # name type: 0 = basic, 1 = user
-        ncount = unpacked[5]                    # number of names in list
-
-        self.user_amp_names = {}
-        self.user_cab_names = {}
-
-        n = 6
-        k = 0
-        while k < ncount:
-            idx = unpacked[n]
-
-            n += 1
-            name = ""
-            while unpacked[n] != 0x00:
-                name += chr(unpacked[n])
-                n += 1
-
-            self.user_amp_names[idx] = name
-
-            self.device_green_amp.ui_device.set_user_name(idx, name)
-            self.device_red_amp.ui_device.set_user_name(idx, name)
-
-            n += 1
-            k += 1
-
-        n += 2
-        ncount = unpacked[n]
-        n += 1
-        k = 0
-
-        while k < ncount:
-            idx = unpacked[n]
-
-            n += 1
-            name = ""
-            while unpacked[n] != 0x00:
-                name += chr(unpacked[n])
-                n += 1
-
-            self.user_cab_names[idx] = name
-
-            self.device_green_cab.ui_device.set_user_name(idx, name)
-            self.device_red_cab.ui_device.set_user_name(idx, name)
-
-            n += 1
-            k += 1
-
-        #print("AMP/CAB NAMES:", amp_names, cab_names)
-        pass
+        self.model.decode08(msg)
 
     # CODE 0A: Device Status
+    @handles(REALTIME, 0x0A)
     def decode0A(self, msg):
-        if not self.device_connected or msg[self.midi_channel_offset] != common.GNXEDIT_CONFIG["midi"]["channel"]:
-            return
-        
         #self.printpacked(msg, 0, "CODE 0A", "code0A.csv")
-        
+        pass
+
     # CODE 13: User Patch Names
+    @handles(REALTIME, 0x13)
     def decode13(self, msg):
-        if not self.device_connected or msg[self.midi_channel_offset] != common.GNXEDIT_CONFIG["midi"]["channel"]:
-            return
-        
-        pint = msg[7:-1]
-        unpacked = self.unpack(pint[:-1])       # chop off final 00 to avoid extra array element
-
-        self.user_patch_names = "".join(map(chr, unpacked[2:-1])).split('\x00')
-
-        self.gnxPatchNamesUpdated.emit(self.requested_patch_bank, self.user_patch_names)
+        # the reply doesn't say which bank it is, requests are answered in order
+        request = self.session.waiting(0x13)
+        self.model.decode13(msg, request.context if request != None else self.requested_patch_bank)
                
         
     # CODE 21: Current Patch Name
+    @handles(REALTIME, 0x21)
     def decode21(self, msg):
-        if not self.device_connected or msg[self.midi_channel_offset] != common.GNXEDIT_CONFIG["midi"]["channel"]:
-            return
-        
-        pint = msg[7:-1]
-        unpacked = self.unpack(pint)
+        self.model.decode21(msg)
 
         #print("CODE 21: Setting Patch Name")
-        self.setPatchName("".join(map(chr, unpacked[3:])).split('\x00')[0])       # "".join(map(chr, unpacked[3: 9]))
+        self.setPatchName(self.model.current_patch_name)
 
 
     # CODE 22: End of patch dump
+    @handles(REALTIME, 0x22)
     def decode22(self, msg):
-
-        if not self.device_connected or msg[self.midi_channel_offset] != common.GNXEDIT_CONFIG["midi"]["channel"]:
-            return
+        pass
 
     # CODE 24: Patch Dump
+    # the blocks are kept in the model for saving to the library, the faces are updated from it
+    @handles(REALTIME, 0x24)
     def decode24(self, msg):
-
-        if not self.device_connected or msg[self.midi_channel_offset] != common.GNXEDIT_CONFIG["midi"]["channel"]:
-            return
-        
-        self.code24data = msg.copy()     # for saving to library
-
-        pint = msg[7:-1]
-        unpacked = self.unpack(pint)
-        n = 0
-
-        n = skip_bytes(n, unpacked, [0x02, 0x02])
-        n += 1  # can be 0x00 or 0x09 - 0x09 seems to be after error
-        n = skip_bytes(n, unpacked, [0x10, 0x00, 0x00, 0x00, 0x00, 0x00])
-        # pickup n = 9
-        n = skip_bytes(n, unpacked, [0x50, 0x01, 0x01, 0x90])
-        n = self.device_pickup.get_values(n, unpacked)
-        # wah
-        n = skip_bytes(n, unpacked, [0x51, 0x02, 0x01, 0xC3])
-        n = self.device_wah.get_values(n, unpacked)
-        # compressor
-        n = skip_bytes(n, unpacked, [0x52, 0x03, 0x01, 0xF4])
-        n = self.device_compressor.get_values(n, unpacked)
-        #whammy
-        n = skip_bytes(n, unpacked, [0x53, 0x04, 0x03])
-        n += 1 # skip 0x84 (Whammy), 0x85 (IPS), 0x86 (Detune), 0x87 (Pitch)
-        n = self.device_whammy.get_values(n, unpacked)
-        #warp
-        n = skip_bytes(n, unpacked, [0x28, 0x05, 0x00, 0xC8])
-        n = self.device_warp.get_values(n, unpacked)
-        # green amp
-        n = skip_bytes(n, unpacked, [0x3C, 0x06, 0x01, 0x2C])
-        n = self.device_green_amp.get_values(n, unpacked)
-        # green cab
-        n = skip_bytes(n, unpacked, [0x3D, 0x07, 0x01, 0x5E])
-        n = self.device_green_cab.get_values(n, unpacked)
-        # red amp
-        n = skip_bytes(n, unpacked, [0x3C, 0x08, 0x01, 0x2C])
-        n = self.device_red_amp.get_values(n, unpacked)
-        # red cab
-        n = skip_bytes(n, unpacked, [0x3D, 0x09, 0x01, 0x5E])
-        n = self.device_red_cab.get_values(n, unpacked)
-        # gate
-        n = skip_bytes(n, unpacked, [0x54, 0x0A, 0x02])
-        n += 1 # skip 0x26 (Silencer), 0x27 (Pluck)
-        n = self.device_gate.get_values(n, unpacked)
-        # modulation
-        n = skip_bytes(n, unpacked, [0x55, 0x0B])
-        n += 1 # skip 0x03 or 0x04
-        n += 1 # skip 0xE8 (Chorus), etc
-        n = self.device_mod.get_values(n, unpacked)
-        # delay
-        n = skip_bytes(n, unpacked, [0x56, 0x0C, 0x02, 0x58])
-        n = self.device_delay.get_values(n, unpacked)
-        # reverb
-        n = skip_bytes(n, unpacked, [0x57, 0x0D, 0x02, 0xBD])
-        n = self.device_reverb.get_values(n, unpacked)
-        pass
-        # remainder
-        #self.print_remainder(n, unpacked, "CODE 24 REMAINDER")
-        n = skip_bytes(n, unpacked, [0x14, 0x0E, 0x00, 0x64, 0x06, 0x00])
-        n += 1 #Volume PRE value (modified by Pedal and LFO)
-        n += 1 #Volume POST value (modified by Pedal and LFO)
-        n += 1 #Amp Footswitch setting
-        n += 1 #LFO1 Speed
-        n += 1 #LFO2 Speed
-        n = skip_bytes(n, unpacked, [0x02, 0x0F, 0x00, 0x02, 0x00])
-
+        try:
+            self.model.patch.decode24(msg)
+        except Exception as e:
+            raise GNXError(icon = QMessageBox.Warning, title = "Parameter Error", text = f"Patch dump not decoded: {e}", buttons = QMessageBox.Ok)
 
     # CODE 26: LFO and Expression Pedals
+    @handles(REALTIME, 0x26)
     def decode26(self, msg):
-
-        if not self.device_connected or msg[self.midi_channel_offset] != common.GNXEDIT_CONFIG["midi"]["channel"]:
-            return
-        
-        self.code26data = msg.copy()     # for saving to library
-
-        pint = msg[7:-1]
-        unpacked = self.unpack(pint)
-        n = 0
-        n = skip_bytes(n, unpacked, [0x02, 0x02])
-        n += 1  # can be 0x00 or 0x09  - 0x09 seems to be after error
-        n = skip_bytes(n, unpacked, [0x03, 0x80, 0x00, 0x03])
-        n = self.device_expression.get_values(n, unpacked)
-        n = self.device_lfo.get_values(n, unpacked)
-
+        self.model.patch.decode26(msg)
 
     # CODE 28: Unknown
+    @handles(REALTIME, 0x28)
     def decode28(self, msg):
-
-        if not self.device_connected or msg[self.midi_channel_offset] != common.GNXEDIT_CONFIG["midi"]["channel"]:
-            return
-        
-        self.code28data = msg.copy()     # for saving to library
+        self.model.patch.decode28(msg)
 
     # CODE 2A: Custom Amps and Cabs
+    @handles(REALTIME, 0x2A)
     def decode2A(self, msg):
-
-        if not self.device_connected or msg[self.midi_channel_offset] != common.GNXEDIT_CONFIG["midi"]["channel"]:
-            return
-        
-        if self.code2Adata == None:
-            self.code2Adata = {}
-        
-        self.code2Adata[f"{msg[11]:02X}{msg[12]:02X}"] = msg.copy()     # for saving to library
-
-        pint = msg[7:-1]
-        unpacked = self.unpack(pint)
-
-        if compare_array([0x3C, 0x06], unpacked[3:5]):      # GREEN Amp
-            self.device_green_amp.get_values2A(unpacked)
-        elif compare_array([0x3C, 0x08], unpacked[3:5]):    # RED Amp
-            self.device_red_amp.get_values2A(unpacked)
-        elif compare_array(unpacked[3:5], [0x3D, 0x07]):
-            self.device_green_cab.get_values2A(unpacked)
-        elif compare_array(unpacked[3:5], [0x3D, 0x09]):
-            self.device_red_cab.get_values2A(unpacked)
-
+        self.model.patch.decode2A(msg)
         # self.printpacked(msg, None, None, None)
-        pass
 
     # CODE 2C: Parameters
+    @handles(REALTIME, 0x2C)
     def decode2C(self, msg):
-
-        if not self.device_connected or msg[self.midi_channel_offset] != common.GNXEDIT_CONFIG["midi"]["channel"]:
-            return
-        
-        pint = msg[7:-1]
-        unpacked = self.unpack(pint)
-
+        unpacked = sysex.unpack(msg, 7, -1)
         section = unpacked[2]
-        parameter = unpacked[3]
-        n, value = getnum(4, unpacked)
-
-        #print(f"Section {section} parameter {parameter} value {value}")
-
-        match section:      # section code
-            case 0x01:      # pickup
-                self.device_pickup.parameter_change(parameter, value) 
-            
-            case 0x02:      # wah
-                self.device_wah.parameter_change(parameter, value) 
-
-            case 0x03:      # compressor
-                self.device_compressor.parameter_change(parameter, value) 
-
-            case 0x04:      # whammy
-                self.device_whammy.parameter_change(parameter, value) 
-
-            case 0x05:      # warp
-                self.device_warp.parameter_change(parameter, value)        
-
-            case 0x06:      # green amp
-                self.device_green_amp.parameter_change(parameter, value)
-
-            case 0x07:      # green cab
-                self.device_green_cab.parameter_change(parameter, value)
-
-            case 0x08:      # red amp
-                self.device_red_amp.parameter_change(parameter, value)
-
-            case 0x09:      # red cab
-                self.device_red_cab.parameter_change(parameter, value)
 
-            case 0x0A:      # noise gate
-                self.device_gate.parameter_change(parameter, value)
+        #print(f"Section {section} parameter {unpacked[3]}")
 
-            case 0x0B:      # chorus/mod
-                self.device_mod.parameter_change(parameter, value) 
-
-            case 0x0C:      # delay
-                self.device_delay.parameter_change(parameter, value) 
-
-            case 0x0D:      # reverb
-                self.device_reverb.parameter_change(parameter, value)
-
-            case 0x0E:      # pedal value, not used
-                #print("CODE 0E RECEIVED")
-                #self.printpacked(msg, 0, "CODE 0E", "code0E.csv")
-                pass
+        if section == 0x0E:     # pedal value, not used
+            #print("CODE 0E RECEIVED")
+            #self.printpacked(msg, 0, "CODE 0E", "code0E.csv")
+            pass
 
-            case _:
-                e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", \
-                                                text = f"Received parameter change not recognised {section}", \
-                                                buttons = QMessageBox.Ok)
-                self.gnxAlert.emit(e)
+        elif not self.model.decode2C(msg):
+            e = GNXError(icon = QMessageBox.Warning, title = "Parameter Error", \
+                                            text = f"Received parameter change not recognised {section}", \
+                                            buttons = QMessageBox.Ok)
+            self.gnxAlert.emit(e)
 
         self.send_keep_alive()
 
     # CODE 2D: Current patch number has changed
+    @handles(REALTIME, 0x2D)
     def decode2D(self, msg):
+        self.model.decode2D(msg)
 
-        if not self.device_connected or msg[self.midi_channel_offset] != common.GNXEDIT_CONFIG["midi"]["channel"]:
-            return
-
-        pint = msg[7:-1]
-        unpacked = self.unpack(pint)
-        bank = unpacked[1]
-        patch = unpacked[2]
-
-        #print(f"CODE 2D Bank: {bank} Patch: {patch}")
-
-        self.current_patch_bank = bank
-        self.current_patch_number = patch
+        #print(f"CODE 2D Bank: {self.current_patch_bank} Patch: {self.current_patch_number}")
 
         # get patch data
-        self.setCommsMode(common.COMMS_MODE_SYNC, phase = 5)
-        self.sync_control()
+        self.start_sync()
 
     # CODE 2E: Patch name changed (saved)
+    @handles(REALTIME, 0x2E)
     def decode2E(self, msg):
+        self.model.decode2E(msg)
 
-        if not self.device_connected or msg[self.midi_channel_offset] != common.GNXEDIT_CONFIG["midi"]["channel"]:
-            return
-
-        pint = msg[7:-1]
-        unpacked = self.unpack(pint)
+        #print(f"PATCH SAVED: Bank {self.current_patch_bank} Patch {self.current_patch_number} Name {self.current_patch_name}")
 
-        self.current_patch_bank = unpacked[2]
-        self.current_patch_number = unpacked[3]
-
-        name = ""
-        n = 4
-        while unpacked[n] != 0:
-            name += chr(unpacked[n])
-            n += 1
-
-        #print(f"PATCH SAVED: Bank {self.current_patch_bank} Patch {self.current_patch_number} Name {name}")
-
-        self.user_patch_names[self.current_patch_number] = name
-        self.setPatchName(name)
-        pass
+        self.setPatchName(self.current_patch_name)
+        self.take_snapshot()
 
     # CODE 7E: e.g: current patch number has not changed
+    @handles(REALTIME, 0x7E)
     def decode7E(self, msg):
-        if not self.device_connected or msg[self.midi_channel_offset] != common.GNXEDIT_CONFIG["midi"]["channel"]:
-            return
-        
-        pint =msg[7:-2]
-        unpacked = self.unpack(pint)
+        unpacked = sysex.unpack(msg, 7, -2)
         if compare_array(unpacked, [0x01, 0x76, 0x00]):
-            # patch number has not changed?
-            pass #TODO: what exactly is this?
+            self.midi_watchdog.acknowledged()      # keep-alive
         
-        elif compare_array(unpacked, [0x01, 0x21, 0x00]):
-            self.upload_control()
-
-        elif compare_array(unpacked, [0x01, 0x24, 0x00]):
-            self.upload_control()
-
-        elif compare_array(unpacked, [0x01, 0x26, 0x00]):
-            self.upload_control()
-
-        elif compare_array(unpacked, [0x01, 0x28, 0x00]):
-            self.upload_control()
-
-        elif compare_array(unpacked, [0x01, 0x2A, 0x00]):
-            self.upload_control()
+        elif unpacked[1] in [0x21, 0x22, 0x24, 0x26, 0x28, 0x2A] and unpacked[2] == 0x00:
+            pass            # upload blocks, the session hands these to upload_steps
 
         elif compare_array(unpacked, [0x01, 0x2C, 0x00]):       # parameter changed
             pass
 
         elif compare_array(unpacked, [0x01, 0x2D, 0x00]):
             # patch change acknowledged - get patch dump
-            self.setCommsMode(common.COMMS_MODE_SYNC, phase = 5)
-            self.sync_control()
+            self.start_sync()
 
         elif compare_array(unpacked, [0x01, 0x2E, 0x00]):
             # patch name change acknowledged
@@ -2638,6 +1648,18 @@ class GNX1(QObject):
             self.gnxAlert.emit(e)
         pass
 
+    # CODE 7F: checksum error
+    @handles(REALTIME, 0x7F, connected = False, broadcast = True)
+    def decode7F(self, msg):
+        if self.session.rejected(msg) != None:
+            return          # the session resends it, or fails the request when out of retries
+        if self.device_connected:
+            self.setCommsMode(common.COMMS_MODE_NONE)
+        e = GNXError(icon = QMessageBox.Warning, title = "GNX System Exclusive Error", \
+                text = f"Error code received {msg}",\
+                buttons = QMessageBox.Ok)
+        self.gnxAlert.emit(e)
+
     def save_amp_to_gnx(self):
 
         def accepted():
@@ -2649,13 +1671,8 @@ class GNX1(QObject):
             self.save_ampcab(name, patch)
 
             # update everywhere
-            self.user_amp_names[patch] = name
-            self.user_cab_names[patch] = name
-
-            self.device_green_amp.ui_device.set_user_name(patch, name)
-            self.device_red_amp.ui_device.set_user_name(patch, name)
-            self.device_green_cab.ui_device.set_user_name(patch, name)
-            self.device_red_cab.ui_device.set_user_name(patch, name)
+            self.model.rename_ampcab(patch, name)
+            self.take_snapshot()
 
         def rejected():
             pass
@@ -2793,9 +1810,8 @@ class GNX1(QObject):
                 self.gnxAlert.emit(e) 
             else:
                 # initiate resync with callback
-                self.setCommsMode(common.COMMS_MODE_SYNC, phase = 5)
+                self.start_sync()
                 self.commsModeChanged.connect(callback)     # connect for one-shot
-                self.sync_control()
 
         def callback(oldmode, mode):
             # if true, it's another job
@@ -2819,10 +1835,7 @@ class GNX1(QObject):
 
                     cur = db.conn.cursor()
                     if type == "patch":
-                        cur.execute("INSERT INTO patches (category, name, description, tags, C24, C26, C28, C3C06, C3D07, C3C08, C3D09) \
-                                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", 
-                                    [category, name, description, tags, data["24"], data["26"],
-                                    data["28"], data["3C06"], data["3D07"], data["3C08"], data["3D09"]])
+                        blobstore.insert_patch(cur, category, name, description, tags, data)
                     else:
 
                         green_amp = json.dumps(self.device_green_amp.ui_device.getAmpSettings())
@@ -2910,7 +1923,7 @@ class GNX1(QObject):
         
             db.conn.row_factory = sqlite3.Row
             cur = db.conn.cursor()
-            cur.execute("SELECT * FROM categories ORDER by parent ASC")
+            cur.execute("SELECT * FROM categories WHERE id <> 0 ORDER by parent ASC")
             rc = cur.fetchall()
             crows = [dict(row) for row in rc]
 
@@ -2961,43 +1974,14 @@ class GNX1(QObject):
         return s
     
     def blob2msg(self, blob):
-        msg = []
-
-        for b in blob:
-            msg.append(b)
-
         # TODO: check bank and patch numbers 02 00
-        # replace MIDI channel
-        msg[4] = common.GNXEDIT_CONFIG["midi"]["channel"]
-
-        # recalculate checksum
-        cx = 0
-        i = 1
-        while i < len(msg) - 2:
-            cx = cx ^ msg[i]
-            i += 1
-
-        msg[len(msg) - 2] = cx
-
-        return msg
+        # replace MIDI channel and recalculate checksum
+        return sysex.rechannel(blob, common.GNXEDIT_CONFIG["midi"]["channel"])
 
     def serialise_to_file(self):
-        s = ""
-
-        blocks = {  "24":self.code24data, 
-                    "3C06": self.code2Adata["3C06"],
-                    "3D07": self.code2Adata["3D07"], 
-                    "3C08": self.code2Adata["3C08"],
-                    "3D09": self.code2Adata["3D09"],
-                    "26": self.code26data,
-                    "28": self.code28data
-        }
         result = {}
-        for k, b in blocks.items():
-            #s = ""
-            #s += self.msg2hexstring(b)
-            a = array.array('B', b)
-            result[k] = a
+        for k in BLOCK_KEYS:
+            result[k] = array.array('B', self.model.patch.blocks[k])
 
         return result
 
@@ -3037,42 +2021,26 @@ class GNX1(QObject):
             data = row[0]
 
             if type == "patch":
-                msg0 = self.blob2msg(data["C24"]) 
-                self.code24data = msg0
-
-                msg1 = self.blob2msg(data["C3C06"])
-                self.code2Adata["3C06"] = msg1
-                msg2 = self.blob2msg(data["C3D07"])
-                self.code2Adata["3D07"] = msg2
-                msg3 = self.blob2msg(data["C3C08"])
-                self.code2Adata["3C08"] = msg3
-                msg4 = self.blob2msg(data["C3D09"])
-                self.code2Adata["3D09"] = msg4
-
-                msg5 = self.blob2msg(data["C26"]) if type == "patch" else None
-                self.code26data = msg5
-                msg6 = self.blob2msg(data["C28"]) if type == "patch" else None
-                self.code28data = msg6
-
-                self.setCommsMode(common.COMMS_MODE_UPLOADING)
-
-                self.setCommsPhase(1)
-                # send patch name to buffer
-                #self.sendcode21message(data["name"])    # acknowledgement will trigger next blocks
-                self.sendcode21message(self.current_patch_name) 
+                blocks = {k: self.blob2msg(msg) for k, msg in blobstore.blocks(cur, [data[c] for c in blobstore.COLUMNS]).items()}
+                if not self.send_delta(blocks):
+                    # the faces follow after the upload, when the blocks are decoded
+                    self.model.patch.blocks.update(blocks)
+
+                    # send patch name to buffer, then the blocks, each waiting for its acknowledgement
+                    self.start_upload()
 
             else:   # amp 
 
                 green_amp = json.loads(data["green_amp"])
-                self.device_green_amp.set_values(sendToGNX = True, **green_amp)
+                self.device_green_amp.set_values(sendToGNX = True, **self.checked("green_amp", green_amp))
                 green_cab = json.loads(data["green_cab"])
-                self.device_green_cab.set_values(sendToGNX = True, **green_cab)
+                self.device_green_cab.set_values(sendToGNX = True, **self.checked("green_cab", green_cab))
                 red_amp = json.loads(data["red_amp"])
-                self.device_red_amp.set_values(sendToGNX = True, **red_amp)
+                self.device_red_amp.set_values(sendToGNX = True, **self.checked("red_amp", red_amp))
                 red_cab = json.loads(data["red_cab"])
-                self.device_red_cab.set_values(sendToGNX = True, **red_cab)
+                self.device_red_cab.set_values(sendToGNX = True, **self.checked("red_cab", red_cab))
                 warp = json.loads(data["warp"])
-                self.device_warp.set_values(sendToGNX = True, **warp)
+                self.device_warp.set_values(sendToGNX = True, **self.checked("warp", warp))
                 
             db.conn.close()
 
@@ -3083,92 +2051,211 @@ class GNX1(QObject):
             self.gnxAlert.emit(e)
             return
 
-    # uploading state machine called after acknowledge received
-    def upload_control(self):
-        if self.commsMode != common.COMMS_MODE_UPLOADING:
-            return
+    # the model has the device's edit buffer, confirmed by the device and not since lost
+    def in_sync(self):
+        return self.device_connected and not self.patch_from_cache and self.delta_delivered() and self.model.patch.complete()
+
+    # a delta upload's changes have all been written; one that failed or was dropped leaves the model stale
+    def delta_delivered(self):
+        if self.delta_sent == None:
+            return True
+        first, last = self.delta_sent
+        scheduler = self.midicontrol.send_scheduler
+        if not scheduler.sent_through(last):
+            return False
+        self.delta_sent = None
+        if scheduler.last_failure >= first:
+            self.setStateStale(True)
+            return False
+        return True
+
+    # a library patch as only the parameters that differ from the edit buffer, no upload or resync;
+    # False when it needs the full upload (off, out of sync, amp or cab model changed or too many changes)
+    def send_delta(self, blocks):
+        if not self.delta_upload or self.commsMode != common.COMMS_MODE_NONE or not self.in_sync():
+            return False
+        self.flush_parameter_changes()      # edits still waiting are part of the edit buffer
+        started = time.perf_counter()
+        changes = delta(self.model.patch.edited_blocks(self.midi_channel), blocks)
+        if changes == None:
+            return False
+        parameters, expression = changes
+        numbers = [self.send_parameter_change_now(section, parameter, value) for section, parameter, value in parameters]
+        if expression:
+            numbers.append(self.midicontrol.send_message(blocks["26"], common.SEND_PRIORITY_STATE))
+        self.uploader.stats.delta(len(parameters) + expression, time.perf_counter() - started)
+        if not self.load_edit_buffer(blocks):
+            return False
+        # in sync once the changes are out, until then the next audition takes the full upload and resync
+        if len(numbers) > 0:
+            self.delta_sent = (numbers[0], numbers[-1])
+        return True
+
+    # the edit buffer as the device now has it, decoded here rather than fetched back; False if it can't be decoded
+    def load_edit_buffer(self, blocks):
+        try:
+            self.model.patch.load(blocks)
+        except Exception as e:
+            print(f"Edit buffer not decoded {e}")
+            return False
+        self.take_snapshot()
+        return True
+
+    # upload: patch name then the blocks, each acknowledged before the next
+    def upload_steps(self):
+        in_sync = self.device_connected and not self.patch_from_cache and self.delta_delivered()
+        self.setCommsPhase(1)
+        yield from self.uploader.upload_steps(self.current_patch_name, self.model.patch.blocks,
+                                              progress = lambda: self.setCommsPhase(self.commsPhase + 1))
+
+        self.setCommsMode(common.COMMS_MODE_NONE)  # finished
+        # every block was acknowledged, so only a model that was out of sync needs the device to send it back
+        if not (in_sync and self.load_edit_buffer(dict(self.model.patch.blocks))):
+            self.midi_resync()
 
-        breakLoop = False       # amp has some blocks missing
-        while not breakLoop:
-            breakLoop = True
-            match self.commsPhase:
-                case 0:
-                    return
-                
-                # patch upload
-                case 1:
-                    self.setCommsPhase(self.commsPhase + 1)
-                    self.midicontrol.send_message(self.code24data)
-                case 2:
-                    self.setCommsPhase(self.commsPhase + 1)
-                    self.midicontrol.send_message(self.code2Adata["3C06"])
-                case 3:
-                    self.setCommsPhase(self.commsPhase + 1)
-                    self.midicontrol.send_message(self.code2Adata["3D07"])
-                case 4:
-                    self.setCommsPhase(self.commsPhase + 1)
-                    self.midicontrol.send_message(self.code2Adata["3C08"])
-                case 5:
-                    self.setCommsPhase(self.commsPhase + 1)
-                    self.midicontrol.send_message(self.code2Adata["3D09"])
-                case 6:
-                    self.setCommsPhase(self.commsPhase + 1)
-                    self.midicontrol.send_message(self.code26data)
-                case 7:
-                    self.setCommsPhase(self.commsPhase + 1)
-                    self.midicontrol.send_message(self.code28data)
-                case 8:
-                    self.setCommsMode(common.COMMS_MODE_NONE)  # finished
-                    self.sendcode22message()
-                    self.midi_resync()
-
-    # synching state machine
-    def sync_control(self):
-        if self.commsMode != common.COMMS_MODE_SYNC:
-            return
-        
-        match self.commsPhase:
-            case 0:
-                self.setCommsPhase(self.commsPhase + 1)
-                self.enquire_device()       # send code 0x01, receives 0x02
-            case 1:
-                self.setCommsPhase(self.commsPhase + 1)
-                self.request_status()       # send code 0x05, receives 0x06
-            case 2:
-                self.setCommsPhase(self.commsPhase + 1)
-                self.request_ampcab_names(0x01)    # code 0x07 amp/cab names , receives 0x08
-            case 3:
-                self.setCommsPhase(self.commsPhase + 1)
-                self.request_patch_names(0x00)     # code 0x12 factory patch names, receives 0x13
-            case 4:
-                self.setCommsPhase(self.commsPhase + 1)
-                self.request_patch_names(0x01)     # code 0x12 user patch names, receives 0x13
-            
-            # start here for getting current patch details
-            case 5:
-                self.setCommsPhase(self.commsPhase + 1)
-                self.request_current_patch_name()  # code 0x20 current patch name, receives 0x21
-            case 6:
-                self.setCommsPhase(self.commsPhase + 1)
-                self.acknowledge_current_patch_name()   # code 0x7E, triggers dump starting code 0x24
-            case 7:
-                self.setCommsPhase(self.commsPhase + 1) # 0x24 data received, expect 0x2A green amp data
-            case 8:
-                self.setCommsPhase(self.commsPhase + 1) # expect 0x2A green cab data
-            case 9:
-                self.setCommsPhase(self.commsPhase + 1) # expect 0x2A red amp data
-            case 10:
-                self.setCommsPhase(self.commsPhase + 1) # expect 0x26 expression & lfo
-            case 11:
-                self.setCommsPhase(self.commsPhase + 1) # 0x26 data received, expect 0x28 ???
-            case 12:
-                self.setCommsPhase(self.commsPhase + 1) # 0x28 data received, expect 0x22 end of data
-            case 13:                    
-                self.setCommsMode(common.COMMS_MODE_NONE)  # 0x22 received, end of message
+    # sync: the responses are decoded by the dispatcher before the futures complete
+    def sync_steps(self, scope):
+        name_request = None
+        dump = True
+        if scope == common.SYNC_INCREMENTAL:
+            dump = yield from self.incremental_steps()
+
+        elif scope == common.SYNC_FULL:
+            self.setCommsPhase(1)
+            yield self.enquire_device()                 # code 0x01, receives 0x02, sets the channel for the rest
+            if self.pipelined_sync:
+                try:
+                    name_request = yield from self.device_info_pipelined()
+                except (RequestTimeout, RequestRejected):
+                    # a lost reply can't be resent without upsetting the order of the 0x13 replies
+                    self.pipelined_sync = False         # serial from now on
+                    self.session.cancel_all("pipeline abandoned")
+                    name_request = None
+                    yield from self.device_info_steps()
+            else:
+                yield from self.device_info_steps()
+
+        # start here for getting current patch details
+        # dump blocks can't be requested singly, a lost one means asking for the whole dump again
+        attempt = 0
+        while dump:
+            try:
+                yield from self.patch_dump_steps(name_request)
+                break
+            except (RequestTimeout, RequestRejected):
+                name_request = None
+                attempt += 1
+                if attempt > self.session.retries:
+                    raise
 
+        self.setCommsMode(common.COMMS_MODE_NONE)
+        if self.patch_from_cache:
+            self.setStateStale(False)       # the dump has replaced whatever came from the snapshot
+        self.take_snapshot()
+        if common.GNXEDIT_CONFIG.get("logging", {}).get("dispatch_stats", False):
+            print(f"{['full', 'incremental', 'patch'][scope]} sync {'pipelined' if self.pipelined_sync else 'serial'} "
+                  f"{(time.perf_counter() - self.comms_task_started) * 1000:.1f} ms{'' if dump else ', patch unchanged'}")
+            print(self.dispatch.report())       # decoder time since the last report
+            print(self.session.report())        # round trip per request
+            self.dispatch.reset_stats()
+
+    def device_info_steps(self):
+        self.setCommsPhase(2)
+        yield self.request_status()                 # code 0x05, receives 0x06
+        self.setCommsPhase(3)
+        yield self.request_ampcab_names(0x01)       # code 0x07 amp/cab names, receives 0x08
+        self.setCommsPhase(4)
+        yield self.request_patch_names(0x00)        # code 0x12 factory patch names, receives 0x13
+        self.setCommsPhase(5)
+        yield self.request_patch_names(0x01)        # code 0x12 user patch names, receives 0x13
+
+    # one round trip: enquiry and status together, names from the snapshot
+    # returns True when the patch dump is still needed
+    def incremental_steps(self):
+        snapshot = self.snapshot
+        self.setCommsPhase(1)
+        enquiry = self.enquire_device()
+        status = self.request_status() if snapshot.channel == self.midi_channel else None     # answered after the 0x02
+        yield enquiry
+
+        if status == None or snapshot.channel != self.midi_channel:        # device is on another channel now
+            self.session.cancel_all("channel changed")
+            yield from self.device_info_steps()
+            return True
+
+        self.setCommsPhase(2)
+        yield status
+        self.apply_snapshot(snapshot)
+        unchanged = (self.current_patch_bank, self.current_patch_number) == (snapshot.current_patch_bank, snapshot.current_patch_number)
+        return not (unchanged and self.has_patch() and not self.patch_from_cache)
+
+    def apply_snapshot(self, snapshot):
+        self.model.apply_snapshot(snapshot)
+
+    # called before the ports open so the editor isn't blank while syncing, returns True if the snapshot was shown
+    def load_cache(self):
+        snapshot = self.snapshot
+        if not self.startup_cache or snapshot == None or not snapshot.usable():
+            return False
+        self.apply_snapshot(snapshot)
+
+        blocks = snapshot.blocks
+        if snapshot.has_patch() and all(sysex.verify(blocks[k])[1] for k in BLOCK_KEYS):
+            try:
+                self.model.patch.load(blocks)
+            except Exception as e:
+                print(f"Device snapshot patch not loaded {e}")
+                self.model.patch.clear()
+
+        if snapshot.current_patch_bank != None:
+            self.current_patch_bank = snapshot.current_patch_bank
+            self.current_patch_number = snapshot.current_patch_number
+            self.setPatchName(snapshot.current_patch_name)
+        self.setStateStale(True)
+        return True
+
+    def take_snapshot(self):
+        snapshot = DeviceSnapshot()
+        snapshot.channel = self.midi_channel
+        snapshot.patch_names = {bank: list(names) for bank, names in self.patch_names.items()}
+        snapshot.user_amp_names = dict(self.user_amp_names)
+        snapshot.user_cab_names = dict(self.user_cab_names)
+        snapshot.current_patch_bank = self.current_patch_bank
+        snapshot.current_patch_number = self.current_patch_number
+        snapshot.current_patch_name = self.current_patch_name
+        if self.has_patch() and not self.patch_from_cache:
+            snapshot.blocks = self.serialise_to_file()
+        elif self.snapshot != None:
+            snapshot.blocks = self.snapshot.blocks      # keep the last confirmed patch
+        try:
+            snapshot.save()
+        except OSError as e:
+            print(f"Device snapshot not saved {e}")
+        self.snapshot = snapshot
+
+    # same requests back to back, they don't depend on each other's results
+    # returns the current patch name request, already on its way, for patch_dump_steps
+    def device_info_pipelined(self):
+        requests = [self.request_status(retries = 0), self.request_ampcab_names(0x01, retries = 0),
+                    self.request_patch_names(0x00, retries = 0), self.request_patch_names(0x01, retries = 0)]
+        name_request = self.request_current_patch_name(retries = 0)
+        for phase, future in enumerate(requests, 2):
+            self.setCommsPhase(phase)
+            yield future
+        return name_request
+
+    def patch_dump_steps(self, name_request = None):
+        self.setCommsPhase(6)
+        yield name_request if name_request != None else self.request_current_patch_name()     # code 0x20 current patch name, receives 0x21
+        self.setCommsPhase(7)
+        yield self.acknowledge_current_patch_name()     # code 0x7E, triggers dump starting code 0x24
+
+        for phase, (code, label) in enumerate([(0x2A, "green amp"), (0x2A, "green cab"), (0x2A, "red amp"), (0x2A, "red cab"),
+                                               (0x26, "expression & lfo"), (0x28, "28"), (0x22, "end of dump")], 8):
+            self.setCommsPhase(phase)
+            yield self.session.expect(code, label = f"dump {code:02X} {label}")
 
     def has_patch(self):
-        return not (self.code24data == None or self.code2Adata["3C06"] == None or self.code2Adata["3D07"] == None or self.code2Adata["3C08"] == None \
-            or self.code2Adata["3D09"] == None or self.code26data == None or self.code28data == None)
+        return self.model.patch.complete()
 
 
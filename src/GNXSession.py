@@ -0,0 +1,316 @@
+# GNXSession.py
+#
+# GNXEdit request/response correlation for the GNX1 protocol
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# nothing in here knows about Qt or threads: feed() and poll() must be called from the thread that owns the session
+# (the Qt main thread in GNXEdit, where GNX1.dispatcher runs)
+
+import time
+
+import sysex
+
+ACK = 0x7E          # acknowledgement frame, data [0x01, acknowledged opcode, status]
+NAK = 0x7F          # checksum error, data [0x01, rejected opcode, status]
+
+class RequestTimeout(Exception):
+    pass
+
+class RequestRejected(Exception):
+    pass
+
+class RequestCancelled(Exception):
+    pass
+
+# key a received frame is matched on: its opcode, or (ACK, opcode) for an acknowledgement
+def response_key(msg):
+    if len(msg) < 10:
+        return None
+    if msg[sysex.OPCODE_OFFSET] == ACK:
+        data = sysex.payload(msg)
+        return (ACK, data[1]) if len(data) > 1 else None
+    return msg[sysex.OPCODE_OFFSET]
+
+# result of a request, resolved by the Correlator
+class Future:
+
+    def __init__(self, label = None):
+        self.label = label
+        self.done = False
+        self.result = None
+        self.exception = None
+        self.callbacks = []
+
+    def add_done_callback(self, callback):
+        if self.done:
+            callback(self)
+        else:
+            self.callbacks.append(callback)
+
+    def set_result(self, result):
+        self.finish(result, None)
+
+    def set_exception(self, exception):
+        self.finish(None, exception)
+
+    def finish(self, result, exception):
+        if self.done:
+            return
+        self.done = True
+        self.result = result
+        self.exception = exception
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+class Request:
+
+    def __init__(self, msg, key, timeout, retries, label, context = None):
+        self.msg = msg
+        self.context = context      # anything the response can't tell, e.g. which bank a 0x13 is for
+        self.key = key
+        self.timeout = timeout
+        self.retries = retries
+        self.label = label
+        self.future = Future(label)
+        self.attempts = 0
+        self.sent = None
+        self.deadline = None
+
+# pending requests are matched to responses by key, oldest first, so two 0x12 name requests get their 0x13 replies in order
+class Correlator:
+
+    def __init__(self, send, timeout = 1.0, retries = 2, clock = time.monotonic):
+        self.send = send
+        self.timeout = timeout
+        self.retries = retries
+        self.clock = clock
+        self.pending = []
+        self.rtt = {}       # label: [count, total seconds, max seconds]
+        self.timeouts = 0
+        self.resent = 0
+        self.naks = 0
+
+    # send msg (None: nothing to send, just wait for key) and return a Future resolved with the matching frame
+    def request(self, msg, key, timeout = None, retries = None, label = None, context = None):
+        request = Request(msg, key, self.timeout if timeout == None else timeout, self.retries if retries == None else retries,
+                          label if label != None else str(key), context)
+        if msg == None:
+            request.retries = 0
+        self.pending.append(request)
+        self.transmit(request)
+        return request.future
+
+    # a response expected without a request of its own, e.g. the dump blocks following an acknowledged 0x21
+    def expect(self, key, timeout = None, label = None):
+        return self.request(None, key, timeout, 0, label)
+
+    def transmit(self, request):
+        request.attempts += 1
+        request.sent = self.clock()
+        request.deadline = request.sent + request.timeout
+        if request.msg != None:
+            self.send(request.msg)
+
+    # oldest request a frame with this key would complete, so a decoder can see its context before feed()
+    def waiting(self, key):
+        for request in self.pending:
+            if request.key == key:
+                return request
+        return None
+
+    # oldest request a 0x7F is for, matched on the opcode it sent as the device doesn't say more
+    def rejected(self, msg):
+        data = sysex.payload(msg)
+        if len(data) < 2:
+            return None
+        for request in self.pending:
+            if request.msg != None and request.msg[sysex.OPCODE_OFFSET] == data[1]:
+                return request
+        return None
+
+    # every received frame comes through here, returns True when it completed a request
+    # a 0x7F resends the request it rejects straight away, while it has retries left and no later request
+    # waits for the same reply, which would otherwise be answered first and take it
+    def feed(self, msg):
+        if len(msg) > sysex.OPCODE_OFFSET and msg[sysex.OPCODE_OFFSET] == NAK:
+            request = self.rejected(msg)
+            if request == None:
+                return False
+            self.naks += 1
+            overtaken = any(r.key == request.key for r in self.pending[self.pending.index(request) + 1:])
+            if request.attempts <= request.retries and not overtaken:
+                self.resent += 1
+                self.transmit(request)
+            else:
+                self.pending.remove(request)
+                request.future.set_exception(RequestRejected(f"{request.label} rejected by the device after {request.attempts} attempt(s)"))
+            return True
+        key = response_key(msg)
+        for request in self.pending:
+            if request.key == key:
+                self.pending.remove(request)
+                self.record(request)
+                request.future.set_result(msg)
+                return True
+        return False
+
+    def record(self, request):
+        elapsed = self.clock() - request.sent
+        s = self.rtt.setdefault(request.label, [0, 0.0, 0.0])
+        s[0] += 1
+        s[1] += elapsed
+        s[2] = max(s[2], elapsed)
+
+    # expire overdue requests: resend while retries are left, otherwise fail them
+    # failing one runs its callbacks there and then, and they may cancel the others or start new requests
+    def poll(self, now = None):
+        if now == None:
+            now = self.clock()
+        for request in [r for r in self.pending if now >= r.deadline]:
+            if request not in self.pending:
+                continue                # cancelled by a callback of one failed before it
+            if request.attempts <= request.retries:
+                self.resent += 1
+                self.transmit(request)
+            else:
+                self.timeouts += 1
+                self.pending.remove(request)
+                request.future.set_exception(RequestTimeout(f"No response to {request.label} after {request.attempts} attempt(s)"))
+
+    # one request, e.g. an upload's block when the upload is stopped
+    def cancel(self, future, reason = "cancelled"):
+        for request in self.pending:
+            if request.future is future:
+                self.pending.remove(request)
+                request.future.set_exception(RequestCancelled(reason))
+                return
+
+    def cancel_all(self, reason = "cancelled"):
+        pending, self.pending = self.pending, []
+        for request in pending:
+            request.future.set_exception(RequestCancelled(reason))
+
+    def busy(self):
+        return len(self.pending) > 0
+
+    def report(self):
+        lines = [f"{'request':24s} {'count':>7s} {'mean ms':>10s} {'max ms':>10s}"]
+        for label, (count, total, worst) in self.rtt.items():
+            lines.append(f"{label:24s} {count:7d} {total * 1000 / count:10.2f} {worst * 1000:10.2f}")
+        lines.append(f"resent {self.resent}, rejected {self.naks}, timed out {self.timeouts}")
+        return "\n".join(lines)
+
+# runs a generator that yields Futures: it is resumed with each result, or the exception is raised inside it
+# Task.future completes with the generator's return value
+class Task:
+
+    def __init__(self, generator, label = None):
+        self.generator = generator
+        self.future = Future(label)
+        self.waiting = None
+        self.step(None, None)
+
+    def step(self, value, exception):
+        try:
+            if exception != None:
+                awaited = self.generator.throw(exception)
+            else:
+                awaited = self.generator.send(value)
+        except StopIteration as e:
+            self.future.set_result(e.value)
+            return
+        except Exception as e:
+            self.future.set_exception(e)
+            return
+
+        if self.future.done:        # cancelled from inside the generator
+            self.generator.close()
+            return
+        self.waiting = awaited
+        awaited.add_done_callback(self.wakeup)
+
+    def wakeup(self, future):
+        if future is not self.waiting or self.future.done:
+            return
+        self.waiting = None
+        self.step(future.result, future.exception)
+
+    def running(self):
+        return not self.future.done
+
+    def cancel(self):
+        if self.future.done:
+            return
+        self.waiting = None
+        if not self.generator.gi_running:
+            self.generator.close()
+        self.future.set_exception(RequestCancelled("task cancelled"))
+
+if __name__ == "__main__":
+    # checks against a clock that only moves when told to and a unit that never answers
+    class Clock:
+        def __init__(self):
+            self.now = 0.0
+        def __call__(self):
+            return self.now
+
+    # a task that gives up on the rest when one request times out, as a sync does; its callback runs inside poll()
+    clock = Clock()
+    sent = []
+    session = Correlator(sent.append, timeout = 1.0, clock = clock)
+    def abandon():
+        try:
+            yield session.request([0x05], 0x06, retries = 0)
+        except RequestTimeout:
+            session.cancel_all("abandoned")
+    task = Task(abandon())
+    later = [session.request([0x12], 0x13, retries = 1), session.request([0x20], 0x21, retries = 0)]
+    clock.now = 2.0
+    session.poll()
+    assert task.future.done and task.future.exception == None
+    assert all(isinstance(future.exception, RequestCancelled) for future in later), [f.exception for f in later]
+    assert sent == [[0x05], [0x12], [0x20]] and session.resent == 0 and not session.busy(), (sent, session.resent)
+    print("cancel from a callback during poll: ok")
+
+    # a unit that doesn't answer a pipelined batch: its requests, none retried, all expire in one poll(); the first
+    # to fail abandons the rest and the same requests go one at a time, as GNX1.sync_steps falls back to serial
+    clock = Clock()
+    sent = []
+    session = Correlator(sent.append, timeout = 1.0, clock = clock)
+    codes = [(0x05, 0x06), (0x07, 0x08), (0x12, 0x13), (0x12, 0x13), (0x20, 0x21)]
+    def sync():
+        batch = [session.request([code], key, retries = 0) for code, key in codes]
+        try:
+            for future in batch:
+                yield future
+        except RequestTimeout:
+            session.cancel_all("pipeline abandoned")
+            for code, key in codes:
+                yield session.request([code], key)
+            return "serial"
+        return "pipelined"
+    task = Task(sync())
+    clock.now = 2.0
+    session.poll()
+    assert len(sent) == len(codes) + 1 and session.timeouts == 1 and session.resent == 0, (sent, session.timeouts, session.resent)
+    while not task.future.done:         # the unit answers each serial request
+        code = sent[-1][0]
+        session.feed([0xF0, 0x00, 0x00, 0x10, 0x00, 0x56, dict(codes)[code], 0x00, 0x01, 0x00, 0xF7])
+    assert task.future.result == "serial" and len(sent) == 2 * len(codes) and not session.busy(), (task.future.exception, sent)
+    print("pipelined batch not answered, serial fallback: ok")
+
@@ -17,37 +17,66 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import rtmidi
 import common
 import settings
 import time
+import os
+from MIDIRecorder import MIDIRecorder, DIRECTION_IN, DIRECTION_OUT
+from MIDIQueue import MIDIInputQueue, MIDISendScheduler
+from MIDITransport import create_transport
 
 from PySide6.QtUiTools import QUiLoader
 from PySide6.QtWidgets import QComboBox, QLabel, QSpinBox
-from PySide6.QtCore import QFile, QIODevice, Qt, Signal, QObject
+from PySide6.QtCore import QFile, QIODevice, Qt, Signal, QObject, QTimer
 
 class MIDIControl:
 
-    port_in = None
-    port_out = None
+    transport = None
     midi_input = None
     midi_output = None
     registered_input_targets = None
     registered_ports_open_targets = None
     registered_ports_closed_targets = None
+    registered_output_targets = None
+    input_queue = None
+    drain_timer = None
+    drain_interval = 5          # ms between drains of the input queue
+    drain_batch_size = 64       # maximum messages processed per drain
+    send_scheduler = None
+    recorder = None
 
     def __init__(self, window):
         self.window = window
         self.registered_input_targets = []
         self.registered_ports_open_targets = []
         self.registered_ports_closed_targets = []
+        self.registered_output_targets = []
 
-        self.port_in = rtmidi.MidiIn()
-        self.port_in.ignore_types(sysex = False, timing = True, active_sense = True)
-        self.port_out = rtmidi.MidiOut()
+        midiconfig = common.GNXEDIT_CONFIG["midi"]
+        self.input_queue = MIDIInputQueue(midiconfig.get("input_queue_size"))
+        self.drain_batch_size = midiconfig.get("input_batch_size", self.drain_batch_size)
 
-        innames = self.port_in.get_ports()
-        outnames = self.port_out.get_ports()
+        # input is handed from the transport thread to the main thread through the queue
+        self.drain_timer = QTimer()
+        self.drain_timer.setInterval(self.drain_interval)
+        self.drain_timer.timeout.connect(self.drain)
+
+        # output is written by the scheduler thread so callers never block
+        spacing = midiconfig.get("send_spacing_ms")
+        self.send_scheduler = MIDISendScheduler(self.write_message, None if spacing == None else spacing / 1000)
+
+        # rtmidi by default, options for the other backends are kept in a section of the same name
+        name = midiconfig.get("transport", "rtmidi")
+        self.transport = create_transport(name, **midiconfig.get(name, {}))
+
+        # session recording of every frame in and out
+        logconfig = common.GNXEDIT_CONFIG.get("logging", {})
+        if logconfig.get("enabled", False):
+            self.start_recording(logconfig.get("file"))
+        common.APPLICATION.aboutToQuit.connect(self.stop_recording)
+
+        innames = self.transport.input_names()
+        outnames = self.transport.output_names()
 
         # check midi input is valid
         p = 0
@@ -62,7 +91,7 @@ class MIDIControl:
         if not valid:       # look for USB input
             p = 0
             for  n in innames:
-                if n.startswith("USB"):
+                if n.startswith(self.transport.port_prefix):
                     common.GNXEDIT_CONFIG["midi"]["input"] = {"index": p, "name": n}
                     valid = True
                     break
@@ -84,7 +113,7 @@ class MIDIControl:
         if not valid:       # look for USB output
             p = 0
             for  n in outnames:
-                if n.startswith("USB"):
+                if n.startswith(self.transport.port_prefix):
                     common.GNXEDIT_CONFIG["midi"]["output"] = {"index": p, "name": n}
                     valid = True
                     break
@@ -96,28 +125,14 @@ class MIDIControl:
 
         settings.save_settings()
 
-    # creates and compares checksum
-    def sysex_checksum(self, msg):
-        cx = 0
-        i = 1
-        while i < len(msg) - 2:
-            cx = cx ^ msg[i]
-            i += 1
-
-        return cx, (cx == msg[i])
-
     # close all ports
     def close_ports(self):
-        # close ports if open
-        if self.port_in != None:
-            if self.port_in.is_port_open():
-                self.port_in.close_port()
-                del self.port_in
+        self.drain_timer.stop()
+        self.input_queue.clear()
+        self.send_scheduler.stop()
 
-        if self.port_out != None:
-            if self.port_out.is_port_open():
-                self.port_out.close_port()
-                del self.port_out
+        self.transport.close_input()
+        self.transport.close_output()
 
         for t in self.registered_ports_closed_targets:
             result = t()
@@ -126,23 +141,17 @@ class MIDIControl:
     def open_ports(self):
         self.close_ports()
 
-        if self.port_in == None:
-            self.port_in = rtmidi.MidiIn()
-            self.port_in.ignore_types(sysex = False, timing = True, active_sense = True)
-
-        if self.port_out == None:   
-            self.port_out = rtmidi.MidiOut()
-
-        if self.port_in != None and common.GNXEDIT_CONFIG["midi"]["input"]["index"] != None:
-            self.port_in.open_port(common.GNXEDIT_CONFIG["midi"]["input"]["index"])
-            self.port_in.set_callback(self.input_callback)
+        if common.GNXEDIT_CONFIG["midi"]["input"]["index"] != None:
+            self.transport.open_input(common.GNXEDIT_CONFIG["midi"]["input"]["index"], self.input_callback)
+            self.drain_timer.start()
 
-        if self.port_out != None and common.GNXEDIT_CONFIG["midi"]["output"]["index"] != None:
-            self.port_out.open_port(common.GNXEDIT_CONFIG["midi"]["output"]["index"])
+        if common.GNXEDIT_CONFIG["midi"]["output"]["index"] != None:
+            self.transport.open_output(common.GNXEDIT_CONFIG["midi"]["output"]["index"])
+            self.send_scheduler.start()
         
-        if self.port_in == None or not self.port_in.is_port_open():
+        if not self.transport.input_open():
             raise Exception("Unable to open MIDI input port")
-        if self.port_out == None or not self.port_out.is_port_open():
+        if not self.transport.output_open():
             raise Exception("Unable to open MIDI output port")
         
         for t in self.registered_ports_open_targets:
@@ -162,6 +171,14 @@ class MIDIControl:
         else:
             raise Exception("Target not specified")        
             
+    # told about every message as it is queued for sending, on the caller's thread
+    def register_output_target(self, target = None, **kwargs):
+        if target != None:
+            if target not in self.registered_output_targets:
+                self.registered_output_targets.append(target)
+        else:
+            raise Exception("Target not specified")
+
     def register_ports_open(self, target = None, **kwargs):
         if target != None:
             if target not in self.registered_ports_open_targets:
@@ -176,36 +193,58 @@ class MIDIControl:
         else:
             raise Exception("Target not specified") 
 
-    def input_callback(self, event, data = None):
-        message, deltatime = event
-        # print("Received", message)
-        # call all registered targets to receive input events
-        # check for sysex
-        if message[0] == 0xF0:
-            cx, ok = self.sysex_checksum(message)
-            if ok:
-                for t in self.registered_input_targets:
-                    result = t(message)
-            else:
-                #raise Exception("System Exclusive checksum error")
-                print(f"System Exclusive checksum error: received {message[-2]:02X} expected {cx:02X}")
-            
-        else:
-            print("MIDI message: ", message)
+    # runs on the transport thread: timestamp, validate and queue only
+    def input_callback(self, message):
+        if self.recorder != None:
+            self.recorder.record(DIRECTION_IN, message)
+        self.input_queue.put(message)
+
+    # runs on the main thread from drain_timer
+    def drain(self):
+        for timestamp, message in self.input_queue.get_batch(self.drain_batch_size):
+            # call all registered targets to receive input events
+            if message[0] != 0xF0:
+                print("MIDI message: ", message)
             for t in self.registered_input_targets:
                 result = t(message)
-            pass    # process other messages (e.g. patch change)
-
-    def send_message(self, msg):
-        if self.port_out != None:
-            if self.port_out.is_port_open():
-                #print("Sending", msg)
-                self.port_out.send_message(msg)
-               
-            else:
-                raise Exception("MIDI output port not open for sending message")
+
+    def input_stats(self):
+        return self.input_queue.stats()
+
+    # queue message for the scheduler and return immediately with its number in the queue
+    def send_message(self, msg, priority = common.SEND_PRIORITY_STATE):
+        if self.transport.output_open():
+            #print("Sending", msg)
+            number = self.send_scheduler.send_message(msg, priority)
+            for t in self.registered_output_targets:
+                t(msg)
+            return number
         else:
-            raise Exception("MIDI output port not open")
+            raise Exception("MIDI output port not open for sending message")
+
+    # called on the scheduler thread
+    def write_message(self, msg):
+        if self.transport.output_open():
+            self.transport.send(msg)
+            if self.recorder != None:
+                self.recorder.record(DIRECTION_OUT, msg)
+
+    def output_stats(self):
+        return self.send_scheduler.stats()
+
+    # record to file, or to a time stamped log in the settings directory
+    def start_recording(self, file = None):
+        self.stop_recording()
+        if file == None:
+            file = os.path.join(common.GNXEDIT_CONFIG_PATH, time.strftime("GNXEdit-%Y%m%d-%H%M%S.gnxlog"))
+        self.recorder = MIDIRecorder(file)
+        print(f"Recording MIDI to {file}")
+
+    def stop_recording(self):
+        if self.recorder != None:
+            recorder = self.recorder
+            self.recorder = None
+            recorder.close()
 
     def openMIDIDialog(self):
             ui_file_name = "src/ui/mididialog.ui"
@@ -219,7 +258,7 @@ class MIDIControl:
 
             ui_file.close()
             inputCB = self.midi_dialog.findChild(QComboBox, "inputComboBox")
-            innames = self.port_in.get_ports()
+            innames = self.transport.input_names()
             p = 0
             mp = common.GNXEDIT_CONFIG["midi"]["input"]
             for  n in innames:
@@ -230,7 +269,7 @@ class MIDIControl:
                 p += 1
 
             outputCB = self.midi_dialog.findChild(QComboBox, "outputComboBox")
-            outnames = self.port_out.get_ports()
+            outnames = self.transport.output_names()
             p = 0
             mp = common.GNXEDIT_CONFIG["midi"]["output"]
             for  n in outnames:
@@ -0,0 +1,115 @@
+# MIDIDispatch.py
+#
+# GNXEdit system exclusive dispatch table
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+
+from stats import Histograms, DECODER_BUCKETS_US
+
+# message classes, byte 4 of a frame
+NON_REALTIME = 0x7E         # universal non-realtime (device enquiry and response)
+REALTIME = 0x7F             # device messages, addressed to our channel or to all channels (0x7F)
+
+# handler options
+#   connected   only called once the device is connected, dropped silently before that
+#   broadcast   also called for frames addressed to all channels, otherwise only for our channel
+class MIDIHandler:
+
+    def __init__(self, function, connected = True, broadcast = False):
+        self.function = function
+        self.connected = connected
+        self.broadcast = broadcast
+        self.name = getattr(function, "__name__", repr(function))
+        self.count = 0
+        self.elapsed = 0.0      # seconds spent in function
+        self.histogram = None   # microseconds per call, set by the dispatcher
+
+    def __call__(self, msg):
+        start = time.perf_counter()
+        try:
+            return self.function(msg)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.elapsed += elapsed
+            self.count += 1
+            if self.histogram != None:
+                self.histogram.record(elapsed * 1000000)
+
+# marks a method as the handler for (message class, opcode), picked up by MIDIDispatcher.bind()
+def handles(message_class, opcode, **options):
+    def decorator(function):
+        if not hasattr(function, "midi_handles"):
+            function.midi_handles = []
+        function.midi_handles.append((message_class, opcode, options))
+        return function
+    return decorator
+
+class MIDIDispatcher:
+
+    def __init__(self):
+        self.handlers = {}
+        self.unhandled = {}     # (message class, opcode): count of frames nobody handled
+        self.timings = Histograms(DECODER_BUCKETS_US, "us")    # kept across reset_stats(), for the status bar
+
+    # register every method of owner decorated with @handles
+    def bind(self, owner):
+        for name in dir(type(owner)):
+            function = getattr(type(owner), name, None)
+            for message_class, opcode, options in getattr(function, "midi_handles", []):
+                self.register(message_class, opcode, getattr(owner, name), **options)
+
+    # plugins register here, e.g. dispatcher.register(REALTIME, 0x0A, my_decoder), replacing any existing handler
+    def register(self, message_class, opcode, function, **options):
+        handler = MIDIHandler(function, **options)
+        handler.histogram = self.timings.histogram(f"{message_class:02X}:{opcode:02X} {handler.name}")
+        self.handlers[(message_class, opcode)] = handler
+        return handler
+
+    def unregister(self, message_class, opcode):
+        self.handlers.pop((message_class, opcode), None)
+
+    # O(1) lookup, returns None (and counts the frame as unhandled) when nothing is registered
+    def lookup(self, message_class, opcode):
+        handler = self.handlers.get((message_class, opcode))
+        if handler == None:
+            key = (message_class, opcode)
+            self.unhandled[key] = self.unhandled.get(key, 0) + 1
+        return handler
+
+    def reset_stats(self):
+        for handler in self.handlers.values():
+            handler.count = 0
+            handler.elapsed = 0.0
+        self.unhandled = {}
+
+    # {"7F:24": {"handler": "decode24", "count": n, "total_ms": t, "mean_us": m}, ...} busiest first
+    def stats(self):
+        result = {}
+        for (message_class, opcode), handler in sorted(self.handlers.items(), key = lambda item: -item[1].elapsed):
+            if handler.count > 0:
+                result[f"{message_class:02X}:{opcode:02X}"] = {"handler": handler.name, "count": handler.count,
+                    "total_ms": handler.elapsed * 1000, "mean_us": handler.elapsed * 1000000 / handler.count}
+        return result
+
+    def report(self):
+        lines = [f"{'code':6s} {'handler':20s} {'count':>7s} {'total ms':>10s} {'mean us':>10s}"]
+        for code, s in self.stats().items():
+            lines.append(f"{code:6s} {s['handler']:20s} {s['count']:7d} {s['total_ms']:10.2f} {s['mean_us']:10.1f}")
+        for (message_class, opcode), count in sorted(self.unhandled.items()):
+            lines.append(f"{message_class:02X}:{opcode:02X} {'(unhandled)':20s} {count:7d}")
+        return "\n".join(lines)
@@ -0,0 +1,302 @@
+# MIDIQueue.py
+#
+# GNXEdit MIDI message queues
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+from collections import deque
+
+import common
+import sysex
+
+# bounded hand-off between the MIDI reader thread and the Qt main thread
+# the reader only timestamps, validates and queues frames, everything else happens in drain()
+class MIDIInputQueue:
+
+    default_capacity = 1024
+
+    def __init__(self, capacity = None):
+        self.capacity = capacity if capacity != None else self.default_capacity
+        self.lock = threading.Lock()
+        self.buffer = deque()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.received = 0           # frames accepted from the reader
+            self.delivered = 0          # frames handed to the main thread
+            self.dropped = 0            # frames discarded because the queue was full
+            self.checksum_errors = 0    # system exclusive frames failing checksum
+            self.high_water = 0         # deepest the queue has been
+            self.latency_total = 0.0    # summed time between receipt and delivery
+            self.latency_max = 0.0
+
+    # called from the reader thread: returns False if the frame was rejected
+    def put(self, message, timestamp = None):
+        if timestamp == None:
+            timestamp = time.monotonic()
+
+        message = bytes(message)
+        if len(message) > 0 and message[0] == 0xF0:
+            cx, ok = sysex.verify(message)
+            if not ok:
+                with self.lock:
+                    self.checksum_errors += 1
+                print(f"System Exclusive checksum error: received {message[-2]:02X} expected {cx:02X}")
+                return False
+
+        with self.lock:
+            if len(self.buffer) >= self.capacity:
+                self.buffer.popleft()       # ring buffer: oldest frame is overwritten
+                self.dropped += 1
+            self.buffer.append((timestamp, message))
+            self.received += 1
+            if len(self.buffer) > self.high_water:
+                self.high_water = len(self.buffer)
+
+        return True
+
+    # called from the main thread: remove up to limit frames as (timestamp, message) pairs
+    def get_batch(self, limit = None):
+        batch = []
+        with self.lock:
+            n = len(self.buffer) if limit == None else min(limit, len(self.buffer))
+            for i in range(n):
+                batch.append(self.buffer.popleft())
+
+        if len(batch) > 0:
+            now = time.monotonic()
+            with self.lock:
+                self.delivered += len(batch)
+                for timestamp, message in batch:
+                    latency = now - timestamp
+                    self.latency_total += latency
+                    if latency > self.latency_max:
+                        self.latency_max = latency
+
+        return batch
+
+    def clear(self):
+        with self.lock:
+            self.buffer.clear()
+
+    def depth(self):
+        with self.lock:
+            return len(self.buffer)
+
+    def stats(self):
+        with self.lock:
+            return {"depth": len(self.buffer), "capacity": self.capacity, "high_water": self.high_water,
+                    "received": self.received, "delivered": self.delivered, "dropped": self.dropped,
+                    "checksum_errors": self.checksum_errors,
+                    "latency_avg_ms": (self.latency_total / self.delivered * 1000) if self.delivered > 0 else 0.0,
+                    "latency_max_ms": self.latency_max * 1000}
+
+# outbound scheduler: send_message() returns immediately and a single writer thread
+# transmits queued messages in priority order with a minimum spacing between them
+# a lane is sent in the order queued; a message only goes ahead of those in a later lane, so anything whose order
+# matters to the unit belongs in one lane (common.SEND_PRIORITY_STATE)
+class MIDISendScheduler:
+
+    default_spacing = 0.005     # seconds between consecutive messages
+    rate_window = 1.0           # seconds over which the achieved send rate is measured
+    stop_timeout = 1.0          # seconds stop() waits for queued messages to go out
+
+    def __init__(self, send_function, spacing = None, lanes = 2):
+        self.send_function = send_function
+        self.spacing = spacing if spacing != None else self.default_spacing
+        self.condition = threading.Condition()
+        self.lanes = [deque() for x in range(lanes)]
+        self.thread = None
+        self.running = False
+        self.last_send = 0.0
+        self.sequence = 0           # number of the last message queued, every message numbered in turn
+        self.in_flight = None       # number of the message being written
+        self.last_failure = 0       # number of the last message that failed or was discarded
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.condition:
+            self.queued = 0
+            self.sent = 0
+            self.errors = 0
+            self.discarded = 0          # still queued when stop() gave up waiting
+            self.latency_total = 0.0
+            self.latency_max = 0.0
+            self.recent = deque()       # send times within rate_window
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target = self.run, name = "MIDISendScheduler", daemon = True)
+        self.thread.start()
+
+    # stop the writer thread once what is queued has gone out, discarding whatever is left after timeout
+    def stop(self, timeout = None):
+        if self.thread != None and self.thread is not threading.current_thread():
+            self.flush(self.stop_timeout if timeout == None else timeout)
+        with self.condition:
+            self.running = False
+            for lane in self.lanes:
+                self.discarded += len(lane)
+                if len(lane) > 0:
+                    self.last_failure = max(self.last_failure, max(item[1] for item in lane))
+                lane.clear()
+            self.condition.notify_all()
+
+        if self.thread != None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    # queue a message for sending, lane 0 has the highest priority; returns its number
+    def send_message(self, msg, priority = common.SEND_PRIORITY_STATE):
+        priority = max(0, min(priority, len(self.lanes) - 1))
+        with self.condition:
+            self.sequence += 1
+            self.lanes[priority].append((time.monotonic(), self.sequence, msg))
+            self.queued += 1
+            self.condition.notify()
+            return self.sequence
+
+    # every message up to number has been written (or failed, see last_failure)
+    def sent_through(self, number):
+        with self.condition:
+            if self.in_flight != None and self.in_flight <= number:
+                return False
+            return all(len(lane) == 0 or lane[0][1] > number for lane in self.lanes)
+
+    def pending(self):
+        with self.condition:
+            return sum(len(lane) for lane in self.lanes)
+
+    # wait until everything queued so far has been sent (or timeout)
+    def flush(self, timeout = None):
+        deadline = None if timeout == None else time.monotonic() + timeout
+        with self.condition:
+            while self.running and any(len(lane) > 0 for lane in self.lanes):
+                remaining = None if deadline == None else deadline - time.monotonic()
+                if remaining != None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def next_message(self):
+        for lane in self.lanes:
+            if len(lane) > 0:
+                return lane.popleft()
+        return None
+
+    # writer thread
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not any(len(lane) > 0 for lane in self.lanes):
+                    self.condition.wait()
+                if not self.running:
+                    return
+
+                # honour spacing, but let a keep-alive arriving meanwhile go first
+                wait = self.last_send + self.spacing - time.monotonic()
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+
+                queued_at, number, msg = self.next_message()
+                self.in_flight = number
+
+            try:
+                self.send_function(msg)
+                ok = True
+            except Exception as e:
+                print(f"MIDI send failed {e}")
+                ok = False
+
+            now = time.monotonic()
+            with self.condition:
+                self.last_send = now
+                self.in_flight = None
+                if ok:
+                    self.sent += 1
+                    latency = now - queued_at
+                    self.latency_total += latency
+                    if latency > self.latency_max:
+                        self.latency_max = latency
+                    self.recent.append(now)
+                else:
+                    self.errors += 1
+                    self.last_failure = number
+                self.condition.notify_all()     # wake flush()
+
+    def stats(self):
+        now = time.monotonic()
+        with self.condition:
+            while len(self.recent) > 0 and now - self.recent[0] > self.rate_window:
+                self.recent.popleft()
+            return {"pending": [len(lane) for lane in self.lanes], "queued": self.queued, "sent": self.sent,
+                    "errors": self.errors, "discarded": self.discarded, "spacing_ms": self.spacing * 1000,
+                    "latency_avg_ms": (self.latency_total / self.sent * 1000) if self.sent > 0 else 0.0,
+                    "latency_max_ms": self.latency_max * 1000,
+                    "rate_per_second": len(self.recent) / self.rate_window}
+
+# keeps only the latest pending value per key until flushed
+# used to collapse dial drags into one message per parameter per flush
+class MIDICoalescer:
+
+    def __init__(self, flush_function):
+        self.flush_function = flush_function    # called as flush_function(key, value)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.submitted = 0      # updates received
+            self.flushed = 0        # updates actually passed on
+
+    def update(self, key, value):
+        with self.lock:
+            # re-insert so that flush order follows the order of the most recent changes
+            self.pending.pop(key, None)
+            self.pending[key] = value
+            self.submitted += 1
+
+    def has_pending(self):
+        with self.lock:
+            return len(self.pending) > 0
+
+    def discard(self):
+        with self.lock:
+            self.pending = {}
+
+    def flush(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+            self.flushed += len(pending)
+
+        for key, value in pending.items():
+            self.flush_function(key, value)
+
+        return len(pending)
+
+    def stats(self):
+        with self.lock:
+            return {"pending": len(self.pending), "submitted": self.submitted, "flushed": self.flushed,
+                    "reduction": (self.submitted / self.flushed) if self.flushed > 0 else 0.0}
@@ -0,0 +1,187 @@
+# MIDIRecorder.py
+#
+# GNXEdit MIDI session recorder and replayer
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import struct
+import threading
+import time
+
+# log file layout:
+#   header  MAGIC, start time (unix seconds, double)
+#   records timestamp (microseconds from start, uint64), direction (uint8), length (uint16), message bytes
+#   index   opcode (uint8), count (uint32), record offsets (uint32 * count) ... repeated
+#   trailer index offset (uint64), INDEX_MAGIC
+# a log without a trailer (recorder not closed) is still readable, the index is rebuilt by scanning
+
+MAGIC = b"GNXLOG1\x00"
+INDEX_MAGIC = b"GNXIDX1\x00"
+HEADER = struct.Struct("<8sd")
+RECORD = struct.Struct("<QBH")
+TRAILER = struct.Struct("<Q8s")
+
+DIRECTION_IN = 0        # device to GNXEdit
+DIRECTION_OUT = 1       # GNXEdit to device
+
+NO_OPCODE = 0xFF        # index key for anything that is not a GNX1 system exclusive frame
+
+def opcode(message):
+    return message[6] if len(message) > 7 and message[0] == 0xF0 else NO_OPCODE
+
+class MIDIRecorder:
+
+    def __init__(self, file):
+        self.file = file
+        self.lock = threading.Lock()
+        self.f = open(file, "wb")
+        self.started = time.monotonic()
+        self.f.write(HEADER.pack(MAGIC, time.time()))
+        self.offset = HEADER.size
+        self.index = {}
+        self.recorded = 0
+
+    # thread safe: inbound frames arrive on the transport thread, outbound on the scheduler thread
+    def record(self, direction, message, timestamp = None):
+        if timestamp == None:
+            timestamp = time.monotonic()
+        data = bytes(message)
+        with self.lock:
+            if self.f == None:
+                return
+            self.index.setdefault(opcode(data), []).append(self.offset)
+            self.f.write(RECORD.pack(max(0, int((timestamp - self.started) * 1000000)), direction, len(data)))
+            self.f.write(data)
+            self.offset += RECORD.size + len(data)
+            self.recorded += 1
+
+    def close(self):
+        with self.lock:
+            if self.f == None:
+                return
+            index_offset = self.offset
+            for code, offsets in sorted(self.index.items()):
+                self.f.write(struct.pack(f"<BI{len(offsets)}I", code, len(offsets), *offsets))
+            self.f.write(TRAILER.pack(index_offset, INDEX_MAGIC))
+            self.f.close()
+            self.f = None
+
+class MIDILog:
+
+    def __init__(self, file):
+        self.file = file
+        with open(file, "rb") as f:
+            self.data = f.read()
+
+        if len(self.data) < HEADER.size:
+            raise Exception(f"{file} is not a GNXEdit MIDI log")
+        magic, self.start_time = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise Exception(f"{file} is not a GNXEdit MIDI log")
+
+        self.end = len(self.data)
+        self.index = None
+        if len(self.data) >= HEADER.size + TRAILER.size:
+            index_offset, magic = TRAILER.unpack_from(self.data, len(self.data) - TRAILER.size)
+            if magic == INDEX_MAGIC:
+                self.end = index_offset
+                self.read_index(index_offset, len(self.data) - TRAILER.size)
+
+        if self.index == None:      # unterminated log
+            self.index = {}
+            for offset, timestamp, direction, message in self.scan():
+                self.index.setdefault(opcode(message), []).append(offset)
+
+    @staticmethod
+    def is_log(file):
+        try:
+            with open(file, "rb") as f:
+                return f.read(len(MAGIC)) == MAGIC
+        except OSError:
+            return False
+
+    def read_index(self, offset, end):
+        self.index = {}
+        while offset < end:
+            code, count = struct.unpack_from("<BI", self.data, offset)
+            offset += 5
+            self.index[code] = list(struct.unpack_from(f"<{count}I", self.data, offset))
+            offset += 4 * count
+
+    def record_at(self, offset):
+        timestamp, direction, length = RECORD.unpack_from(self.data, offset)
+        start = offset + RECORD.size
+        return timestamp / 1000000, direction, self.data[start:start + length]
+
+    # yields (offset, seconds from start, direction, message bytes) in recorded order
+    def scan(self):
+        offset = HEADER.size
+        while offset + RECORD.size <= self.end:
+            timestamp, direction, length = RECORD.unpack_from(self.data, offset)
+            start = offset + RECORD.size
+            if start + length > self.end:
+                break               # truncated final record
+            yield offset, timestamp / 1000000, direction, self.data[start:start + length]
+            offset = start + length
+
+    # (seconds, direction, message) for all frames, or only one direction
+    def frames(self, direction = None):
+        for offset, timestamp, d, message in self.scan():
+            if direction == None or d == direction:
+                yield timestamp, d, message
+
+    # frames with a given opcode, found through the index
+    def by_opcode(self, code):
+        return [self.record_at(offset) for offset in self.index.get(code, [])]
+
+    def opcodes(self):
+        return {code: len(offsets) for code, offsets in sorted(self.index.items())}
+
+# feed a log's frames to target (e.g. GNX1.dispatcher) at recorded pace times speed, speed 0 for as fast as possible
+def replay(log, target, speed = 1.0, direction = DIRECTION_IN):
+    if not isinstance(log, MIDILog):
+        log = MIDILog(log)
+
+    count = 0
+    first = None
+    start = time.perf_counter()
+    for timestamp, d, message in log.frames(direction):
+        if first == None:
+            first = timestamp
+        if speed > 0:
+            wait = start + (timestamp - first) / speed - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+        target(list(message))
+        count += 1
+
+    elapsed = time.perf_counter() - start
+    return {"frames": count, "elapsed_ms": elapsed * 1000, "frames_per_second": count / elapsed if elapsed > 0 else 0.0}
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description = "Show and replay a GNXEdit MIDI log")
+    parser.add_argument("file")
+    parser.add_argument("--speed", type = float, default = 0, help = "replay speed, 1 for recorded pace, 0 for as fast as possible")
+    args = parser.parse_args()
+
+    log = MIDILog(args.file)
+    print(f"{args.file}: recorded {time.ctime(log.start_time)}")
+    for code, count in log.opcodes().items():
+        print(f"  {code:02X}: {count}")
+    result = replay(log, lambda message: None, args.speed)
+    print(f"Replayed {result['frames']} inbound frames in {result['elapsed_ms']:.2f} ms ({result['frames_per_second']:.0f} frames/s)")
@@ -0,0 +1,378 @@
+# MIDITransport.py
+#
+# GNXEdit MIDI transports: interchangeable backends behind MIDIControl
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+
+try:
+    import rtmidi
+except ImportError:
+    rtmidi = None
+
+mido = None         # imported by MidoTransport when first used, it takes longer to load than everything else here
+
+from VirtualGNX1 import VirtualGNX1, VirtualRack, VirtualMidiIn, VirtualMidiOut, read_midiox_log
+from MIDIRecorder import MIDILog, DIRECTION_IN
+
+# base class: a transport owns one input and one output port
+# the input callback is called with each complete message, on whatever thread the backend uses
+class MIDITransport:
+
+    name = None
+    port_prefix = "USB"         # ports chosen automatically when the configured port is missing
+
+    def input_names(self):
+        return []
+
+    def output_names(self):
+        return []
+
+    def open_input(self, index, callback):
+        raise Exception(f"{self.name} transport has no input")
+
+    def open_output(self, index):
+        raise Exception(f"{self.name} transport has no output")
+
+    def close_input(self):
+        pass
+
+    def close_output(self):
+        pass
+
+    def input_open(self):
+        return False
+
+    def output_open(self):
+        return False
+
+    def send(self, msg):
+        raise Exception(f"{self.name} transport can not send")
+
+    def close(self):
+        self.close_input()
+        self.close_output()
+
+# python-rtmidi, the default
+class RtMidiTransport(MIDITransport):
+
+    name = "rtmidi"
+
+    def __init__(self, **kwargs):
+        if rtmidi == None:
+            raise Exception("python-rtmidi is not available")
+        self.midi_in_class = rtmidi.MidiIn
+        self.midi_out_class = rtmidi.MidiOut
+        self.create_ports()
+
+    def create_ports(self):
+        self.callback = None
+        self.port_in = self.midi_in_class()
+        self.port_in.ignore_types(sysex = False, timing = True, active_sense = True)
+        self.port_out = self.midi_out_class()
+
+    def input_names(self):
+        return self.port_in.get_ports()
+
+    def output_names(self):
+        return self.port_out.get_ports()
+
+    def open_input(self, index, callback):
+        self.callback = callback
+        self.port_in.open_port(index)
+        self.port_in.set_callback(self.input_callback)
+
+    def open_output(self, index):
+        self.port_out.open_port(index)
+
+    # runs on the rtmidi thread
+    def input_callback(self, event, data = None):
+        message, deltatime = event
+        self.callback(message)
+
+    def close_input(self):
+        if self.port_in.is_port_open():
+            self.port_in.close_port()
+
+    def close_output(self):
+        if self.port_out.is_port_open():
+            self.port_out.close_port()
+
+    def input_open(self):
+        return self.port_in.is_port_open()
+
+    def output_open(self):
+        return self.port_out.is_port_open()
+
+    def send(self, msg):
+        self.port_out.send_message(msg)
+
+# simulated GNX1 through its rtmidi-like ports
+class VirtualTransport(RtMidiTransport):
+
+    name = "virtual"
+    port_prefix = VirtualGNX1.port_name
+
+    # channels: more than one gives a rack of units on the one port, as if chained through MIDI thru
+    def __init__(self, latency_ms = 2, jitter_ms = 0, baud = 31250, error_rate = 0.0, drop_rate = 0.0, nak_rate = 0.0, channels = None, **kwargs):
+        options = {"latency": latency_ms / 1000, "jitter": jitter_ms / 1000, "baud": baud,
+                   "error_rate": error_rate, "drop_rate": drop_rate, "nak_rate": nak_rate}
+        if channels != None and len(channels) > 1:
+            self.device = VirtualRack(channels, **options)
+        else:
+            self.device = VirtualGNX1(channel = channels[0] if channels else 0, **options)
+        self.midi_in_class = lambda: VirtualMidiIn(self.device)
+        self.midi_out_class = lambda: VirtualMidiOut(self.device)
+        self.create_ports()
+
+    def close(self):
+        super().close()
+        self.device.close()
+
+# mido, as used by the tools/ scripts
+class MidoTransport(MIDITransport):
+
+    name = "mido"
+
+    def __init__(self, **kwargs):
+        global mido
+        if mido == None:
+            try:
+                import mido
+            except ImportError:
+                raise Exception("mido is not available")
+        self.port_in = None
+        self.port_out = None
+        self.callback = None
+
+    def input_names(self):
+        return mido.get_input_names()
+
+    def output_names(self):
+        return mido.get_output_names()
+
+    def open_input(self, index, callback):
+        self.callback = callback
+        self.port_in = mido.open_input(self.input_names()[index], callback = self.input_callback)
+
+    def open_output(self, index):
+        self.port_out = mido.open_output(self.output_names()[index])
+
+    def input_callback(self, message):
+        if message.type not in ["clock", "active_sensing"]:
+            self.callback(message.bytes())
+
+    def close_input(self):
+        if self.port_in != None:
+            self.port_in.close()
+            self.port_in = None
+
+    def close_output(self):
+        if self.port_out != None:
+            self.port_out.close()
+            self.port_out = None
+
+    def input_open(self):
+        return self.port_in != None and not self.port_in.closed
+
+    def output_open(self):
+        return self.port_out != None and not self.port_out.closed
+
+    def send(self, msg):
+        self.port_out.send(mido.Message.from_bytes(msg))
+
+# in-memory pair: whatever one end sends arrives at the other end's callback on the sender's thread
+class LoopbackTransport(MIDITransport):
+
+    name = "loopback"
+    port_prefix = "Loopback"
+
+    def __init__(self, peer = None, **kwargs):
+        self.peer = peer if peer != None else self     # unpaired: echo back
+        self.callback = None
+        self.is_input_open = False
+        self.is_output_open = False
+        self.sent = 0
+
+    @classmethod
+    def pair(cls):
+        a = cls()
+        b = cls(peer = a)
+        a.peer = b
+        return a, b
+
+    def input_names(self):
+        return ["Loopback"]
+
+    def output_names(self):
+        return ["Loopback"]
+
+    def open_input(self, index, callback):
+        self.callback = callback
+        self.is_input_open = True
+
+    def open_output(self, index):
+        self.is_output_open = True
+
+    def close_input(self):
+        self.is_input_open = False
+
+    def close_output(self):
+        self.is_output_open = False
+
+    def input_open(self):
+        return self.is_input_open
+
+    def output_open(self):
+        return self.is_output_open
+
+    def send(self, msg):
+        self.sent += 1
+        if self.peer.is_input_open and self.peer.callback != None:
+            self.peer.callback(list(msg))
+
+# plays the inbound frames of a GNXEdit log or MIDI-OX capture into the input, at recorded pace scaled by speed (0 = as fast as possible)
+# anything sent is counted and discarded
+class ReplayTransport(MIDITransport):
+
+    name = "replay"
+    port_prefix = "Replay"
+
+    def __init__(self, file = None, speed = 1.0, **kwargs):
+        if file == None:
+            raise Exception("No capture file specified for replay")
+        self.file = file
+        self.speed = speed
+        if MIDILog.is_log(file):
+            self.frames = [(t, list(m)) for t, d, m in MIDILog(file).frames(DIRECTION_IN)]
+        else:
+            self.frames = read_midiox_log(file, timestamps = True)
+        self.callback = None
+        self.thread = None
+        self.stopping = threading.Event()
+        self.is_output_open = False
+        self.sent = 0
+        self.replayed = 0
+        self.finished = threading.Event()
+
+    def input_names(self):
+        return [f"Replay {self.file}"]
+
+    def output_names(self):
+        return ["Replay"]
+
+    def open_input(self, index, callback):
+        self.callback = callback
+        self.stopping.clear()
+        self.finished.clear()
+        self.thread = threading.Thread(target = self.run, name = "ReplayTransport", daemon = True)
+        self.thread.start()
+
+    def run(self):
+        self.replayed = 0
+        if len(self.frames) > 0:
+            first = self.frames[0][0]
+            start = time.monotonic()
+            for stamp, frame in self.frames:
+                if self.speed > 0:
+                    wait = start + (stamp - first) / self.speed - time.monotonic()
+                    if wait > 0 and self.stopping.wait(wait):
+                        break
+                if self.stopping.is_set():
+                    break
+                self.callback(list(frame))
+                self.replayed += 1
+        self.finished.set()
+
+    def close_input(self):
+        self.stopping.set()
+        if self.thread != None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def open_output(self, index):
+        self.is_output_open = True
+
+    def close_output(self):
+        self.is_output_open = False
+
+    def input_open(self):
+        return self.thread != None
+
+    def output_open(self):
+        return self.is_output_open
+
+    def send(self, msg):
+        self.sent += 1
+
+transports = {"rtmidi": RtMidiTransport, "mido": MidoTransport, "virtual": VirtualTransport,
+              "loopback": LoopbackTransport, "replay": ReplayTransport}
+
+# create transport by name with options from the settings
+def create_transport(name = None, **kwargs):
+    if name == None:
+        name = "rtmidi"
+    if name not in transports:
+        raise Exception(f"Unknown MIDI transport {name}")
+    return transports[name](**kwargs)
+
+# latency and throughput of each available backend, driven the same way MIDIControl drives them
+if __name__ == "__main__":
+    import os
+
+    ROUNDS = 200
+    enquiry = [0xF0, 0x00, 0x00, 0x10, 0x7E, 0x7F, 0x01, 0x00, 0x01, 0x00, 0x00, 0x11, 0xF7]
+    status = [0xF0, 0x00, 0x00, 0x10, 0x00, 0x56, 0x05, 0x00, 0x01, 0x42, 0xF7]
+
+    def round_trip(transport, msg, rounds):
+        received = threading.Semaphore(0)
+        transport.open_input(0, lambda m: received.release())
+        transport.open_output(0)
+        times = []
+        for r in range(rounds):
+            start = time.perf_counter()
+            transport.send(msg)
+            if not received.acquire(timeout = 5):
+                raise Exception("No reply")
+            times.append(time.perf_counter() - start)
+        transport.close()
+        times.sort()
+        total = sum(times)
+        print(f"{transport.name:10s} {rounds:6d} round trips  median {times[len(times) // 2] * 1e6:9.1f} us  "
+              f"max {times[-1] * 1e6:9.1f} us  {rounds / total:10.0f} msg/s")
+
+    round_trip(LoopbackTransport(), status, ROUNDS * 50)
+    round_trip(VirtualTransport(latency_ms = 0, baud = 0), status, ROUNDS)
+    round_trip(create_transport("virtual"), enquiry, 10)
+
+    capture = os.path.abspath(os.path.join(os.path.dirname(__file__), "../documents/MIDILog1.txt"))
+    replay = ReplayTransport(file = capture, speed = 0)
+    count = [0]
+    start = time.perf_counter()
+    replay.open_input(0, lambda m: count.__setitem__(0, count[0] + 1))
+    replay.finished.wait()
+    elapsed = time.perf_counter() - start
+    replay.close()
+    print(f"{replay.name:10s} {count[0]:6d} frames replayed in {elapsed * 1000:.2f} ms")
+
+    for name in ["rtmidi", "mido"]:
+        try:
+            transport = create_transport(name)
+            print(f"{name:10s} inputs {transport.input_names()} outputs {transport.output_names()}")
+        except Exception as e:
+            print(f"{name:10s} unavailable: {e}")
@@ -0,0 +1,545 @@
+# VirtualGNX1.py
+#
+# GNXEdit simulated Digitech GNX1 for testing without hardware
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import heapq
+import os
+import random
+import re
+import threading
+import time
+
+import sysex
+import patchschema
+from customwidgets.factory import factory_patch_names
+from customwidgets.utils import getnum
+
+# default capture of a full GNX1 start up, see documents/
+DEFAULT_CAPTURE = os.path.abspath(os.path.join(os.path.dirname(__file__), "../documents/MIDILog1.txt"))
+
+# read system exclusive frames from a MIDI-OX log ("SYSX:" lines)
+# with timestamps = True returns (seconds, frame) pairs using the log's hex millisecond timestamps
+def read_midiox_log(path, timestamps = False):
+    frames = []
+    frame = None
+    stamp = 0.0
+    started = 0.0
+    with open(path, "r", errors = "replace") as f:
+        for line in f:
+            m = re.match(r"\s*([0-9A-Fa-f]{8})\s+\d+\s+\d+\s+\S+\s+Buffer:", line)
+            if m != None:
+                stamp = int(m.group(1), 16) / 1000
+                continue
+            m = re.search(r"SYSX:\s*(.*)", line)
+            if m == None:
+                continue
+            for token in m.group(1).split():
+                try:
+                    b = int(token, 16)
+                except ValueError:
+                    continue
+                if b == 0xF0:
+                    frame = [b]
+                    started = stamp
+                elif frame != None:
+                    frame.append(b)
+                    if b == 0xF7:
+                        frames.append((started, frame) if timestamps else frame)
+                        frame = None
+    return frames
+
+# simulated GNX1: answers requests with captured frames after a configurable delay
+# host frames arrive through VirtualMidiOut, replies leave through VirtualMidiIn
+class VirtualGNX1:
+
+    port_name = "Virtual GNX1"
+    mnfr_id = [0x00, 0x00, 0x10]
+    device_id = 0x56
+    patch_count = 48
+    shared_device = None
+
+    dump_blocks = ["3C06", "3D07", "3C08", "3D09"]  # order of the 0x2A blocks in a dump
+
+    def __init__(self, channel = 0, latency = 0.002, jitter = 0.0, baud = 31250, error_rate = 0.0, drop_rate = 0.0,
+                 nak_rate = 0.0, seed = None, capture = None):
+        self.channel = channel
+        self.latency = latency          # seconds between a request arriving and the reply starting
+        self.jitter = jitter            # +/- seconds added to latency
+        self.baud = baud                # MIDI wire speed, None or 0 for instant transfer
+        self.error_rate = error_rate    # fraction of replies sent with a bad checksum
+        self.drop_rate = drop_rate      # fraction of replies never sent
+        self.nak_rate = nak_rate        # fraction of requests answered with 0x7F
+        self.random = random.Random(seed)
+
+        self.condition = threading.Condition()
+        self.events = []                # heap of (due, sequence, kind, frame)
+        self.sequence = 0
+        self.thread = None
+        self.running = False
+        self.rx_line_free = 0.0         # time the host to device line is next idle
+        self.tx_line_free = 0.0         # time the device to host line is next idle
+        self.listeners = []             # VirtualMidiIn ports receiving replies
+
+        self.load_capture(capture if capture != None else DEFAULT_CAPTURE)
+        self.reset_stats()
+
+    @classmethod
+    def shared(cls, **kwargs):
+        if cls.shared_device == None:
+            cls.shared_device = cls(**kwargs)
+        return cls.shared_device
+
+    def reset_stats(self):
+        with self.condition:
+            self.received = 0
+            self.sent = 0
+            self.dropped = 0
+            self.corrupted = 0
+            self.naks = 0
+            self.uploads = 0
+            self.opcodes = {}
+
+    def load_capture(self, path):
+        captured = {}
+        blocks = {}
+        for frame in read_midiox_log(path):
+            if len(frame) < 9 or frame[5] != self.device_id:
+                continue
+            code = frame[6]
+            if code == 0x2A:
+                unpacked = sysex.payload(frame)
+                blocks[f"{unpacked[3]:02X}{unpacked[4]:02X}"] = frame
+            elif code in [0x06, 0x08, 0x13, 0x21, 0x22, 0x24, 0x26, 0x28] and code not in captured:
+                captured[code] = frame
+
+        missing = [f"{c:02X}" for c in [0x06, 0x08, 0x13, 0x21, 0x22, 0x24, 0x26, 0x28] if c not in captured] + \
+                  [b for b in self.dump_blocks if b not in blocks]
+        if len(missing) > 0:
+            raise Exception(f"Capture {path} has no frames for {', '.join(missing)}")
+
+        self.status = sysex.payload(captured[0x06])
+        self.ampcab_frame = captured[0x08]
+        self.name_template = sysex.payload(captured[0x21])
+        self.end_frame = captured[0x22]
+
+        names = sysex.payload(captured[0x13])
+        self.user_names = "".join(map(chr, names[2:-1])).split("\x00")[:self.patch_count]
+        self.factory_names = [factory_patch_names.get(n, "      ") for n in range(self.patch_count)]
+
+        self.bank = self.status[10]
+        self.patch = self.status[11]
+
+        # edit buffer holds the current patch as the frames a dump would send
+        self.default_patch = {"24": captured[0x24], "26": captured[0x26], "28": captured[0x28]}
+        self.default_patch.update(blocks)
+        self.patches = {}
+        self.edit_buffer = dict(self.default_patch)
+        self.edit_name = self.patch_name(self.bank, self.patch)
+        self.upload = None
+
+    def patch_name(self, bank, patch):
+        names = self.user_names if bank == 1 else self.factory_names
+        return names[patch] if patch < len(names) else ""
+
+    # re-address a frame to the current channel
+    def rechannel(self, frame):
+        return sysex.rechannel(frame, self.channel)
+
+    def build(self, opcode, data):
+        return sysex.encode(self.channel, self.mnfr_id, self.device_id, opcode, data)
+
+    def ack(self, code):
+        return self.build(0x7E, [0x01, code, 0x00])
+
+    def wire_time(self, frame):
+        return (len(frame) * 10 / self.baud) if self.baud else 0.0
+
+    # host to device: called by VirtualMidiOut.send_message
+    def receive(self, msg):
+        with self.condition:
+            now = time.monotonic()
+            arrived = max(now, self.rx_line_free) + self.wire_time(msg)
+            self.rx_line_free = arrived
+            self.schedule(arrived, "rx", list(msg))
+
+    def schedule(self, due, kind, frame):
+        heapq.heappush(self.events, (due, self.sequence, kind, frame))
+        self.sequence += 1
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target = self.run, name = "VirtualGNX1", daemon = True)
+            self.thread.start()
+        self.condition.notify()
+
+    # device to host: serialise replies on the line after the processing delay
+    def reply(self, frames, arrived):
+        with self.condition:
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            start = arrived + delay
+            for frame in frames:
+                if self.drop_rate > 0 and self.random.random() < self.drop_rate:
+                    self.dropped += 1
+                    continue
+                if self.error_rate > 0 and self.random.random() < self.error_rate:
+                    frame = list(frame)
+                    frame[-2] ^= 0x01
+                    self.corrupted += 1
+                start = max(start, self.tx_line_free) + self.wire_time(frame)
+                self.tx_line_free = start
+                self.schedule(start, "tx", frame)
+
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.events = []
+            self.condition.notify_all()
+        if self.thread != None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and len(self.events) == 0:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                wait = self.events[0][0] - time.monotonic()
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+                due, sequence, kind, frame = heapq.heappop(self.events)
+
+            if kind == "rx":
+                self.reply(self.process(frame), due)
+            else:
+                with self.condition:
+                    self.sent += 1
+                    listeners = list(self.listeners)
+                for port in listeners:
+                    port.deliver(frame)
+
+    # handle one host frame and return the reply frames
+    def process(self, msg):
+        if len(msg) < 9 or msg[0] != 0xF0 or msg[1:4] != self.mnfr_id:
+            return []
+
+        code = msg[6]
+        with self.condition:
+            self.received += 1
+            self.opcodes[code] = self.opcodes.get(code, 0) + 1
+
+        cx, ok = sysex.verify(msg)
+        if not ok or (self.nak_rate > 0 and self.random.random() < self.nak_rate):
+            with self.condition:
+                self.naks += 1
+            return [self.build(0x7F, [0x01, code, 0x00])]
+
+        if msg[4] == 0x7E and code == 0x01:         # device enquiry on all channels
+            return [self.build(0x02, [0x01, self.channel, self.device_id])]
+
+        if msg[4] != self.channel or msg[5] != self.device_id:
+            return []
+
+        unpacked = sysex.payload(msg)
+        match code:
+            case 0x05:                              # status
+                status = list(self.status)
+                status[10] = self.bank
+                status[11] = self.patch
+                return [self.build(0x06, status)]
+
+            case 0x07:                              # amp/cab names
+                return [self.rechannel(self.ampcab_frame)]
+
+            case 0x12:                              # patch names
+                names = self.user_names if unpacked[1] == 1 else self.factory_names
+                data = [0x01, len(names)]
+                for name in names:
+                    data += [ord(c) for c in name] + [0x00]
+                return [self.build(0x13, data)]
+
+            case 0x20:                              # current patch name
+                return [self.name_frame(self.edit_name)]
+
+            case 0x7E:                              # host acknowledge, 0x21 starts the patch dump
+                if len(unpacked) > 1 and unpacked[1] == 0x21:
+                    return self.dump_frames()
+                return []
+
+            case 0x2D:                              # patch change
+                self.bank = unpacked[1]
+                self.patch = unpacked[2]
+                self.edit_buffer = dict(self.patches.get((self.bank, self.patch), self.default_patch))
+                self.edit_name = self.patch_name(self.bank, self.patch)
+                return [self.ack(code)]
+
+            case 0x21:                              # upload: patch name into edit buffer
+                self.upload = {}
+                self.edit_name = "".join(map(chr, unpacked[3:])).split("\x00")[0]
+                return [self.ack(code)]
+
+            case 0x24 | 0x26 | 0x28:                # upload: patch blocks
+                if self.upload != None:
+                    self.upload[f"{code:02X}"] = msg
+                elif code == 0x26:                  # expression or LFO edited
+                    self.edit_buffer["26"] = msg
+                return [self.ack(code)]
+
+            case 0x2A:                              # upload: amp/cab blocks
+                if self.upload != None:
+                    self.upload[f"{unpacked[3]:02X}{unpacked[4]:02X}"] = msg
+                return [self.ack(code)]
+
+            case 0x22:                              # upload: end of patch
+                if self.upload != None:
+                    self.edit_buffer.update(self.upload)
+                    self.upload = None
+                    with self.condition:
+                        self.uploads += 1
+                return [self.ack(code)]
+
+            case 0x2E:                              # save edit buffer with name
+                targetbank = unpacked[3]
+                targetpatch = unpacked[4]
+                name = "".join(map(chr, unpacked[5:])).split("\x00")[0]
+                if targetbank == 1 and targetpatch < len(self.user_names):
+                    self.user_names[targetpatch] = name
+                    self.patches[(targetbank, targetpatch)] = dict(self.edit_buffer)
+                return [self.ack(code)]
+
+            case 0x2C:                              # parameter change
+                n, value = getnum(4, unpacked)
+                self.parameter_change(unpacked[2], unpacked[3], value)
+                return [self.ack(code)]
+
+            case 0x70 | 0x76:                       # identify, keep alive
+                return [self.ack(code)]
+
+        return []
+
+    # into the edit buffer's dump, left as it was if the dump can't be rebuilt
+    def parameter_change(self, section, parameter, value):
+        s = patchschema.SECTIONS.get(section)
+        if s == None or parameter >= len(s.parameters):
+            return
+        try:
+            dump = patchschema.decode24(self.edit_buffer["24"])
+            values = dump.sections[s.name]
+            values[s.parameters[parameter].name] = value
+            for p in s.layout(values["type"]) or []:
+                values.setdefault(p.name, 0)        # a new type's parameters start at 0
+            self.edit_buffer["24"] = patchschema.encode24(dump, self.channel)
+        except (ValueError, KeyError, IndexError):
+            pass
+
+    def name_frame(self, name):
+        name = (name + "      ")[:6]
+        data = self.name_template[:3] + name.encode("latin-1") + self.name_template[9:]
+        return self.build(0x21, data)
+
+    def dump_frames(self):
+        frames = [self.edit_buffer["24"]] + [self.edit_buffer[b] for b in self.dump_blocks] + \
+                 [self.edit_buffer["26"], self.edit_buffer["28"], self.end_frame]
+        return [self.rechannel(f) for f in frames]
+
+    def add_listener(self, port):
+        with self.condition:
+            if port not in self.listeners:
+                self.listeners.append(port)
+
+    def remove_listener(self, port):
+        with self.condition:
+            if port in self.listeners:
+                self.listeners.remove(port)
+
+    def stats(self):
+        with self.condition:
+            return {"received": self.received, "sent": self.sent, "dropped": self.dropped, "corrupted": self.corrupted,
+                    "naks": self.naks, "uploads": self.uploads, "pending": len(self.events),
+                    "opcodes": {f"{k:02X}": v for k, v in sorted(self.opcodes.items())}}
+
+# several simulated units sharing one port, each on its own channel; every unit sees every host frame
+# (each keeps its own line timing, so replies from different units may overlap more than on a real MIDI thru chain)
+class VirtualRack:
+
+    port_name = VirtualGNX1.port_name
+
+    def __init__(self, channels, **kwargs):
+        self.devices = [VirtualGNX1(channel = channel, **kwargs) for channel in channels]
+
+    def receive(self, msg):
+        for device in self.devices:
+            device.receive(msg)
+
+    def add_listener(self, port):
+        for device in self.devices:
+            device.add_listener(port)
+
+    def remove_listener(self, port):
+        for device in self.devices:
+            device.remove_listener(port)
+
+    def stats(self):
+        return [device.stats() for device in self.devices]
+
+    def close(self):
+        for device in self.devices:
+            device.close()
+
+# rtmidi.MidiIn replacement connected to a VirtualGNX1
+class VirtualMidiIn:
+
+    def __init__(self, device = None):
+        self.device = device if device != None else VirtualGNX1.shared()
+        self.open = False
+        self.callback = None
+        self.callback_data = None
+        self.ignore_sysex = True
+        self.buffer = []
+        self.last_delivery = None
+
+    def get_ports(self):
+        return [self.device.port_name]
+
+    def open_port(self, port = 0, name = None):
+        self.open = True
+        self.device.add_listener(self)
+
+    def is_port_open(self):
+        return self.open
+
+    def close_port(self):
+        self.open = False
+        self.device.remove_listener(self)
+
+    def ignore_types(self, sysex = True, timing = True, active_sense = True):
+        self.ignore_sysex = sysex
+
+    def set_callback(self, func, data = None):
+        self.callback = func
+        self.callback_data = data
+
+    def cancel_callback(self):
+        self.callback = None
+
+    # polling interface when no callback is set
+    def get_message(self):
+        return self.buffer.pop(0) if len(self.buffer) > 0 else None
+
+    # called on the device thread
+    def deliver(self, frame):
+        if not self.open or self.ignore_sysex:
+            return
+        now = time.monotonic()
+        delta = 0.0 if self.last_delivery == None else now - self.last_delivery
+        self.last_delivery = now
+        if self.callback != None:
+            self.callback((list(frame), delta), self.callback_data)
+        else:
+            self.buffer.append((list(frame), delta))
+
+# rtmidi.MidiOut replacement connected to a VirtualGNX1
+class VirtualMidiOut:
+
+    def __init__(self, device = None):
+        self.device = device if device != None else VirtualGNX1.shared()
+        self.open = False
+
+    def get_ports(self):
+        return [self.device.port_name]
+
+    def open_port(self, port = 0, name = None):
+        self.open = True
+
+    def is_port_open(self):
+        return self.open
+
+    def close_port(self):
+        self.open = False
+
+    def send_message(self, msg):
+        if not self.open:
+            raise Exception("Virtual MIDI output port not open")
+        self.device.receive(msg)
+
+# headless run of the sync and upload sequences against the simulated device
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description = "Exercise a simulated GNX1")
+    parser.add_argument("--baud", type = int, default = 31250, help = "wire speed, 0 for instant transfer")
+    parser.add_argument("--latency", type = float, default = 2.0, help = "device latency in ms")
+    parser.add_argument("--jitter", type = float, default = 0.0, help = "latency jitter in ms")
+    parser.add_argument("--rounds", type = int, default = 5, help = "number of sync and upload rounds")
+    args = parser.parse_args()
+
+    device = VirtualGNX1(latency = args.latency / 1000, jitter = args.jitter / 1000, baud = args.baud, seed = 1)
+    port_in = VirtualMidiIn(device)
+    port_out = VirtualMidiOut(device)
+    port_in.ignore_types(sysex = False)
+    port_in.open_port(0)
+    port_out.open_port(0)
+
+    replies = []
+    arrived = threading.Condition()
+    def collect(event, data):
+        with arrived:
+            replies.append(event[0])
+            arrived.notify()
+
+    port_in.set_callback(collect)
+
+    # send a request and wait for count replies
+    def transact(msg, count = 1):
+        with arrived:
+            replies.clear()
+        port_out.send_message(msg)
+        with arrived:
+            if not arrived.wait_for(lambda: len(replies) >= count, timeout = 10):
+                raise Exception(f"No reply to {msg[6]:02X}")
+            return list(replies)
+
+    sync = [([0xF0, 0x00, 0x00, 0x10, 0x7E, 0x7F, 0x01, 0x00, 0x01, 0x00, 0x00, 0x11, 0xF7], 1),
+            (device.build(0x05, [0x01]), 1),
+            (device.build(0x07, [0x01, 0x01]), 1),
+            (device.build(0x12, [0x01, 0x00, 0x00]), 1),
+            (device.build(0x12, [0x01, 0x01, 0x00]), 1),
+            (device.build(0x20, [0x01, 0x02, 0x00, 0x1F]), 1),
+            (device.build(0x7E, [0x01, 0x21]), 8)]
+
+    dump = None
+    start = time.monotonic()
+    for r in range(args.rounds):
+        for msg, count in sync:
+            dump = transact(msg, count)
+    sync_time = (time.monotonic() - start) / args.rounds
+
+    upload = [device.build(0x21, [0x01, 0x02, 0x00] + [ord(c) for c in "UPLOAD"] + [0x00, 0x00, 0x08, 0x09, 0x7C])] + \
+             dump[:7] + [device.build(0x22, [0x01])]
+
+    start = time.monotonic()
+    for r in range(args.rounds):
+        for msg in upload:
+            transact(msg)
+    upload_time = (time.monotonic() - start) / args.rounds
+
+    print(f"Full resync: {sync_time * 1000:.1f} ms, patch upload: {upload_time * 1000:.1f} ms "
+          f"({args.rounds} rounds, baud {args.baud}, latency {args.latency} ms)")
+    print(device.stats())
+    device.close()
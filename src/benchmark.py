@@ -0,0 +1,130 @@
+# benchmark.py
+#
+# GNXEdit micro-benchmarks: sysex codec against the list based functions it replaced
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import timeit
+
+import sysex
+from VirtualGNX1 import read_midiox_log, DEFAULT_CAPTURE
+
+# list versions as they were in GNX1.py and customwidgets/utils.py
+def list_unpack(pint):
+    unpacked = []
+    block = 0
+    mask = 0b10000000
+    n = 0
+
+    while (block + n) < len(pint):
+        if n == 0:
+            bit8 = pint[block + n]
+        else:
+            b8 = bit8 & (mask >> n)
+            data = pint[block + n]
+            if b8:
+                data = data | 0b10000000
+
+            unpacked.append(data)
+
+        n += 1
+        if n == 8:
+            n = 0
+            block += 8
+
+    return unpacked
+
+def list_checksum(msg):
+    cx = 0
+    i = 1
+    while i < len(msg) - 2:
+        cx = cx ^ msg[i]
+        i += 1
+
+    return cx, (cx == msg[i])
+
+def list_pack(data):
+    packed = []
+    pc = 0
+    for d in data:
+        if pc == 0:
+            packet = []
+            msb = 0x00
+            msmask = 0b01000000
+
+        m = d & 0b10000000
+        if m > 0:
+            msb = msb | msmask
+
+        packet.append(d & 0b01111111)
+
+        pc += 1
+        msmask = msmask >> 1
+
+        if pc == 7:
+            pc = 0
+            packet.insert(0, msb)
+            packed += packet
+
+    if pc > 0:
+        packet.insert(0, msb)
+        packed += packet
+
+    return packed
+
+def list_build(midi_channel, mnfr_id, device_id, data):
+    msg = [0xF0] + mnfr_id.copy() + [midi_channel, device_id]
+    msg += data
+    msg += [0, 0xF7]
+
+    cx, ok = list_checksum(msg)
+    msg[len(msg) - 2] = cx
+    return msg
+
+def run(label, old, new, number):
+    t_old = min(timeit.repeat(old, number = number, repeat = 5)) / number
+    t_new = min(timeit.repeat(new, number = number, repeat = 5)) / number
+    print(f"{label:38s} {t_old * 1e6:9.2f} us {t_new * 1e6:9.2f} us {t_old / t_new:7.1f}x")
+
+if __name__ == "__main__":
+    frames = {f[6]: f for f in read_midiox_log(DEFAULT_CAPTURE)}
+    mnfr_id = [0x00, 0x00, 0x10]
+
+    print(f"{'':38s} {'list':>12s} {'sysex':>12s} {'speedup':>8s}")
+    for code in [0x7E, 0x21, 0x24, 0x2A]:
+        msg = frames[code]
+        raw = bytes(msg)
+        run(f"unpack {code:02X} ({len(msg)} bytes)", lambda: list_unpack(msg[7:-1]), lambda: sysex.unpack(raw, 7, -1), 2000)
+
+    for code in [0x21, 0x2A]:
+        msg = frames[code]
+        raw = bytes(msg)
+        run(f"checksum {code:02X} ({len(msg)} bytes)", lambda: list_checksum(msg), lambda: sysex.verify(raw), 2000)
+
+    for code in [0x21, 0x24, 0x2A]:
+        data = list_unpack(frames[code][7:-2])
+        run(f"pack + build {code:02X} ({len(data)} data bytes)", lambda: list_build(0, mnfr_id, 0x56, [code] + list_pack(data)),
+            lambda: sysex.encode(0, mnfr_id, 0x56, code, data), 2000)
+
+    encoder = sysex.Encoder()
+    def encode_parameter():
+        encoder.begin(0, mnfr_id, 0x56, 0x2C)
+        encoder.write([0x02, 0x00, 0x08, 0x01])
+        encoder.write([0x81, 0xC8])
+        return encoder.end()
+
+    run("parameter change 2C", lambda: list_build(0, mnfr_id, 0x56, [0x2C] + list_pack([0x02, 0x00, 0x08, 0x01, 0x81, 0xC8])),
+        encode_parameter, 20000)
@@ -0,0 +1,139 @@
+# blobstore.py
+#
+# GNXEdit library blocks stored once: patches refer to their blocks by hash, a block used by any number of
+# patches (saved from any channel) is kept once with a count of the patches using it
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# no Qt: the library tree, gnxedit-cli and the patch diff all use it
+# the counts are kept by triggers, so deleting patches (or whole categories of them) needs nothing from here
+
+import hashlib
+from collections import Counter
+
+import sysex
+from devicestate import BLOCK_KEYS
+
+COLUMNS = [f"H{k}" for k in BLOCK_KEYS]     # patches: block hash for each of BLOCK_KEYS
+CHUNK = 500                                 # hashes in one IN (...), under SQLite's variable limit
+
+# the frame without its channel and checksum, the same block hashes the same on any channel
+def block_hash(msg):
+    return hashlib.sha1(bytes(msg[5:-2])).digest()
+
+# as stored: channel 0, checksum to match; readers put their own channel back
+def canonical(msg):
+    return sysex.rechannel(msg, 0)
+
+def create(cur):
+    cur.execute("CREATE TABLE IF NOT EXISTS blobs (hash BLOB PRIMARY KEY, data BLOB NOT NULL, refs INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID")
+    old = ", ".join(f"OLD.{c}" for c in COLUMNS)
+    new = ", ".join(f"NEW.{c}" for c in COLUMNS)
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS patches_blobs_insert AFTER INSERT ON patches BEGIN \
+                    UPDATE blobs SET refs = refs + 1 WHERE hash IN ({new}); END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS patches_blobs_delete AFTER DELETE ON patches BEGIN \
+                    UPDATE blobs SET refs = refs - 1 WHERE hash IN ({old}); \
+                    DELETE FROM blobs WHERE hash IN ({old}) AND refs <= 0; END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS patches_blobs_update AFTER UPDATE OF {', '.join(COLUMNS)} ON patches BEGIN \
+                    UPDATE blobs SET refs = refs + 1 WHERE hash IN ({new}); \
+                    UPDATE blobs SET refs = refs - 1 WHERE hash IN ({old}); \
+                    DELETE FROM blobs WHERE hash IN ({old}) AND refs <= 0; END")
+
+# blocks into the store if they aren't there already: {k: hash}, None for a block the patch doesn't have
+def put_blocks(cur, blocks):
+    hashes = {}
+    for k in BLOCK_KEYS:
+        msg = blocks.get(k)
+        if msg == None:
+            hashes[k] = None
+            continue
+        hashes[k] = block_hash(msg)
+        cur.execute("INSERT OR IGNORE INTO blobs (hash, data) VALUES (?, ?)", [hashes[k], canonical(msg)])
+    return hashes
+
+def insert_patch(cur, category, name, description, tags, blocks):
+    hashes = put_blocks(cur, blocks)
+    cur.execute(f"INSERT INTO patches (category, name, description, tags, {', '.join(COLUMNS)}) \
+                VALUES (?, ?, ?, ?, {', '.join('?' * len(COLUMNS))})", [category, name, description, tags] + [hashes[k] for k in BLOCK_KEYS])
+    return cur.lastrowid
+
+# {hash: frame} for any number of hashes
+def fetch(cur, hashes):
+    hashes = [h for h in set(hashes) if h != None]
+    data = {}
+    for n in range(0, len(hashes), CHUNK):
+        chunk = hashes[n:n + CHUNK]
+        cur.execute(f"SELECT hash, data FROM blobs WHERE hash IN ({', '.join('?' * len(chunk))})", chunk)
+        data.update({bytes(h): bytes(d) for h, d in cur.fetchall()})
+    return data
+
+# hashes in BLOCK_KEYS order (the H columns of a patch) as {k: frame}, blocks it doesn't have left out
+def blocks(cur, hashes):
+    data = fetch(cur, hashes)
+    return {k: data[bytes(h)] for k, h in zip(BLOCK_KEYS, hashes) if h != None and bytes(h) in data}
+
+# (name, {k: frame}) of a library patch, None if there is no such patch
+def patch_blocks(cur, id):
+    cur.execute(f"SELECT name, {', '.join(COLUMNS)} FROM patches WHERE id = ?", [id])
+    row = cur.fetchone()
+    if row == None:
+        return None
+    return row[0], blocks(cur, list(row[1:]))
+
+# counts from the patches themselves, for a store the triggers haven't been keeping
+def recount(cur):
+    cur.execute(f"SELECT {', '.join(COLUMNS)} FROM patches")
+    refs = Counter(bytes(h) for row in cur.fetchall() for h in row if h != None)
+    cur.execute("UPDATE blobs SET refs = 0")
+    cur.executemany("UPDATE blobs SET refs = ? WHERE hash = ?", [(n, h) for h, n in refs.items()])
+    cur.execute("DELETE FROM blobs WHERE refs <= 0")
+
+# patches with their blocks in columns of their own (C24 ...) moved to the store, a library migration (1.1) run in its
+# transaction; returns the number of patches moved, None when the library already uses the store
+def move(cur):
+    cur.execute("PRAGMA table_info(patches)")
+    columns = [row[1] for row in cur.fetchall()]
+    if "H24" in columns:
+        create(cur)
+        return None
+
+    cur.execute("SELECT seq FROM sqlite_sequence WHERE name = 'patches'")
+    seq = cur.fetchone()
+    cur.execute(f"CREATE TABLE patches_store (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT DEFAULT ('\"NEW PATCH\"'), \
+                description TEXT DEFAULT ('\"New description\"'), tags TEXT, category INTEGER, {', '.join(c + ' BLOB' for c in COLUMNS)})")
+    cur.execute("CREATE TABLE IF NOT EXISTS blobs (hash BLOB PRIMARY KEY, data BLOB NOT NULL, refs INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID")
+    cur.execute(f"SELECT id, name, description, tags, category, {', '.join('C' + k for k in BLOCK_KEYS)} FROM patches")
+    rows = cur.fetchall()
+    for row in rows:
+        hashes = put_blocks(cur, {k: row[5 + n] for n, k in enumerate(BLOCK_KEYS) if row[5 + n] != None})
+        cur.execute(f"INSERT INTO patches_store (id, name, description, tags, category, {', '.join(COLUMNS)}) \
+                    VALUES (?, ?, ?, ?, ?, {', '.join('?' * len(COLUMNS))})", list(row[:5]) + [hashes[k] for k in BLOCK_KEYS])
+    cur.execute("DROP TABLE patches")
+    cur.execute("ALTER TABLE patches_store RENAME TO patches")
+    if seq != None:                         # ids of deleted patches aren't used again
+        cur.execute("DELETE FROM sqlite_sequence WHERE name = 'patches'")
+        cur.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('patches', ?)", [seq[0]])
+    create(cur)
+    recount(cur)
+    return len(rows)
+
+# what the store holds against what the patches refer to
+def report(cur):
+    cur.execute("SELECT COUNT(*), COALESCE(SUM(refs), 0), COALESCE(SUM(LENGTH(data)), 0), COALESCE(SUM(LENGTH(data) * refs), 0) FROM blobs")
+    count, refs, stored, referenced = cur.fetchone()
+    saved = referenced - stored
+    return f"{refs} blocks stored as {count} ({stored} bytes for {referenced}, " + \
+           f"{saved} bytes or {saved * 100 / referenced if referenced > 0 else 0:.0f}% saved)"
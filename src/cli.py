@@ -0,0 +1,377 @@
+# cli.py
+#
+# gnxedit-cli: back up, restore and verify the user patches of every GNX1 without the editor
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# every unit found is worked on at once, each through its own session; a unit's patches go one after the other
+# as they all pass through its edit buffer. Each patch is saved as soon as it arrives, so an interrupted backup
+# carries on from where it stopped when run again (--fresh to fetch everything again)
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+import blobstore
+import duplicates
+import librarydb
+import migrations
+import common
+import settings
+import patchdiff
+from devicemanager import DeviceManager
+from devicestate import BLOCK_KEYS
+
+USER_BANK = 1
+PATCH_COUNT = 48
+MANIFEST_FILE = "unit.json"
+
+def slug(name):
+    return re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_")
+
+# written to a temporary file first, as DeviceSnapshot.save, so an interrupted run never leaves half a patch
+def write_json(file, d):
+    temp = file + ".tmp"
+    with open(temp, "w") as f:
+        json.dump(d, f, indent = 4)
+    os.replace(temp, file)
+
+# one backup set as a directory: unit.json for the names, one file per patch
+class FileStore:
+
+    def __init__(self, root, name):
+        self.path = os.path.join(root, slug(name))
+        self.label = self.path
+
+    def open(self, create):
+        if create:
+            os.makedirs(self.path, exist_ok = True)
+        elif not os.path.isdir(self.path):
+            raise Exception(f"No backup in {self.path}")
+
+    def patch_file(self, bank, patch):
+        return os.path.join(self.path, f"{bank}-{patch + 1:02d}.json")
+
+    def has(self, bank, patch):
+        return os.path.isfile(self.patch_file(bank, patch))
+
+    def save(self, bank, patch, name, blocks):
+        write_json(self.patch_file(bank, patch), {"bank": bank, "patch": patch, "name": name,
+                                                  "blocks": {k: bytes(blocks[k]).hex() for k in BLOCK_KEYS}})
+
+    def load(self, bank, patch):
+        try:
+            with open(self.patch_file(bank, patch), "r") as f:
+                d = json.load(f)
+            return d["name"], {k: bytes.fromhex(d["blocks"][k]) for k in BLOCK_KEYS}
+        except FileNotFoundError:
+            return None
+
+    # patch names and user amp/cab names, which the library has nowhere to keep
+    def save_names(self, unit):
+        write_json(os.path.join(self.path, MANIFEST_FILE), {"unit": unit.label, "saved": time.time(),
+                   "patch_names": {str(k): v for k, v in unit.model.patch_names.items()},
+                   "user_amp_names": {str(k): v for k, v in unit.model.user_amp_names.items()},
+                   "user_cab_names": {str(k): v for k, v in unit.model.user_cab_names.items()}})
+
+    def close(self):
+        pass
+
+# one backup set as a library category, each patch a row described as BANK 1 PATCH 05
+class LibraryStore:
+
+    def __init__(self, file, name):
+        self.file = file
+        self.name = f"BACKUP {name}".upper()
+        self.label = f"library category {self.name}"
+        self.conn = None
+        self.category = None
+
+    def open(self, create):
+        self.conn = librarydb.connect(self.file)
+        migrations.run(self.conn)           # the editor does this when it starts, gnxedit-cli may be first
+        cur = self.conn.cursor()
+        cur.execute("SELECT id FROM categories WHERE parent = 0 AND name = ?", [self.name])
+        row = cur.fetchone()
+        if row != None:
+            self.category = row[0]
+        elif create:
+            cur.execute("INSERT INTO categories (parent, name) VALUES (0, ?)", [self.name])
+            self.conn.commit()
+            self.category = cur.lastrowid
+        else:
+            raise Exception(f"No {self.label}")
+
+    def description(self, bank, patch):
+        return f"BANK {bank} PATCH {patch + 1:02d}"
+
+    def has(self, bank, patch):
+        cur = self.conn.cursor()
+        cur.execute("SELECT id FROM patches WHERE category = ? AND description = ?", [self.category, self.description(bank, patch)])
+        return cur.fetchone() != None
+
+    # committed one at a time, each patch is safe as soon as it is in
+    def save(self, bank, patch, name, blocks):
+        cur = self.conn.cursor()
+        cur.execute("DELETE FROM patches WHERE category = ? AND description = ?", [self.category, self.description(bank, patch)])
+        blobstore.insert_patch(cur, self.category, name, self.description(bank, patch), "BACKUP", blocks)
+        self.conn.commit()
+
+    def load(self, bank, patch):
+        cur = self.conn.cursor()
+        cur.execute("SELECT id FROM patches WHERE category = ? AND description = ?", [self.category, self.description(bank, patch)])
+        row = cur.fetchone()
+        if row == None:
+            return None
+        return blobstore.patch_blocks(cur, row[0])
+
+    def save_names(self, unit):
+        pass
+
+    def close(self):
+        if self.conn != None:
+            self.conn.close()
+            self.conn = None
+
+# what a unit did, printed as it goes and summed up at the end
+class Progress:
+
+    def __init__(self, unit, total, quiet = False):
+        self.unit = unit
+        self.total = total
+        self.quiet = quiet
+        self.count = 0
+        self.done = 0
+        self.skipped = 0
+        self.failed = {}                # patch: reason
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def report(self, patch, text):
+        self.count += 1
+        if not self.quiet:
+            print(f"[{self.count:2d}/{self.total}] {self.unit.label}: {USER_BANK}-{patch + 1:02d} {text}", flush = True)
+
+    def ok(self, patch, text):
+        self.done += 1
+        self.report(patch, text)
+
+    def skip(self, patch, text):
+        self.skipped += 1
+        self.report(patch, text)
+
+    def fail(self, patch, e):
+        self.failed[patch] = str(e)
+        self.report(patch, f"FAILED {e}")
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def elapsed(self):
+        return (self.finished if self.finished != None else time.perf_counter()) - self.started
+
+    # patches gone through the unit, failed ones too
+    def worked(self):
+        return self.count - self.skipped
+
+    def summary(self, verb):
+        elapsed = self.elapsed()
+        rate = self.worked() / elapsed if elapsed > 0 else 0
+        return f"{self.unit.label}: {self.done} {verb}, {self.skipped} skipped, {len(self.failed)} failed in {elapsed:.1f} s ({rate:.2f} patches/s)"
+
+def parse_patches(text):
+    if text == None:
+        return list(range(PATCH_COUNT))
+    patches = set()
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        first = int(first)
+        last = int(last) if last else first
+        if first < 1 or last > PATCH_COUNT or first > last:
+            raise argparse.ArgumentTypeError(f"patches are 1 to {PATCH_COUNT}: {part}")
+        patches.update(range(first - 1, last))
+    return sorted(patches)
+
+# differences between a stored patch and the one on the unit, decoded where both decode
+def compare(stored, device):
+    return patchdiff.describe(patchdiff.DIFFER.diff(stored, device))
+
+def backup_steps(unit, store, patches, progress, fresh):
+    yield from unit.names_steps(USER_BANK)
+    yield from unit.ampcab_names_steps()
+    store.save_names(unit)
+    for patch in patches:
+        if not fresh and store.has(USER_BANK, patch):
+            progress.skip(patch, "already saved")
+            continue
+        try:
+            started = time.perf_counter()
+            name, blocks = yield from unit.fetch_steps(USER_BANK, patch)
+            store.save(USER_BANK, patch, name, blocks)
+            progress.ok(patch, f"{name} {(time.perf_counter() - started) * 1000:.0f} ms")
+        except Exception as e:
+            progress.fail(patch, e)
+    progress.finish()
+
+# every patch queued on the unit's uploader, which sends them back to back
+def restore_steps(unit, store, patches, progress):
+    for patch in patches:
+        stored = store.load(USER_BANK, patch)
+        if stored == None:
+            progress.skip(patch, "not in the backup")
+            continue
+        name, blocks = stored
+        unit.queue_upload(name, blocks, target = (USER_BANK, patch)).add_done_callback(
+            lambda future, patch = patch: progress.fail(patch, future.exception) if future.exception != None else progress.ok(patch, future.result))
+    yield from unit.upload_queue_steps()
+    progress.finish()
+
+def verify_steps(unit, store, patches, progress):
+    names = yield from unit.names_steps(USER_BANK)
+    for patch in patches:
+        stored = store.load(USER_BANK, patch)
+        if stored == None:
+            progress.skip(patch, "not in the backup")
+            continue
+        try:
+            name, blocks = yield from unit.fetch_steps(USER_BANK, patch)
+            differences = compare(stored[1], blocks)
+            if names != None and patch < len(names) and names[patch].rstrip() != stored[0].rstrip():
+                differences.insert(0, f"name {stored[0]} != {names[patch]}")
+            if len(differences) > 0:
+                progress.fail(patch, "; ".join(differences))
+            else:
+                progress.ok(patch, f"{name} matches")
+        except Exception as e:
+            progress.fail(patch, e)
+    progress.finish()
+
+# nothing here runs on its own: the MIDI threads fill the input queues and poll() does the rest
+def wait(manager, future):
+    while not future.done:
+        manager.poll()
+        time.sleep(0.001)
+    return future.result
+
+def select_units(units, args):
+    if args.port != None:
+        units = [u for u in units if args.port.lower() in u.link.name.lower()]
+    if args.channel != None:
+        units = [u for u in units if u.channel == args.channel - 1]
+    return units
+
+def make_store(args, unit):
+    name = args.set if args.set != None else unit.label
+    if args.dir != None:
+        return FileStore(args.dir, name)
+    return LibraryStore(args.library if args.library != None else common.GNXEDIT_DATABASE_FILE, name)
+
+def library_report(file):
+    conn = librarydb.connect(file)
+    try:
+        for version, description, result in migrations.run(conn):
+            print(f"Library updated to version {version}: {description}")
+        print(f"{file}: {blobstore.report(conn.cursor())}")
+        groups = duplicates.exact(conn)
+        print(f"{sum(len(g) for g in groups)} patches the same as another, in {len(groups)} groups")
+    finally:
+        conn.close()
+    return 0
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = "gnxedit-cli", description = "Back up, restore and verify the user patches of every GNX1 found.")
+    parser.add_argument("command", choices = ["list", "backup", "restore", "verify", "library"],
+                        help = "library reports the space the library's shared blocks save and its duplicate patches, no unit needed")
+    parser.add_argument("--transport", help = "MIDI transport, as midi.transport in GNXEdit.json")
+    parser.add_argument("--port", help = "only units on ports with this in their name")
+    parser.add_argument("--channel", type = int, help = "only units on this MIDI channel (1-16)")
+    parser.add_argument("--patches", type = parse_patches, default = parse_patches(None), help = f"user patches, e.g. 1-10,12 (default 1-{PATCH_COUNT})")
+    parser.add_argument("--dir", help = "back up to (or restore from) files in this directory instead of the library")
+    parser.add_argument("--library", help = "library file (default the GNXEdit library)")
+    parser.add_argument("--set", help = "name of the backup set (default the unit's port and channel)")
+    parser.add_argument("--fresh", action = "store_true", help = "fetch every patch again instead of carrying on from the last run")
+    parser.add_argument("--discover-timeout", type = float, default = 0.5, help = "seconds to wait for units to answer")
+    parser.add_argument("--quiet", action = "store_true", help = "summary only")
+    args = parser.parse_args(argv)
+
+    common.init(None)
+    settings.appconfig(check_database = False)
+
+    if args.command == "library":
+        return library_report(args.library if args.library != None else common.GNXEDIT_DATABASE_FILE)
+
+    manager = DeviceManager(transport = args.transport)
+    stores = []
+    try:
+        units = select_units(wait(manager, manager.discover(args.discover_timeout)), args)
+        if len(units) == 0:
+            print("No GNX1 found")
+            return 1
+        if args.command == "list":
+            for unit in units:
+                print(unit.label)
+            return 0
+
+        progress = {}
+        work = {}
+        for unit in units:
+            store = make_store(args, unit)
+            store.open(create = args.command == "backup")
+            stores.append(store)
+            progress[unit.key] = Progress(unit, len(args.patches), args.quiet)
+            print(f"{unit.label}: {args.command} {len(args.patches)} patches, {store.label}")
+            match args.command:
+                case "backup":
+                    work[unit.key] = backup_steps(unit, store, args.patches, progress[unit.key], args.fresh)
+                case "restore":
+                    work[unit.key] = restore_steps(unit, store, args.patches, progress[unit.key])
+                case "verify":
+                    work[unit.key] = verify_steps(unit, store, args.patches, progress[unit.key])
+
+        started = time.perf_counter()
+        results = wait(manager, manager.run_all(units, lambda unit: work[unit.key], args.command))
+        elapsed = time.perf_counter() - started
+
+        verb = {"backup": "saved", "restore": "restored", "verify": "verified"}[args.command]
+        failed = False
+        for unit in units:
+            if isinstance(results[unit.key], Exception):
+                print(f"{unit.label}: {results[unit.key]}")
+                failed = True
+                continue
+            print(progress[unit.key].summary(verb))
+            if args.command == "restore":
+                print(f"{unit.label}: {unit.uploader.stats.report()}")
+            failed = failed or len(progress[unit.key].failed) > 0
+        done = sum(p.done for p in progress.values())
+        worked = sum(p.worked() for p in progress.values())
+        print(f"{done} patches {verb} from {len(units)} units in {elapsed:.1f} s ({worked / elapsed if elapsed > 0 else 0:.2f} patches/s)")
+        return 1 if failed else 0
+
+    except KeyboardInterrupt:
+        print("Interrupted, run the same command again to carry on")
+        return 130
+
+    finally:
+        for store in stores:
+            store.close()
+        manager.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
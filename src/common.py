@@ -25,6 +25,17 @@ COMMS_MODE_UPLOADING = 2
 COMMS_MODE_PATCH_SAVE = 3
 COMMS_MODE_AKNOWLEDGE = 3
 
+# how much a sync fetches
+SYNC_FULL = 0                   # everything, from the device enquiry
+SYNC_INCREMENTAL = 1            # enquiry and status, the rest from the device snapshot if still valid
+SYNC_PATCH = 2                  # current patch name and dump only
+
+# outbound message lanes, lower value is sent first
+# everything that reads or changes the unit's state shares one lane, sent in the order queued: a patch change, save
+# or upload must not overtake parameter changes queued before it
+SEND_PRIORITY_KEEP_ALIVE = 0    # keep-alive, nothing depends on where it lands
+SEND_PRIORITY_STATE = 1         # requests, uploads, patch changes, saves, parameter changes
+
 def init(app):
     global GNXEDIT_CONFIG, GNXEDIT_CONFIG_PATH, GNXEDIT_CONFIG_FILE, GNXEDIT_DATABASE_FILE, APP_VERSION, \
             APP_LICENSE, APP_LICENSE_LINK, APP_COPYRIGHT, APP_HELP_LINK, ABOUT_TEXT, APP_VERSION_TEXT, \
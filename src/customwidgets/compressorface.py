@@ -26,7 +26,7 @@ import os
 
 from .cache import cache_image
 from .styledial import StyleDial
-from GNX1 import factory_compressor_ratio
+from .factory import factory_compressor_ratio
 
 class CompressorFace(QWidget):
 
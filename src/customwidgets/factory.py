@@ -17,7 +17,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from PySide6.QtCore import Qt
+# plain tables, no Qt: the device model and batch tools use them too (pot colours are set by the faces)
 
 factory_patch_names = { 0:'HYBRID', 1:'CLNCHO', 2:'2CHUNK', 3:'WARPME', 4:'BLKBAS', 5:'MEATX2', 6:'ERIC J', 7:'CARLOS', 
                         8:'KOBB  ', 9:'BASSMN', 10:'MATCHD', 11:'VOXTOP', 12:'BLUDLY', 13:'BLUBAL', 14:'TEXBLU', 15:'PICKEN',
@@ -56,11 +56,11 @@ factory_ips_scale = {0: "Major", 1: "Minor", 2: "Dorian", 3: "Mixolydian", 4: "L
 factory_ips_key = {0: "E", 1: "F", 2: "Gb", 3: "G", 4: "Ab", 5: "A", 6: "Bb", 7: "B", 8: "C", 9: "Db", 10: "D", 11: "Eb"}
 
 exp_pot_off = {"minval": 0, "maxval": 1, "minunit": 0, "maxunit": 1, "prefix": "", "suffix":"", "dialmin": 1, "dialmax": 12, "dialstep": 1, "img": "direct",
-                    "x": 0, "y": 0, "w": 60, "h": 60, "start": 45, "end": 315, "rotate": 180, "ds": 2, "color": Qt.black,  "ticks": True,  "marks": range(1,11,1),
+                    "x": 0, "y": 0, "w": 60, "h": 60, "start": 45, "end": 315, "rotate": 180, "ds": 2, "color": None,  "ticks": True,  "marks": range(1,11,1),
                     "unitscale": ["--", "--"], "tooltipformat": "s" }
 
 exp_pot_vol = {"minval": 0, "maxval": 99, "minunit": 0, "maxunit": 99, "prefix": "", "suffix":"", "dialmin": 1, "dialmax": 12, "dialstep": 1, "img": "direct",
-                "x": 0, "y": 0, "w": 60, "h": 60, "start": 45, "end": 315, "rotate": 180, "ds": 2, "color": Qt.black,  "ticks": True,  "marks": range(1,11,1),
+                "x": 0, "y": 0, "w": 60, "h": 60, "start": 45, "end": 315, "rotate": 180, "ds": 2, "color": None,  "ticks": True,  "marks": range(1,11,1),
                 "unitscale": None, "tooltipformat": "0.1f" }
 
 factory_expression_assignments = {
@@ -35,16 +35,6 @@ def compare_array(a1, a2):
         
     return True
 
-# creates and compares checksum
-def sysex_checksum(msg):
-    cx = 0
-    i = 1
-    while i < len(msg) - 2:
-        cx = cx ^ msg[i]
-        i += 1
-
-    return cx, (cx == msg[i])
-
 # return the variable length number at position n in unpacked byte string
 def getnum(n, unpacked):
     v = 0
@@ -63,9 +53,9 @@ def getnum(n, unpacked):
     return n, v
 
 # skip byes in packed byte array and check values
-def skip_bytes(n, unpacked, bytes):
-    m = len(bytes)
-    if unpacked[n:n + m] != bytes:
+def skip_bytes(n, unpacked, pattern):
+    m = len(pattern)
+    if bytes(unpacked[n:n + m]) != bytes(pattern):
         raise Exception(f"Pattern mis-match at {n}")
 
     n += m
@@ -87,48 +77,6 @@ def compile_number(value):
 
     return v
 
-# pack bytes into 1 MSB byte + (up to) 7 data bytes
-def pack_data(data):
-    packed = []
-    pc = 0          # packet counter
-    for d in data:
-        if pc == 0:
-            packet = []
-            msb = 0x00
-            msmask = 0b01000000     # msb mask starts left == first
-
-        m = d & 0b10000000          # does byte have bit 8 set
-        if m > 0:
-            msb = msb | msmask
-
-        packet.append(d & 0b01111111)
-
-        # next byte
-        pc += 1
-        msmask = msmask >> 1
-
-        # next packet
-        if pc == 7:
-            pc = 0
-            packet.insert(0, msb)
-            packed += packet
-
-    if pc > 0:                      # partial packet remains
-        packet.insert(0, msb)
-        packed += packet            
-
-    return packed
-
-def build_sysex(midi_channel, mnfr_id, device_id, data):
-    #data is from code to before checksum
-    msg = [0xF0] + mnfr_id.copy() + [midi_channel, device_id]
-    msg += data
-    msg += [0, 0xF7]
-
-    cx, ok = sysex_checksum(msg)
-    msg[len(msg) - 2] = cx
-    return msg
-
 def get_expression_assignment_index(section, parameter):
     for k, v in factory_expression_assignments.items():
         if v["section"] == section  and v["parameter"] == parameter:
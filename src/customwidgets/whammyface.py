@@ -26,7 +26,7 @@ import os
 
 from .cache import cache_image
 from .styledial import StyleDial
-from GNX1 import factory_whammy_shift, factory_ips_shift, factory_ips_key, factory_ips_scale
+from .factory import factory_whammy_shift, factory_ips_shift, factory_ips_key, factory_ips_scale
 
 class WhammyFace(QWidget):
 
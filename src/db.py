@@ -20,6 +20,7 @@ import os
 import sqlite3
 import shutil
 import common
+import librarydb
 from exceptions import GNXError
 
 from PySide6.QtUiTools import QUiLoader
@@ -47,8 +48,10 @@ class gnxDB(QObject):
                 e.alert(e)
                 return
            
-        
-            self.conn = sqlite3.connect(path)
+
+            # this thread's connection, with its statement cache and pages kept
+            self.conn = librarydb.connection(path)
+            self.conn.reuse()
         except Exception as e:
             e = GNXError(icon = QMessageBox.Critical, title = "Database Error", \
                                                     text = f"Unable to open database on path {common.GNXEDIT_CONFIG_FILE}", \
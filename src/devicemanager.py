@@ -0,0 +1,317 @@
+# devicemanager.py
+#
+# GNXEdit discovery of every GNX1 on every port, with a protocol session for each
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# no Qt in here: poll() is called from a timer on the main thread (or a loop in a batch job) and runs everything,
+# the MIDI threads only fill the input queues
+
+import common
+import sysex
+from GNXSession import Correlator, Task, Future, RequestTimeout, ACK
+from MIDIQueue import MIDIInputQueue, MIDISendScheduler
+from MIDITransport import create_transport
+from scheduler import Scheduler
+from devicestate import BLOCK_KEYS
+from devicemodel import DeviceModel
+from uploader import Uploader
+
+MNFR_ID = [0x00, 0x00, 0x10]
+DEVICE_ID = 0x56
+ENQUIRY = [0xF0, 0x00, 0x00, 0x10, 0x7E, 0x7F, 0x01, 0x00, 0x01, 0x00, 0x00, 0x11, 0xF7]    # 0x01 on all channels
+
+# a port opened by the manager itself, for units not on the editor's port
+class PortLink:
+
+    def __init__(self, name, transport, input_index, output_index, spacing = None):
+        self.name = name
+        self.transport = transport
+        self.input_index = input_index
+        self.output_index = output_index
+        self.input_queue = MIDIInputQueue()
+        self.send_scheduler = MIDISendScheduler(self.transport.send, spacing)
+
+    def open(self):
+        self.transport.open_input(self.input_index, self.input_queue.put)
+        self.transport.open_output(self.output_index)
+        self.send_scheduler.start()
+
+    def close(self):
+        self.send_scheduler.stop()
+        self.transport.close_input()
+        self.transport.close_output()
+        self.transport.close()
+
+    def send(self, msg):
+        self.send_scheduler.send_message(msg, common.SEND_PRIORITY_STATE)
+
+    def receive(self, limit = 64):
+        return [message for timestamp, message in self.input_queue.get_batch(limit)]
+
+# the editor's port, already open in MIDIControl: frames arrive through its input targets
+class ControlLink:
+
+    def __init__(self, midicontrol, manager):
+        self.midicontrol = midicontrol
+        midicontrol.register_input_target(lambda msg: manager.route(self, msg))
+
+    @property
+    def name(self):         # may be changed in the MIDI dialog
+        return common.GNXEDIT_CONFIG["midi"]["output"]["name"]
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    # straight to the scheduler: MIDIControl.send_message would count these in the editor's round trip statistics
+    def send(self, msg):
+        if not self.midicontrol.transport.output_open():
+            raise Exception("MIDI output port not open for sending message")
+        self.midicontrol.send_scheduler.send_message(msg, common.SEND_PRIORITY_STATE)
+
+    def receive(self, limit = 64):
+        return []
+
+# one GNX1, addressed by the port it is on and its channel
+# requests go through its own Correlator, so units on different ports (or channels) run side by side
+class GNXUnit:
+
+    def __init__(self, link, channel, editor = False):
+        self.link = link
+        self.channel = channel
+        self.editor = editor            # the unit GNX1 is editing, driven by GNX1 itself and never by the manager
+        self.session = Correlator(self.link.send, timeout = common.GNXEDIT_CONFIG["midi"].get("request_timeout_ms", 1000) / 1000,
+                                  retries = common.GNXEDIT_CONFIG["midi"].get("request_retries", 2))
+        self.task = None
+        self.model = DeviceModel(channel)      # names, current patch and the blocks of the last dump
+        self.uploader = Uploader(self.session, channel)
+
+    @property
+    def key(self):
+        return (self.link.name, self.channel)
+
+    @property
+    def label(self):
+        return f"{self.link.name} channel {self.channel + 1}"
+
+    def busy(self):
+        return self.task != None and self.task.running()
+
+    def build(self, opcode, data):
+        return sysex.encode(self.channel, MNFR_ID, DEVICE_ID, opcode, data)
+
+    def request(self, opcode, data, key, label, context = None):
+        return self.session.request(self.build(opcode, data), key, label = label, context = context)
+
+    # frames for this unit, decoded into its model then handed to the session
+    def feed(self, msg):
+        bank = None
+        if msg[sysex.OPCODE_OFFSET] == 0x13:
+            request = self.session.waiting(0x13)    # names frames don't say which bank they are
+            if request != None:
+                bank = request.context
+        try:
+            self.model.feed(msg, bank = bank)
+        except Exception as e:
+            print(f"{self.label}: {msg[sysex.OPCODE_OFFSET]:02X} not decoded: {e}")
+        self.session.feed(msg)
+
+    # only one job at a time on a unit, its requests would otherwise be answered out of order
+    def run(self, generator, label = None):
+        if self.editor:
+            raise Exception(f"{self.label} is the unit being edited")
+        if self.busy():
+            raise Exception(f"{self.label} is busy")
+        self.task = Task(generator, label)
+        return self.task.future
+
+    def status_steps(self):
+        yield self.request(0x05, [0x01], 0x06, "status 05")
+
+    def names_steps(self, bank = 1):
+        yield self.request(0x12, [0x01, bank, 0x00], 0x13, f"patch names 12 bank {bank}", context = bank)
+        return self.model.patch_names.get(bank)
+
+    def ampcab_names_steps(self):
+        yield self.request(0x07, [0x01, 0x01], 0x08, "amp/cab names 07")
+        return self.model.user_amp_names, self.model.user_cab_names
+
+    # current edit buffer: name and blocks, as GNX1.patch_dump_steps
+    def dump_steps(self):
+        self.model.patch.clear()
+        yield self.request(0x20, [0x01, 0x02, 0x00, 0x1F], 0x21, "patch name 20")
+        yield self.request(0x7E, [0x01, 0x21], 0x24, "patch dump 24")
+        for code in [0x2A, 0x2A, 0x2A, 0x2A, 0x26, 0x28, 0x22]:
+            yield self.session.expect(code, label = f"dump {code:02X}")
+        missing = [k for k in BLOCK_KEYS if k not in self.model.patch.blocks]
+        if missing:
+            raise Exception(f"{self.label}: dump without {', '.join(missing)}")
+        return self.model.current_patch_name, {k: bytes(self.model.patch.blocks[k]) for k in BLOCK_KEYS}
+
+    # GNX1.send_patch_change doesn't wait for an acknowledgement, so carry on without one
+    def select_steps(self, bank, patch):
+        try:
+            yield self.session.request(self.build(0x2D, [0x01, bank, patch, 0x00]), (ACK, 0x2D), retries = 0, label = "patch change 2D")
+        except RequestTimeout:
+            pass
+        self.model.set_current_patch(bank = bank, patch = patch)
+
+    # select a stored patch and dump it
+    def fetch_steps(self, bank, patch):
+        yield from self.select_steps(bank, patch)
+        return (yield from self.dump_steps())
+
+    # into the edit buffer, as GNX1.upload_steps; blocks may carry any channel
+    def upload_steps(self, name, blocks):
+        name = yield from self.uploader.upload_steps(name, blocks)
+        self.model.set_current_patch(name = name)
+
+    # for upload_queue_steps(), saved to target (bank, patch) through the edit buffer if given
+    def queue_upload(self, name, blocks, target = None):
+        future = self.uploader.queue(name, blocks, target)
+        if target != None:
+            future.add_done_callback(lambda f: self.stored(f, target))
+        return future
+
+    def stored(self, future, target):
+        if future.exception == None:
+            self.model.rename_patch(target[0], target[1], future.result)
+
+    # the queued patches back to back, resolves with the upload statistics
+    def upload_queue_steps(self):
+        return (yield from self.uploader.queue_steps())
+
+# all units on all ports, inbound frames routed by (port, channel) with one dictionary lookup
+class DeviceManager:
+
+    def __init__(self, midicontrol = None, transport = None, options = None):
+        self.midicontrol = midicontrol
+        self.transport_name = transport if transport != None else common.GNXEDIT_CONFIG["midi"].get("transport", "rtmidi")
+        self.options = options if options != None else common.GNXEDIT_CONFIG["midi"].get(self.transport_name, {})
+        self.spacing = common.GNXEDIT_CONFIG["midi"].get("send_spacing_ms")
+        self.scheduler = Scheduler()
+        self.links = {}                 # port name: link
+        self.units = {}                 # (port name, channel): GNXUnit
+        self.discovery = None           # future of the discovery in progress
+        if midicontrol != None:
+            link = ControlLink(midicontrol, self)
+            self.links[link.name] = link
+
+    # port names with both an input and an output, as (name, input index, output index)
+    def ports(self):
+        if self.midicontrol != None:
+            transport = self.midicontrol.transport
+        else:
+            transport = create_transport(self.transport_name, **self.options)
+        try:
+            inputs = transport.input_names()
+            return [(name, inputs.index(name), index) for index, name in enumerate(transport.output_names()) if name in inputs]
+        finally:
+            if self.midicontrol == None:
+                transport.close()
+
+    def link(self, name, input_index, output_index):
+        link = self.links.get(name)
+        if link == None:
+            link = PortLink(name, create_transport(self.transport_name, **self.options), input_index, output_index,
+                            None if self.spacing == None else self.spacing / 1000)
+            link.open()
+            self.links[name] = link
+        return link
+
+    # enquiry on every port, every unit answering within timeout seconds is added
+    # the future resolves with the list of units
+    def discover(self, timeout = 0.5):
+        if self.discovery != None and not self.discovery.done:
+            return self.discovery
+        self.discovery = Future("discovery")
+        self.units = {key: unit for key, unit in self.units.items() if unit.busy()}        # gone unless they answer again
+        for key, link in list(self.links.items()):
+            if link.name != key:
+                self.links[link.name] = self.links.pop(key)
+        for name, input_index, output_index in self.ports():
+            try:
+                self.link(name, input_index, output_index).send(list(ENQUIRY))
+            except Exception as e:
+                print(f"Device discovery skipped {name}: {e}")
+        future = self.discovery
+        self.scheduler.call_later(timeout, lambda: future.set_result(sorted(self.units.values(), key = lambda u: u.key)))
+        return future
+
+    def add_unit(self, link, channel):
+        editor = isinstance(link, ControlLink) and channel == common.GNXEDIT_CONFIG["midi"]["channel"]
+        unit = GNXUnit(link, channel, editor = editor)
+        self.units[unit.key] = unit
+        return unit
+
+    def route(self, link, msg):
+        if len(msg) < 10 or msg[0] != 0xF0 or list(msg[1:4]) != MNFR_ID:
+            return
+        if msg[sysex.OPCODE_OFFSET] == 0x02:            # enquiry reply, announces the channel
+            channel = msg[9]
+            if (link.name, channel) not in self.units:
+                self.add_unit(link, channel)
+            return
+        unit = self.units.get((link.name, msg[4]))
+        if unit != None and not unit.editor:
+            unit.feed(msg)
+
+    def poll(self):
+        for link in list(self.links.values()):
+            for msg in link.receive():
+                self.route(link, msg)
+        for unit in self.units.values():
+            if not unit.editor:
+                unit.session.poll()
+        self.scheduler.poll()
+
+    def targets(self):
+        return [unit for unit in sorted(self.units.values(), key = lambda u: u.key) if not unit.editor]
+
+    # the same job on several units at once, the future resolves with {unit key: result or exception} when all are done
+    def run_all(self, units, steps, label = None):
+        result = Future(label)
+        outcome = {}
+        if len(units) == 0:
+            result.set_result(outcome)
+            return result
+
+        def done(unit, future):
+            outcome[unit.key] = future.exception if future.exception != None else future.result
+            if len(outcome) == len(units):
+                result.set_result(outcome)
+
+        for unit in units:
+            try:
+                unit.run(steps(unit), label).add_done_callback(lambda future, unit = unit: done(unit, future))
+            except Exception as e:
+                failed = Future(label)
+                failed.set_exception(e)
+                done(unit, failed)
+        return result
+
+    def close(self):
+        for unit in self.units.values():
+            if unit.task != None:
+                unit.task.cancel()
+            unit.session.cancel_all("closed")
+        for link in self.links.values():
+            link.close()
+        self.links = {}
+        self.units = {}
@@ -0,0 +1,307 @@
+# devicemodel.py
+#
+# GNXEdit model of a GNX1: patch parameters, names and current patch, without Qt
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# frames are decoded into here and subscribers are told what changed: the faces in the editor, nothing at all in a batch job
+# values are stored as received, whoever shows them checks them against patchschema
+
+import sysex
+import patchschema
+from patchschema import MNFR_ID, DEVICE_ID, SECTIONS
+from devicestate import BLOCK_KEYS
+from customwidgets.utils import getnum, skip_bytes, compile_number
+from customwidgets.factory import factory_patch_names
+
+EXPRESSION_OFF = {"section": 0xFF, "parameter": 0xFF}
+
+# callbacks by topic, called in the order they subscribed
+class Observable:
+
+    def __init__(self):
+        self.subscribers = {}
+
+    def subscribe(self, topic, callback):
+        self.subscribers.setdefault(topic, []).append(callback)
+
+    def unsubscribe(self, topic, callback):
+        if callback in self.subscribers.get(topic, []):
+            self.subscribers[topic].remove(callback)
+
+    def notify(self, topic, *args):
+        for callback in list(self.subscribers.get(topic, [])):
+            callback(*args)
+
+# one patch: the dump blocks as received and the parameters decoded from them
+# topics: a section name with its values, "expression" with {"assignment", "params"}, "lfo" with {0: lfo1, 1: lfo2}
+class Patch(Observable):
+
+    def __init__(self):
+        super().__init__()
+        self.clear()
+
+    def clear(self):
+        self.blocks = {}                # BLOCK_KEYS: frame as received
+        self.dump = None                # patchschema.Dump of the 0x24 block, shares sections
+        self.sections = {}              # section name: {parameter: value}
+        self.expression = None          # {"assignment": [{section, parameter}] x 3, "params": [{min, max}] x 3}
+        self.lfo = None                 # {0: {speed, waveform, section, parameter, max, min}, 1: ...}
+
+    # a library patch or snapshot, blocks keyed as BLOCK_KEYS
+    @classmethod
+    def from_blocks(cls, blocks):
+        patch = cls()
+        patch.load(blocks)
+        return patch
+
+    def load(self, blocks):
+        self.decode24(blocks["24"])
+        for k in ["3C06", "3D07", "3C08", "3D09"]:
+            self.decode2A(blocks[k])
+        self.decode26(blocks["26"])
+        self.decode28(blocks["28"])
+
+    def complete(self):
+        return all(self.blocks.get(k) != None for k in BLOCK_KEYS)
+
+    def value(self, section, parameter):
+        return self.sections.get(section, {}).get(parameter)
+
+    # sections through the schema, the faces hear about each one
+    def decode24(self, msg):
+        self.blocks["24"] = msg
+        self.dump = patchschema.decode24(msg)
+        self.sections = self.dump.sections
+        for name, values in self.sections.items():
+            self.notify(name, dict(values))
+
+    # the dump block as the sections are now, for a patch edited away from the device
+    def encode24(self, channel):
+        return patchschema.encode24(self.dump, channel)
+
+    def decode26(self, msg):
+        self.blocks["26"] = msg
+        unpacked = sysex.unpack(msg, 7, -1)
+        n = skip_bytes(0, unpacked, [0x02, 0x02])
+        n += 1  # can be 0x00 or 0x09  - 0x09 seems to be after error
+        n = skip_bytes(n, unpacked, [0x03, 0x80, 0x00, 0x03])
+
+        assignment = []
+        params = []
+        for i in range(0, 3):
+            assignment.append({"section": unpacked[n], "parameter": unpacked[n + 1]})
+            n += 2
+            n, nmax = getnum(n, unpacked)
+            n, nmin = getnum(n, unpacked)
+            params.append({"min": nmin, "max": nmax})
+
+        lfo = {}
+        for index, marker in enumerate([[0x8A, 0x02], [0x8B, 0x02]]):
+            n = skip_bytes(n, unpacked, marker)
+            n, speed = getnum(n, unpacked)
+            n, waveform = getnum(n, unpacked)
+            n = skip_bytes(n, unpacked, [0x01]) # might be another parameter
+            section = unpacked[n]
+            parameter = unpacked[n + 1]
+            n += 2
+            n, max = getnum(n, unpacked)
+            n, min = getnum(n, unpacked)
+            lfo[index] = {"speed": speed, "waveform": waveform, "section": section, "parameter": parameter, "max": max, "min": min}
+
+        self.expression = {"assignment": assignment, "params": params}
+        self.lfo = lfo
+        self.notify("expression", {"assignment": [dict(a) for a in assignment], "params": [dict(p) for p in params]})
+        self.notify("lfo", {k: dict(v) for k, v in lfo.items()})
+
+    # the blocks as the patch is now, edits since the dump included; the dump as received where it can't be rebuilt
+    def edited_blocks(self, channel):
+        blocks = dict(self.blocks)
+        if self.dump != None:
+            try:
+                blocks["24"] = self.encode24(channel)
+            except ValueError:
+                pass
+        if self.expression != None and self.lfo != None:
+            blocks["26"] = self.encode26(channel)
+        return blocks
+
+    def decode28(self, msg):
+        self.blocks["28"] = msg
+
+    # custom amp and cab blocks, kept for the library, the patch settings in 0x24 override their defaults
+    def decode2A(self, msg):
+        data = sysex.payload(msg)
+        self.blocks[f"{data[3]:02X}{data[4]:02X}"] = msg
+
+    # from the device (0x2C), returns False for a section not in the model
+    def parameter_change(self, section, parameter, value):
+        if section not in SECTIONS or parameter >= len(SECTIONS[section].parameters):
+            return False
+        name = SECTIONS[section].name
+        key = SECTIONS[section].parameters[parameter].name
+        self.sections.setdefault(name, {})[key] = value
+        self.notify(name, {key: value})
+        return True
+
+    # from a face, which already shows it
+    def store(self, section, parameter, value):
+        if section in SECTIONS and parameter < len(SECTIONS[section].parameters):
+            self.sections.setdefault(SECTIONS[section].name, {})[SECTIONS[section].parameters[parameter].name] = value
+
+    def store_expression(self, assignment, params):
+        self.expression = {"assignment": assignment, "params": params}
+
+    def store_lfo(self, lfo):
+        self.lfo = lfo
+
+    # expression pedal and LFO block, as sent when either is edited
+    def encode26(self, channel):
+        exp = [0x02, 0x02, 0x00, 0x03, 0x80, 0x00, 0x03]
+        for a, p in zip(self.expression["assignment"], self.expression["params"]):
+            if a["section"] == 0xFF:
+                exp += [0xFF, 0x00, 0x00, 0x00] # off
+            else:
+                exp += [a["section"], a["parameter"]] + compile_number(p["max"]) + compile_number(p["min"])
+
+        lfo = []
+        for index, header in enumerate([[0x8A, 0x02], [0x8B, 0x02]]):
+            l = self.lfo[index]
+            lfo += header + compile_number(l["speed"]) + compile_number(l["waveform"]) + [0x01] + \
+                   [l["section"], l["parameter"]] + compile_number(l["max"]) + compile_number(l["min"])
+
+        return sysex.encode(channel, MNFR_ID, DEVICE_ID, 0x26, exp + lfo)
+
+# the device: its channel, names, current patch and the patch in its edit buffer
+# topics: "patch_names" (bank, names), "amp_names" and "cab_names" (names), "current_patch" (name, bank, patch)
+class DeviceModel(Observable):
+
+    def __init__(self, channel = None):
+        super().__init__()
+        self.channel = channel
+        self.patch_names = {}           # bank: [names], 0 factory, 1 user
+        self.user_amp_names = {}        # index: name
+        self.user_cab_names = {}
+        self.current_patch_bank = None
+        self.current_patch_number = None
+        self.current_patch_name = None
+        self.patch = Patch()
+        self.decoders = {0x06: self.decode06, 0x08: self.decode08, 0x21: self.decode21, 0x2D: self.decode2D, 0x2E: self.decode2E,
+                         0x24: self.patch.decode24, 0x26: self.patch.decode26, 0x28: self.patch.decode28, 0x2A: self.patch.decode2A}
+
+    # any frame from the device, bank is the one asked for when the frame is 0x13
+    def feed(self, msg, bank = None):
+        opcode = msg[sysex.OPCODE_OFFSET]
+        if opcode == 0x13:
+            if bank != None:
+                self.decode13(msg, bank)
+        elif opcode == 0x2C:
+            self.decode2C(msg)
+        elif opcode in self.decoders:
+            self.decoders[opcode](msg)
+
+    def set_current_patch(self, name = None, bank = None, patch = None):
+        if bank != None:
+            self.current_patch_bank = bank
+            self.current_patch_number = patch
+        if name != None:
+            self.current_patch_name = name
+        self.notify("current_patch", self.current_patch_name, self.current_patch_bank, self.current_patch_number)
+
+    def set_patch_names(self, bank, names):
+        self.patch_names[bank] = names
+        self.notify("patch_names", bank, names)
+
+    def rename_patch(self, bank, patch, name):
+        names = self.patch_names.get(bank)
+        if names != None and patch < len(names):
+            names[patch] = name
+
+    def set_user_names(self, amp_names, cab_names):
+        self.user_amp_names = amp_names
+        self.user_cab_names = cab_names
+        self.notify("amp_names", dict(amp_names))
+        self.notify("cab_names", dict(cab_names))
+
+    # a saved amp/cab keeps one name for both
+    def rename_ampcab(self, index, name):
+        self.user_amp_names[index] = name
+        self.user_cab_names[index] = name
+        self.notify("amp_names", {index: name})
+        self.notify("cab_names", {index: name})
+
+    # CODE 06: Device Status
+    def decode06(self, msg):
+        unpacked = sysex.unpack(msg, 7, -2)
+        self.current_patch_bank = unpacked[10]
+        self.current_patch_number = unpacked[11]
+
+    # CODE 08: Amp/Cab Names, an index and a null terminated name for each
+    def decode08(self, msg):
+        unpacked = sysex.unpack(msg, 7, -2)     # without checksum to avoid extra array element
+        n, amp_names = self.decode_names(6, unpacked, unpacked[5])
+        n += 2
+        n, cab_names = self.decode_names(n + 1, unpacked, unpacked[n])
+        self.set_user_names(amp_names, cab_names)
+
+    def decode_names(self, n, unpacked, count):
+        names = {}
+        for k in range(0, count):
+            idx = unpacked[n]
+            end = unpacked.index(0x00, n + 1)
+            names[idx] = "".join(map(chr, unpacked[n + 1:end]))
+            n = end + 1
+        return n, names
+
+    # CODE 13: Patch Names, the reply doesn't say which bank it is
+    def decode13(self, msg, bank):
+        unpacked = sysex.unpack(msg, 7, -2)     # without checksum to avoid extra array element
+        self.set_patch_names(bank, "".join(map(chr, unpacked[2:-1])).split('\x00'))
+
+    # CODE 21: Current Patch Name
+    def decode21(self, msg):
+        unpacked = sysex.unpack(msg, 7, -1)
+        self.current_patch_name = "".join(map(chr, unpacked[3:])).split('\x00')[0]
+
+    # CODE 2C: Parameter changed on the device
+    def decode2C(self, msg):
+        unpacked = sysex.unpack(msg, 7, -1)
+        n, value = getnum(4, unpacked)
+        return self.patch.parameter_change(unpacked[2], unpacked[3], value)
+
+    # CODE 2D: Current patch number has changed
+    def decode2D(self, msg):
+        unpacked = sysex.unpack(msg, 7, -1)
+        self.current_patch_bank = unpacked[1]
+        self.current_patch_number = unpacked[2]
+
+    # CODE 2E: Patch saved under a new name
+    def decode2E(self, msg):
+        unpacked = sysex.unpack(msg, 7, -1)
+        self.current_patch_bank = unpacked[2]
+        self.current_patch_number = unpacked[3]
+        name = "".join(map(chr, unpacked[4:unpacked.index(0x00, 4)]))
+        self.rename_patch(self.current_patch_bank, self.current_patch_number, name)
+        self.current_patch_name = name
+
+    # names and current patch from a DeviceSnapshot, factory names are filled in if it doesn't have them
+    def apply_snapshot(self, snapshot):
+        self.set_user_names(dict(snapshot.user_amp_names), dict(snapshot.user_cab_names))
+        names = dict(snapshot.patch_names)
+        if 0 not in names:      # factory names never change
+            names[0] = [factory_patch_names[k] for k in sorted(factory_patch_names)]
+        for bank, bank_names in sorted(names.items()):
+            self.set_patch_names(bank, list(bank_names))
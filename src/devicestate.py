@@ -0,0 +1,99 @@
+# devicestate.py
+#
+# GNXEdit snapshot of the last known GNX1 state, kept in the config directory
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import time
+
+import common
+
+SNAPSHOT_VERSION = 2
+SNAPSHOT_FILE = "GNXEdit.state.json"
+BLOCK_KEYS = ["24", "3C06", "3D07", "3C08", "3D09", "26", "28"]     # as serialise_to_file()
+
+def snapshot_file():
+    return os.path.join(common.GNXEDIT_CONFIG_PATH, SNAPSHOT_FILE)
+
+class DeviceSnapshot:
+
+    def __init__(self):
+        self.channel = None
+        self.patch_names = {}           # bank: [names] as received in 0x13
+        self.user_amp_names = {}        # index: name, from 0x08
+        self.user_cab_names = {}
+        self.current_patch_bank = None
+        self.current_patch_number = None
+        self.current_patch_name = None
+        self.blocks = {}                # key in BLOCK_KEYS: patch dump frame as received
+        self.saved = None               # unix time
+
+    # complete enough to stand in for the name requests of a full sync
+    def usable(self):
+        return self.channel != None and 1 in self.patch_names
+
+    # enough to fill the faces before the device has answered
+    def has_patch(self):
+        return all(self.blocks.get(k) != None for k in BLOCK_KEYS)
+
+    def to_dict(self):
+        return {"version": SNAPSHOT_VERSION, "saved": self.saved, "channel": self.channel,
+                "patch_names": {str(k): v for k, v in self.patch_names.items()},
+                "user_amp_names": {str(k): v for k, v in self.user_amp_names.items()},
+                "user_cab_names": {str(k): v for k, v in self.user_cab_names.items()},
+                "current_patch": {"bank": self.current_patch_bank, "number": self.current_patch_number, "name": self.current_patch_name},
+                "blocks": {k: bytes(v).hex() for k, v in self.blocks.items()}}
+
+    @classmethod
+    def from_dict(cls, d):
+        s = cls()
+        s.saved = d.get("saved")
+        s.channel = d.get("channel")
+        s.patch_names = {int(k): v for k, v in d.get("patch_names", {}).items()}
+        s.user_amp_names = {int(k): v for k, v in d.get("user_amp_names", {}).items()}
+        s.user_cab_names = {int(k): v for k, v in d.get("user_cab_names", {}).items()}
+        current = d.get("current_patch", {})
+        s.current_patch_bank = current.get("bank")
+        s.current_patch_number = current.get("number")
+        s.current_patch_name = current.get("name")
+        s.blocks = {k: bytes.fromhex(v) for k, v in d.get("blocks", {}).items() if k in BLOCK_KEYS}
+        return s
+
+    # None if there is no snapshot or it is from another version
+    @classmethod
+    def load(cls, file = None):
+        if file == None:
+            file = snapshot_file()
+        try:
+            with open(file, "r") as f:
+                d = json.load(f)
+            if d.get("version") != SNAPSHOT_VERSION:
+                return None
+            return cls.from_dict(d)
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    # written to a temporary file first so a crash never leaves half a snapshot
+    def save(self, file = None):
+        if file == None:
+            file = snapshot_file()
+        self.saved = time.time()
+        temp = file + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(temp, file)
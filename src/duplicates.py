@@ -0,0 +1,231 @@
+# duplicates.py
+#
+# GNXEdit library duplicates: patches with the same parameters (whatever their name, or the channel they were
+# saved from) found through an index of fingerprints, and patches a few parameters apart found through their
+# parameter vectors
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# no Qt: the library tree and batch tools use it
+# a block's vector is its parameters as decoded for the patch diff, one slot each, so the live bytes of a dump
+# (pedal volume and the like) don't make two patches different; blocks the diff can't decode are one slot, their hash.
+# Vectors are kept with the blobs and fingerprints with the patches, each worked out once
+
+import array
+import hashlib
+import re
+
+import blobstore
+import librarydb
+import patchdiff
+import sysex
+from devicestate import BLOCK_KEYS
+from patchschema import SCHEMA
+
+NEAR_DISTANCE = 2                   # parameters two patches can differ in and still be near duplicates
+MISSING = -1                        # slot a block doesn't have
+
+SLOTS = {
+    "24": [(s.name, p.name) for s in SCHEMA for p in s.parameters],
+    "26": [(f"expression_{x}", p) for x in range(1, 4) for p in ["section", "parameter", "min", "max"]] +
+          [(f"lfo_{x}", p) for x in range(1, 3) for p in ["speed", "waveform", "section", "parameter", "max", "min"]],
+}
+SLOTS = {k: SLOTS.get(k, []) + [("block", k)] for k in BLOCK_KEYS}
+
+# BLOCK_KEYS key of a stored block
+def block_key(msg):
+    if msg[6] == 0x2A:
+        data = sysex.payload(msg)
+        return f"{data[3]:02X}{data[4]:02X}"
+    return f"{msg[6]:02X}"
+
+def block_vector(k, msg):
+    values = patchdiff.decode_block(k, msg)
+    vector = array.array("i", [MISSING] * len(SLOTS[k]))
+    for n, slot in enumerate(SLOTS[k]):
+        value = values.get(slot)
+        if slot[0] == "block" and value != None:
+            value = int(value, 16) & 0x7FFFFFFF
+        if isinstance(value, int):
+            vector[n] = value
+    return vector.tobytes()
+
+# columns for the vectors and fingerprints, their index and the trigger that forgets a changed patch's fingerprint;
+# a library migration (1.2), and made again when patches is rebuilt
+def create(cur):
+    cur.execute("PRAGMA table_info(blobs)")
+    if "vector" not in [row[1] for row in cur.fetchall()]:
+        cur.execute("ALTER TABLE blobs ADD COLUMN vector BLOB")
+    cur.execute("PRAGMA table_info(patches)")
+    if "fingerprint" not in [row[1] for row in cur.fetchall()]:
+        cur.execute("ALTER TABLE patches ADD COLUMN fingerprint BLOB")
+    cur.execute("CREATE INDEX IF NOT EXISTS patches_fingerprint ON patches (fingerprint)")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS patches_fingerprint_update AFTER UPDATE OF {', '.join(blobstore.COLUMNS)} ON patches BEGIN \
+                    UPDATE patches SET fingerprint = NULL WHERE id = NEW.id; END")
+
+def prepare(conn):
+    create(conn.cursor())
+    conn.commit()
+
+# vectors for new blobs and fingerprints for new or changed patches: (blobs, patches) worked out
+def update(conn):
+    prepare(conn)
+    cur = conn.cursor()
+    cur.execute("SELECT hash, data FROM blobs WHERE vector IS NULL")
+    blobs = [(block_vector(block_key(bytes(data)), bytes(data)), hash) for hash, data in cur.fetchall()]
+    cur.executemany("UPDATE blobs SET vector = ? WHERE hash = ?", blobs)
+
+    cur.execute(f"SELECT id, {', '.join(blobstore.COLUMNS)} FROM patches WHERE fingerprint IS NULL")
+    rows = cur.fetchall()
+    vectors = vectors_for(cur, [h for row in rows for h in row[1:]])
+    cur.executemany("UPDATE patches SET fingerprint = ? WHERE id = ?", [(fingerprint(row[1:], vectors), row[0]) for row in rows])
+    conn.commit()
+    return len(blobs), len(rows)
+
+def vectors_for(cur, hashes):
+    hashes = [h for h in set(bytes(h) for h in hashes if h != None)]
+    vectors = {}
+    for n in range(0, len(hashes), blobstore.CHUNK):
+        chunk = hashes[n:n + blobstore.CHUNK]
+        cur.execute(f"SELECT hash, vector FROM blobs WHERE hash IN ({', '.join('?' * len(chunk))})", chunk)
+        vectors.update({bytes(h): bytes(v) for h, v in cur.fetchall() if v != None})
+    return vectors
+
+# the blocks' vectors in BLOCK_KEYS order, a missing block all MISSING
+def patch_vector(hashes, vectors):
+    vector = array.array("i")
+    for k, h in zip(BLOCK_KEYS, hashes):
+        if h != None and bytes(h) in vectors:
+            vector.frombytes(vectors[bytes(h)])
+        else:
+            vector.extend([MISSING] * len(SLOTS[k]))
+    return vector
+
+def fingerprint(hashes, vectors):
+    return hashlib.sha1(patch_vector(hashes, vectors).tobytes()).digest()
+
+# patches in a category and below it (0, the library header, for all): [(id, name, category, fingerprint, hashes)]
+def patches(cur, category):
+    cur.execute(f"WITH RECURSIVE tree(id) AS (SELECT ? UNION SELECT c.id FROM categories AS c JOIN tree ON c.parent = tree.id) \
+                SELECT id, name, category, fingerprint, {', '.join(blobstore.COLUMNS)} FROM patches WHERE category IN tree ORDER BY id",
+                [category])
+    return [(row[0], row[1], row[2], bytes(row[3]) if row[3] != None else None, row[4:]) for row in cur.fetchall()]
+
+# groups of patches with the same fingerprint: [[(id, name, category)]], oldest first in each
+def exact(conn, category = 0):
+    update(conn)
+    groups = {}
+    for id, name, cat, fp, hashes in patches(conn.cursor(), category):
+        groups.setdefault(fp, []).append((id, name, cat))
+    return [members for members in groups.values() if len(members) > 1]
+
+# slots that differ between two vectors packed as packed(), every slot compared at once: the xor of a slot is folded
+# onto its lowest bit and those bits counted
+def distance_packed(a, b, low):
+    z = a ^ b
+    z |= z >> 16
+    z |= z >> 8
+    z |= z >> 4
+    z |= z >> 2
+    z |= z >> 1
+    return (z & low).bit_count()
+
+# a vector as one integer, 32 bits a slot
+def packed(vector):
+    return int.from_bytes(array.array("i", vector).tobytes(), "little")
+
+# groups of patches each within distance parameters of the group's first (oldest) patch, the one a merge keeps, exact
+# duplicates compared once and grouped together: [([(id, name, category)], [parameters from the first])], oldest first
+# in each. A patch goes to the oldest patch near it not already in a group, so a run of patches each a parameter from
+# the last is not one group however far its ends are apart
+# Vectors that differ in at most distance slots are the same in at least one of distance + 1 bands of slots
+# (every distance + 1th slot), so only patches sharing a band are compared
+def near(conn, category = 0, distance = NEAR_DISTANCE):
+    update(conn)
+    cur = conn.cursor()
+    rows = patches(cur, category)
+    same = {}
+    for row in rows:
+        same.setdefault(row[3], []).append(row)
+    rows = [members[0] for members in same.values()]
+    vectors = vectors_for(cur, [h for row in rows for h in row[4]])
+    points = [patch_vector(row[4], vectors) for row in rows]
+    if len(points) == 0:
+        return []
+
+    # slots that are the same in every patch tell them apart no better than the band without them
+    varying = [n for n in range(len(points[0])) if any(point[n] != points[0][n] for point in points)]
+    points = [[point[n] for n in varying] for point in points]
+    keys = [packed(point) for point in points]
+    low = int.from_bytes(bytes([1, 0, 0, 0]) * len(varying), "little")
+
+    bands = distance + 1
+    buckets = {}
+    for n, point in enumerate(points):
+        for band in range(bands):
+            buckets.setdefault((band, tuple(point[band::bands])), []).append(n)
+
+    # rows are oldest first, so a patch not yet grouped starts a group of the later ones near it
+    grouped = set()
+    groups = []
+    for first, point in enumerate(points):
+        if first in grouped:
+            continue
+        found = {}
+        compared = set()                # for another band
+        for band in range(bands):
+            for n in buckets[(band, tuple(point[band::bands]))]:
+                if n > first and n not in grouped and n not in compared:
+                    compared.add(n)
+                    d = distance_packed(keys[first], keys[n], low)
+                    if d <= distance:
+                        found[n] = d
+        grouped.update(found)
+        members = [(row[:3], 0) for row in same[rows[first][3]]]
+        for n, d in found.items():
+            members += [(row[:3], d) for row in same[rows[n][3]]]
+        if len(members) > 1:
+            members.sort()
+            groups.append(([m[0] for m in members], [m[1] for m in members]))
+    return groups
+
+# [(keep, others)]: in each group the others deleted and their tags added to keep's, every group in one
+# transaction, all or nothing; returns the ids deleted
+def merge(conn, groups):
+    groups = [(keep, [id for id in others if id != keep]) for keep, others in groups]
+    groups = [(keep, others) for keep, others in groups if len(others) > 0]
+    ids = [id for keep, others in groups for id in [keep] + others]
+    with librarydb.transaction(conn) as cur:
+        tags = {}
+        for n in range(0, len(ids), blobstore.CHUNK):
+            chunk = ids[n:n + blobstore.CHUNK]
+            cur.execute(f"SELECT id, tags FROM patches WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+            tags.update(cur.fetchall())
+        deleted = []
+        for keep, others in groups:
+            if keep not in tags:
+                raise Exception(f"No patch with id {keep}")
+            words = []
+            for id in [keep] + others:
+                for w in re.split(r"[\s,]+", tags.get(id) or ""):
+                    if w != "" and w not in words:
+                        words.append(w)
+            cur.execute("UPDATE patches SET tags = ? WHERE id = ?", [" ".join(words), keep])
+            deleted += [id for id in others if id in tags]
+        for n in range(0, len(deleted), blobstore.CHUNK):
+            chunk = deleted[n:n + blobstore.CHUNK]
+            cur.execute(f"DELETE FROM patches WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+    return deleted
@@ -0,0 +1,2 @@
+REM GNXEdit command line backup, restore and verify for Windows, e.g. gnxedit-cli backup
+"%~dp0..\.venv\Scripts\python" "%~dp0cli.py" %*
\ No newline at end of file
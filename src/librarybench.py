@@ -0,0 +1,167 @@
+# librarybench.py
+#
+# GNXEdit library benchmarks: loading the library tree and deleting categories in a large synthetic library,
+# at library version 1.2 with the queries of the time (no indexes, orphans cleaned up as deleteCategory used to)
+# and at the current version
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+import blobstore
+import librarydb
+import migrations
+from duplicates import block_key
+from VirtualGNX1 import read_midiox_log, DEFAULT_CAPTURE
+
+SOURCE_LIBRARY = os.path.join(os.path.dirname(__file__), "GNXEdit.db")
+
+# the library tree and deleteCategory as they were before library version 1.3
+OLD_TREE_QUERY = "SELECT NULL AS cat_parent, 0 AS cat_id, 'LIBRARY' AS cat_name, \
+                    p.type AS patch_type, p.id AS patch_id, p.name AS patch_name, p.description AS patch_description, p.tags AS patch_tags, \
+                    0 AS parent_id FROM \
+                        (SELECT 'patch' AS type, id, name, description, tags, category FROM patches WHERE category = 0 \
+                            UNION SELECT 'amp' AS type, id, name, description, tags, category FROM amps WHERE category = 0) AS p \
+                UNION \
+                SELECT c.parent AS cat_parent, c.id AS cat_id, c.name AS cat_name, \
+                    p.type AS patch_type, p.id AS patch_id, p.name AS patch_name, p.description AS patch_description, p.tags AS patch_tags, \
+                    c2.id AS parent_id \
+                    FROM categories AS c \
+                    LEFT JOIN \
+                        (SELECT 'patch' AS type, id, name, description, tags, category FROM patches \
+                            UNION SELECT 'amp' AS type, id, name, description, tags, category FROM amps) \
+                    AS p ON p.category = c.id \
+                    LEFT JOIN categories AS c2 on c.parent = c2.id \
+                    WHERE cat_parent IS NOT NULL \
+                    ORDER by cat_parent, cat_id, patch_name ASC"
+
+def old_delete(conn, category):
+    cur = conn.cursor()
+    cur.execute("DELETE FROM categories WHERE parent = ? OR id = ?", [category, category])
+    conn.commit()
+    while True:
+        cur.execute("DELETE FROM categories WHERE id IN \
+                        (SELECT c.id AS id FROM categories AS c \
+                            LEFT JOIN categories AS c2 ON c.parent = c2.id \
+                            WHERE c2.id IS NULL AND c.parent <> 0)")
+        conn.commit()
+        if cur.rowcount == 0:
+            break
+    cur.execute("DELETE FROM patches WHERE id IN \
+                    (SELECT p.id AS id FROM patches AS p \
+                        LEFT JOIN categories AS c ON p.category = c.id \
+                        WHERE c.id IS NULL)")
+    cur.execute("DELETE FROM amps WHERE id IN \
+                    (SELECT p.id AS id FROM amps AS p \
+                        LEFT JOIN categories AS c ON p.category = c.id \
+                        WHERE c.id IS NULL)")
+    conn.commit()
+
+def new_delete(conn, category):
+    conn.execute("DELETE FROM categories WHERE id = ?", [category])
+    conn.commit()
+
+# top categories, each with groups below it and sets below those, the patches spread over the sets and the root;
+# patches share most of their blocks, as a library does. Returns the ids of the top categories and of the sets
+def build(conn, patches, top, groups, members):
+    frames = {block_key(f): f for f in read_midiox_log(DEFAULT_CAPTURE) if f[6] in (0x24, 0x26, 0x28, 0x2A)}
+    rng = random.Random(1959)
+    sets = []
+    tops = []
+    with librarydb.transaction(conn) as cur:
+        for t in range(top):
+            cur.execute("INSERT INTO categories (parent, name) VALUES (0, ?)", [f"TOP {t}"])
+            tops.append(cur.lastrowid)
+            for g in range(groups):
+                cur.execute("INSERT INTO categories (parent, name) VALUES (?, ?)", [tops[-1], f"GROUP {t}.{g}"])
+                group = cur.lastrowid
+                for s in range(members):
+                    cur.execute("INSERT INTO categories (parent, name) VALUES (?, ?)", [group, f"SET {t}.{g}.{s}"])
+                    sets.append(cur.lastrowid)
+        homes = [0] + sets
+        for n in range(patches):
+            blocks = dict(frames)
+            main = bytearray(frames["24"])
+            main[20] = rng.randrange(128)
+            main[30] = rng.randrange(8)
+            blocks["24"] = bytes(main)
+            blobstore.insert_patch(cur, rng.choice(homes), f"PATCH {n}", "", "", blocks)
+    return tops, sets
+
+def tree_load(conn, query, repeat):
+    times = []
+    for n in range(repeat):
+        started = time.perf_counter()
+        rows = conn.execute(query).fetchall()
+        times.append(time.perf_counter() - started)
+    return min(times), len(rows)
+
+def deletes(conn, delete, categories):
+    times = []
+    for category in categories:
+        started = time.perf_counter()
+        delete(conn, category)
+        times.append(time.perf_counter() - started)
+    return statistics.mean(times)
+
+def count(conn, table):
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Time loading the library tree and deleting categories, before and after library version 1.3.")
+    parser.add_argument("--patches", type = int, default = 20000)
+    parser.add_argument("--top", type = int, default = 20, help = "top level categories, each with --groups below it")
+    parser.add_argument("--groups", type = int, default = 5, help = "groups in a top level category, each with --sets below it")
+    parser.add_argument("--sets", type = int, default = 4)
+    parser.add_argument("--deletes", type = int, default = 5, help = "top level categories deleted, and sets from the others")
+    parser.add_argument("--repeat", type = int, default = 5, help = "tree loads, the fastest reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        old = os.path.join(folder, "old.db")
+        new = os.path.join(folder, "new.db")
+        shutil.copy(SOURCE_LIBRARY, old)
+        conn = librarydb.connect(old)
+        migrations.run(conn, until = "1.2")
+        started = time.perf_counter()
+        tops, sets = build(conn, args.patches, args.top, args.groups, args.sets)
+        conn.close()
+        print(f"{args.patches} patches in {len(tops) * (1 + args.groups * (1 + args.sets))} categories built in {time.perf_counter() - started:.1f} s")
+        shutil.copy(old, new)
+
+        results = []
+        for label, file, query, delete in [("1.2", old, OLD_TREE_QUERY, old_delete), (migrations.VERSION, new, librarydb.TREE_QUERY, new_delete)]:
+            conn = librarydb.connect(file)
+            started = time.perf_counter()
+            applied = migrations.run(conn, until = label)
+            migrated = time.perf_counter() - started
+            load, rows = tree_load(conn, query, args.repeat)
+            removed = deletes(conn, delete, tops[:args.deletes])
+            emptied = deletes(conn, delete, sets[-args.deletes:])
+            results.append((label, load, rows, removed, emptied, count(conn, "patches"), count(conn, "categories")))
+            if len(applied) > 0:
+                print(f"migrated to {migrations.VERSION} in {migrated:.2f} s")
+            conn.close()
+
+        print(f"{'version':8s} {'tree load':>12s} {'tree rows':>10s} {'delete top':>12s} {'delete set':>12s} {'patches left':>13s} {'categories':>11s}")
+        for label, load, rows, removed, emptied, patches, categories in results:
+            print(f"{label:8s} {load * 1000:9.1f} ms {rows:10d} {removed * 1000:9.1f} ms {emptied * 1000:9.1f} ms {patches:13d} {categories:11d}")
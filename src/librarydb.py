@@ -0,0 +1,195 @@
+# librarydb.py
+#
+# GNXEdit library database connections: one long-lived connection per thread in WAL mode, statements cached
+# by sqlite3 for the life of the connection and every statement timed
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# no Qt: gnxDB hands out these connections in the editor, gnxedit-cli opens its own
+# gnxDB users close the connection after every operation (most of them); closing a shared connection only resets it,
+# it stays open until close_all
+
+import contextlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import stats
+
+QUERY_BUCKETS_MS = (0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 500)
+CACHED_STATEMENTS = 256             # per connection, sqlite3's default is 128
+REPORT_LINES = 20                   # statements in report(), most time first
+
+PRAGMAS = [
+    ("journal_mode", "WAL"),        # readers don't wait for the writer, commits append to the log
+    ("synchronous", "NORMAL"),      # with WAL only a checkpoint waits for the disk
+    ("cache_size", -16384),         # KiB of page cache
+    ("mmap_size", 128 * 1024 * 1024),
+    ("temp_store", "MEMORY"),
+    ("foreign_keys", "ON"),         # deleting a category deletes what is in it (library version 1.3 on)
+]
+
+# the library tree: one row for each patch or amp with its category, a row for each empty category; the library root
+# (category 0) first. Every row is different already (UNION ALL, nothing to sort out), the join looks patches up
+# through patches_category and parents need no join, a category's parent is there (library version 1.3)
+TREE_QUERY = "SELECT NULL AS cat_parent, 0 AS cat_id, 'LIBRARY' AS cat_name, \
+                p.type AS patch_type, p.id AS patch_id, p.name AS patch_name, p.description AS patch_description, p.tags AS patch_tags, \
+                0 AS parent_id FROM \
+                    (SELECT 'patch' AS type, id, name, description, tags, category FROM patches WHERE category = 0 \
+                        UNION ALL SELECT 'amp' AS type, id, name, description, tags, category FROM amps WHERE category = 0) AS p \
+            UNION ALL \
+            SELECT c.parent AS cat_parent, c.id AS cat_id, c.name AS cat_name, \
+                p.type AS patch_type, p.id AS patch_id, p.name AS patch_name, p.description AS patch_description, p.tags AS patch_tags, \
+                c.parent AS parent_id \
+                FROM categories AS c \
+                LEFT JOIN \
+                    (SELECT 'patch' AS type, id, name, description, tags, category FROM patches \
+                        UNION ALL SELECT 'amp' AS type, id, name, description, tags, category FROM amps) \
+                AS p ON p.category = c.id \
+                WHERE c.id <> 0 \
+                ORDER by cat_parent, cat_id, patch_name ASC"
+
+timings = stats.Histograms(QUERY_BUCKETS_MS, "ms")     # per statement, fetches separately as "fetch: ..."
+
+local = threading.local()
+lock = threading.Lock()
+shared = []                         # (thread, path, connection) for every thread's connection
+
+# statements that differ only in the length of an IN (?, ?, ...) list or in layout are the same statement
+def label(sql):
+    sql = re.sub(r"\s+", " ", sql).strip()
+    return re.sub(r"\?(, \?)+", "?...", sql)
+
+class TimedCursor(sqlite3.Cursor):
+
+    def execute(self, sql, parameters = ()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.sql = label(sql)
+            timings.record(self.sql, (time.perf_counter() - started) * 1000)
+
+    def executemany(self, sql, parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            self.sql = label(sql)
+            timings.record(self.sql, (time.perf_counter() - started) * 1000)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        timings.record(f"fetch: {getattr(self, 'sql', '')}", (time.perf_counter() - started) * 1000)
+        return rows
+
+class LibraryConnection(sqlite3.Connection):
+
+    shared = False
+    closed = False
+
+    def cursor(self, factory = TimedCursor):
+        return super().cursor(factory)
+
+    # sqlite3's own shortcuts make a plain cursor
+    def execute(self, sql, parameters = ()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor().executemany(sql, parameters)
+
+    def close(self):
+        if not self.shared:
+            super().close()
+            return
+        self.reset()
+
+    # as a fresh connection would be: anything not committed rolled back, no row factory
+    def reset(self):
+        if self.in_transaction:
+            self.rollback()
+        self.row_factory = None
+
+    # handed out again on its thread: no row factory, but a transaction still open belongs to whoever opened it
+    # (a caller further up this thread), so it is left alone and reported rather than rolled back
+    def reuse(self):
+        if self.in_transaction:
+            print("Library connection handed out with a transaction open, left for its owner to finish")
+        self.row_factory = None
+
+    def close_shared(self):
+        self.closed = True
+        super().close()
+
+# a connection of its own, tuned as the shared ones are
+def connect(path):
+    conn = sqlite3.connect(path, factory = LibraryConnection, cached_statements = CACHED_STATEMENTS, check_same_thread = False)
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+# this thread's connection to the library, opened on first use
+def connection(path):
+    path = os.path.abspath(path)
+    connections = getattr(local, "connections", None)
+    if connections == None:
+        connections = local.connections = {}
+    conn = connections.get(path)
+    if conn == None or conn.closed:
+        conn = connections[path] = connect(path)
+        conn.shared = True
+        with lock:
+            # threads come and go with the device manager, their connections go with them
+            for entry in [e for e in shared if not e[0].is_alive()]:
+                shared.remove(entry)
+                entry[2].close_shared()
+            shared.append((threading.current_thread(), path, conn))
+    return conn
+
+# when the application quits, the last close checkpoints the log back into the library file
+def close_all():
+    with lock:
+        for thread, path, conn in shared:
+            try:
+                conn.close_shared()
+            except sqlite3.Error:
+                pass
+        shared.clear()
+
+# BEGIN ... COMMIT around the block, ROLLBACK if anything in it raises. A transaction already open is somebody
+# else's to commit or roll back, so it is an error rather than committed here
+@contextlib.contextmanager
+def transaction(conn):
+    if conn.in_transaction:
+        raise sqlite3.ProgrammingError("library transaction started while another is open")
+    cur = conn.cursor()
+    cur.execute("BEGIN")
+    try:
+        yield cur
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+def report(lines = REPORT_LINES):
+    busiest = sorted([(h.total, name, h) for name, h in timings.histograms.items() if h.count > 0], key = lambda x: x[0], reverse = True)
+    text = [f"{'count':>7s} {'total':>9s} {'mean':>8s} {'p95':>6s} {'max':>8s}  statement (ms)"]
+    for total, name, h in busiest[:lines]:
+        text.append(f"{h.count:7d} {total:9.2f} {h.mean():8.3f} {h.percentile(95):6g} {h.max:8.2f}  {name[:100]}")
+    return "\n".join(text)
@@ -1,16 +1,18 @@
 # File: main.py
+import time
+APP_STARTED = time.perf_counter()       # before the Qt imports, for the startup timing
 import sys
 import os 
-import time
 import importlib
 from MIDIControl import MIDIControl
 
 from PySide6.QtUiTools import QUiLoader
 from PySide6.QtWidgets import QApplication, QMessageBox
-from PySide6.QtCore import QFile, QIODevice, QObject, QEvent, Qt
+from PySide6.QtCore import QFile, QIODevice, QObject, QEvent, Qt, QTimer
 from PySide6.QtGui import QKeyEvent
 
 import common
+import librarydb
 import settings
 from exceptions import GNXError
 from menu import MenuHandler
@@ -33,6 +35,7 @@ from customwidgets.warpface import WarpFace
 from customwidgets.whammyface import WhammyFace
 
 from GNX1 import GNX1
+from devicemanager import DeviceManager
 
 def showAlert(e):
     clicked = e.alert()
@@ -57,6 +60,30 @@ class KeyPressEater(QObject):
 
         return super().eventFilter(ob, event)
 
+# cold start milestones, printed when logging.startup_timing is set
+class StartupTimer(QObject):
+
+    def __init__(self, parent, gnx):
+        super().__init__(parent)
+        self.marks = {}
+        parent.installEventFilter(self)         # until the first paint
+        gnx.commsModeChanged.connect(self.comms_mode_changed)
+
+    def mark(self, name):
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter()
+            print(f"startup: {name} {(self.marks[name] - APP_STARTED) * 1000:.1f} ms")
+
+    def eventFilter(self, ob, event):
+        if event.type() == QEvent.Paint:
+            self.mark("first paint")
+            self.parent().removeEventFilter(self)
+        return super().eventFilter(ob, event)
+
+    def comms_mode_changed(self, oldmode, newmode):
+        if oldmode == common.COMMS_MODE_SYNC and newmode == common.COMMS_MODE_NONE:
+            self.mark("synced")
+
 if __name__ == "__main__":
 
     os.environ["QT_LOGGING_RULES"]='*.debug=false;qt.pysideplugin=false'     # stop pyside custom plugin errors
@@ -110,10 +137,29 @@ if __name__ == "__main__":
         treeHandler.setGNX(gnx)
         treeHandler.gnxAlert.connect(showAlert)
 
+        # other GNX1 units, found from the MIDI menu and used by the librarian
+        deviceManager = DeviceManager(midicontrol)
+        deviceManagerTimer = QTimer()
+        deviceManagerTimer.setInterval(20)
+        deviceManagerTimer.timeout.connect(deviceManager.poll)
+        deviceManagerTimer.start()
+        app.aboutToQuit.connect(deviceManager.close)
+        menuHandler.setDeviceManager(deviceManager)
+        treeHandler.setDeviceManager(deviceManager)
+
         if not window:
             print(loader.errorString())
             sys.exit(-1)
 
+        startupTimer = None
+        if common.GNXEDIT_CONFIG.get("logging", {}).get("startup_timing", False):
+            startupTimer = StartupTimer(app, gnx)
+            startupTimer.mark("window loaded")
+
+        # last session's patch and names on screen before the device has answered
+        if gnx.load_cache() and startupTimer != None:
+            startupTimer.mark("cache applied")
+
         midicontrol.open_ports()    
         window.showMaximized()
 
@@ -127,6 +173,9 @@ if __name__ == "__main__":
 
 
     sx = app.exec()
+    if common.GNXEDIT_CONFIG.get("logging", {}).get("database_stats", False):
+        print(librarydb.report())
+    librarydb.close_all()
     settings.save_settings()
     sys.exit(sx)
 
@@ -20,7 +20,7 @@
 from PySide6.QtCore import Slot, Signal, QObject
 from PySide6.QtGui import QAction
 from PySide6.QtUiTools import QUiLoader
-from PySide6.QtWidgets import QMenu, QMenuBar, QComboBox, QMessageBox
+from PySide6.QtWidgets import QMenu, QMenuBar, QComboBox, QMessageBox, QFileDialog
 from PySide6.QtCore import QFile, QIODevice, Qt
 
 import common
@@ -31,6 +31,7 @@ class MenuHandler():
     def __init__(self, window = None, midicontrol = None, gnx = None):
         self.window = window
         self.midicontrol = midicontrol
+        self.devicemanager = None
 
         self.menubar = window.findChild(QMenuBar, "mainMenuBar")
 
@@ -53,6 +54,12 @@ class MenuHandler():
             match n:
                 case "actionMIDIInterface":
                     a.triggered.connect(self.midicontrol.openMIDIDialog)
+                case "actionDiscoverDevices":
+                    a.triggered.connect(self.discoverDevices)
+                case "actionSaveTimingStats":
+                    a.triggered.connect(self.saveTimingStats)
+                case "actionResetTimingStats":
+                    a.triggered.connect(self.resetTimingStats)
                 case _:
                     if not a.isSeparator():
                         print(f"Unrecognised MIDI menu option {n}")
@@ -81,6 +88,28 @@ class MenuHandler():
     def help(self):
         get_help()
 
+    def setDeviceManager(self, devicemanager):
+        self.devicemanager = devicemanager
+
+    def discoverDevices(self):
+        def found(future):
+            units = future.result
+            if len(units) == 0:
+                text = "No GNX1 units answered"
+            else:
+                text = "\n".join(f"{u.label}{' (editing)' if u.editor else ''}" for u in units)
+            QMessageBox.information(self.window, "GNX1 Units", text)
+
+        self.devicemanager.discover().add_done_callback(found)
+
+    def saveTimingStats(self):
+        file, filter = QFileDialog.getSaveFileName(self.window, "Save Timing Statistics", "GNXEdit-timing.json", "JSON files (*.json)")
+        if file:
+            self.gnx.save_timing_stats(file)
+
+    def resetTimingStats(self):
+        self.gnx.reset_timing_stats()
+
     # to set gnx after init
     def setGNX(self, gnx):
         self.gnx = gnx
@@ -94,7 +123,7 @@ class MenuHandler():
             n = a.objectName()
             match n:
                 case "actionResync":
-                    a.triggered.connect(self.gnx.midi_resync)
+                    a.triggered.connect(self.gnx.full_resync)
                 case "actionSaveAmp":
                     a.triggered.connect(self.gnx.save_amp_to_gnx)
                 case "actionSaveAmpToLibrary":
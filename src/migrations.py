@@ -0,0 +1,151 @@
+# migrations.py
+#
+# GNXEdit library migrations: the schema version kept in the app table, and the steps from each version to the
+# next, each run in a transaction of its own after the library has been backed up
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# no Qt: the editor runs them when it starts, gnxedit-cli before it touches a library
+# a step is step(cur), inside the transaction that also sets the new version; a later schema change is a step added
+# to the end of MIGRATIONS. Foreign keys are off while the steps run (tables are rebuilt under them) and every
+# reference checked before each step commits
+
+import os
+import sqlite3
+
+import blobstore
+import duplicates
+import librarydb
+
+FIRST_VERSION = "1.0"               # as shipped, and any library without a version
+
+# the library root (category 0, where it always was) as a row of its own, so every category and patch refers to a
+# category that is there; then deleting a category deletes everything in it
+def categories(cur):
+    cur.execute("INSERT OR IGNORE INTO categories (id, parent, name) VALUES (0, 0, 'LIBRARY')")
+    cur.execute("UPDATE categories SET parent = 0 WHERE parent IS NULL OR parent NOT IN (SELECT id FROM categories)")
+    for table in ["patches", "amps"]:
+        cur.execute(f"UPDATE {table} SET category = 0 WHERE category IS NULL OR category NOT IN (SELECT id FROM categories)")
+
+    rebuild(cur, "categories", {"parent": "categories (id)"})
+    rebuild(cur, "patches", {"category": "categories (id)"})
+    rebuild(cur, "amps", {"category": "categories (id)"})
+    cur.execute("CREATE INDEX IF NOT EXISTS categories_parent ON categories (parent)")
+    cur.execute("CREATE INDEX IF NOT EXISTS patches_category ON patches (category, name)")
+    cur.execute("CREATE INDEX IF NOT EXISTS amps_category ON amps (category, name)")
+    blobstore.create(cur)               # triggers and indexes went with the old tables
+    duplicates.create(cur)
+
+# a table made again with its columns as they are, references ({column: "table (column)"}) added to columns that
+# may not be NULL, rows and the AUTOINCREMENT sequence kept
+def rebuild(cur, table, references):
+    cur.execute(f"PRAGMA table_info({table})")
+    columns = cur.fetchall()
+    definitions = []
+    for cid, name, type, notnull, default, pk in columns:
+        definition = f"{name} {type}"
+        if pk:
+            definition += " PRIMARY KEY AUTOINCREMENT"
+        if notnull or name in references:
+            definition += " NOT NULL"
+        if default != None:
+            definition += f" DEFAULT ({default})"
+        elif name in references:
+            definition += " DEFAULT (0)"
+        if name in references:
+            definition += f" REFERENCES {references[name]} ON DELETE CASCADE"
+        definitions.append(definition)
+    names = ", ".join(column[1] for column in columns)
+
+    cur.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", [table])
+    seq = cur.fetchone()
+    cur.execute(f"CREATE TABLE {table}_rebuilt ({', '.join(definitions)})")
+    cur.execute(f"INSERT INTO {table}_rebuilt ({names}) SELECT {names} FROM {table}")
+    cur.execute(f"DROP TABLE {table}")
+    cur.execute(f"ALTER TABLE {table}_rebuilt RENAME TO {table}")
+    if seq != None:
+        cur.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = ?", [seq[0], table])
+        if cur.rowcount == 0:
+            cur.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", [table, seq[0]])
+
+# (version, what it does, step), oldest first
+MIGRATIONS = [
+    ("1.1", "patch blocks moved to the block store", blobstore.move),
+    ("1.2", "patch fingerprints for finding duplicates", duplicates.create),
+    ("1.3", "library root category, references between categories and patches, category indexes", categories),
+]
+VERSION = MIGRATIONS[-1][0]         # of a library this editor has migrated
+
+def version_key(version):
+    return tuple(int(n) for n in version.split("."))
+
+def version(cur):
+    cur.execute("SELECT version FROM app")
+    row = cur.fetchone()
+    return row[0] if row != None and row[0] != None else FIRST_VERSION
+
+# the steps still to run on a library, up to version until: [(version, description, step)]
+def pending(conn, until = VERSION):
+    current = version_key(version(conn.cursor()))
+    return [m for m in MIGRATIONS if current < version_key(m[0]) <= version_key(until)]
+
+# a copy of the library as it is, next to it: GNXEdit.db at 1.0 is GNXEdit-1.0.bak.db
+def backup(conn, current):
+    cur = conn.cursor()
+    cur.execute("PRAGMA database_list")
+    path = [row[2] for row in cur.fetchall() if row[1] == "main"][0]
+    file = f"{os.path.splitext(path)[0]}-{current}.bak.db"
+    target = sqlite3.connect(file)
+    try:
+        conn.backup(target)
+    finally:
+        target.close()
+    return file
+
+# every pending step, each all or nothing; returns [(version, description, result)] for the steps run.
+# A step that fails leaves the library at the version before it and raises, naming the backup
+def run(conn, until = VERSION):
+    steps = pending(conn, until)
+    if len(steps) == 0:
+        return []
+    current = version(conn.cursor())
+    file = backup(conn, current)
+
+    applied = []
+    if conn.in_transaction:             # foreign keys can't be turned off inside one
+        raise sqlite3.ProgrammingError("library update started while a transaction is open")
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        for number, description, step in steps:
+            try:
+                with librarydb.transaction(conn) as cur:
+                    result = step(cur)
+                    cur.execute("PRAGMA foreign_key_check")
+                    broken = cur.fetchall()
+                    if len(broken) > 0:
+                        raise Exception(f"{len(broken)} broken references, the first in {broken[0][0]} row {broken[0][1]}")
+                    cur.execute("UPDATE app SET version = ?", [number])
+                    if cur.rowcount == 0:
+                        cur.execute("INSERT INTO app (version) VALUES (?)", [number])
+            except Exception as e:
+                raise Exception(f"Library update to version {number} ({description}) failed, the library is at version {current}.\n"
+                                f"A copy from before the update is in {file}\n{e}")
+            applied.append((number, description, result))
+            current = number
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("VACUUM")              # give back the space rebuilt tables took
+    return applied
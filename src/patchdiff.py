@@ -0,0 +1,134 @@
+# patchdiff.py
+#
+# GNXEdit patch differences: two patches decoded through the patch schema and compared parameter by parameter,
+# decoded blocks cached by their hash so a whole library category can be compared at once
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# no Qt: the library tree, gnxedit-cli and batch tools all use it
+
+from collections import OrderedDict
+
+import blobstore
+import patchschema
+from blobstore import block_hash
+from devicemodel import Patch
+from devicestate import BLOCK_KEYS
+
+CACHE_SIZE = 4096                   # decoded blocks kept, a library patch has 7
+
+# assignment to an expression pedal or LFO, the parameter means nothing when the section is off (0xFF)
+def assignment(section, parameter):
+    return section, parameter if section != 0xFF else 0xFF
+
+# {(section, parameter): value} for one block; blocks not decoded (0x28, the custom amp/cab blocks or a dump
+# the schema can't read) are one value, their hash
+def decode_block(k, msg):
+    try:
+        if k == "24":
+            return {(section, parameter): value for section, values in patchschema.decode24(msg).sections.items()
+                    for parameter, value in values.items()}
+        if k == "26":
+            patch = Patch()
+            patch.decode26(msg)
+            values = {}
+            for x, (a, p) in enumerate(zip(patch.expression["assignment"], patch.expression["params"])):
+                section = f"expression_{x + 1}"
+                values[(section, "section")], values[(section, "parameter")] = assignment(a["section"], a["parameter"])
+                values.update({(section, "min"): p["min"], (section, "max"): p["max"]})
+            for x, lfo in patch.lfo.items():
+                values.update({(f"lfo_{x + 1}", parameter): value for parameter, value in lfo.items()})
+                values[(f"lfo_{x + 1}", "section")], values[(f"lfo_{x + 1}", "parameter")] = assignment(lfo["section"], lfo["parameter"])
+            return values
+    except Exception:
+        pass
+    return {("block", k): block_hash(msg).hex()[:8]}
+
+class PatchDiff:
+
+    def __init__(self, size = CACHE_SIZE):
+        self.size = size
+        self.cache = OrderedDict()          # blob hash: decoded block, least recently used first
+        self.hits = 0
+        self.misses = 0
+
+    def decoded(self, k, msg, key = None):
+        key = key or block_hash(msg)
+        values = self.cache.get(key)
+        if values != None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return values
+        self.misses += 1
+        values = decode_block(k, msg)
+        self.cache[key] = values
+        if len(self.cache) > self.size:
+            self.cache.popitem(last = False)
+        return values
+
+    # [(section, parameter, old, new)] in schema order, None where a side doesn't have the parameter;
+    # blocks with the same hash are skipped without decoding, hashes already known (as the library stores them) are used
+    def diff(self, old, new, old_hashes = None, new_hashes = None):
+        differences = []
+        for k in BLOCK_KEYS:
+            a = old.get(k)
+            b = new.get(k)
+            if a == None or b == None:
+                if a != b:
+                    differences.append(("block", k, None if a == None else "present", None if b == None else "present"))
+                continue
+            ka = old_hashes[k] if old_hashes != None else block_hash(a)
+            kb = new_hashes[k] if new_hashes != None else block_hash(b)
+            if ka == kb:
+                continue
+            va = self.decoded(k, a, ka)
+            vb = self.decoded(k, b, kb)
+            for key in list(va) + [key for key in vb if key not in va]:
+                if va.get(key) != vb.get(key):
+                    differences.append(key + (va.get(key), vb.get(key)))
+        return differences
+
+    # patches in a library category and those below it, each against blocks: [(id, name, differences)], closest first;
+    # a block shared by many patches is read from the store once
+    def diff_category(self, conn, category, blocks):
+        cur = conn.cursor()
+        cur.execute("WITH RECURSIVE tree(id) AS (SELECT ? UNION SELECT c.id FROM categories AS c JOIN tree ON c.parent = tree.id) \
+                    SELECT id, name, " + ", ".join(blobstore.COLUMNS) + " FROM patches WHERE category IN tree", [category])
+        rows = cur.fetchall()
+        data = blobstore.fetch(cur, [bytes(h) for row in rows for h in row[2:] if h != None])
+        hashes = {k: block_hash(msg) for k, msg in blocks.items()}
+        results = []
+        for row in rows:
+            known = {k: bytes(h) for k, h in zip(BLOCK_KEYS, row[2:]) if h != None}
+            other = {k: data[h] for k, h in known.items() if h in data}
+            results.append((row[0], row[1], self.diff(other, blocks, known, hashes)))
+        results.sort(key = lambda r: len(r[2]))
+        return results
+
+    def report(self):
+        return f"{len(self.cache)} blocks cached, {self.hits} hits, {self.misses} misses"
+
+# differences as text, labels from the schema where it has them
+def describe(differences):
+    lines = []
+    for section, parameter, old, new in differences:
+        if section in patchschema.BY_NAME:
+            p = patchschema.BY_NAME[section].by_name.get(parameter)
+            old, new = [v if v == None or p == None else p.label(v) for v in (old, new)]
+        lines.append(f"{section}.{parameter}: {old} -> {new}")
+    return lines
+
+DIFFER = PatchDiff()                # shared, the cache is the point
@@ -0,0 +1,275 @@
+# patchschema.py
+#
+# GNXEdit GNX1 patch schema: the sections of the 0x24 dump, their parameters and ranges, in one table
+# that the decoder, encoder and validator all work from
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# no Qt: the model, the editor and batch tools decode, build and check patches through it
+
+import sysex
+from customwidgets.utils import compile_number
+from customwidgets.factory import factory_onoff, factory_pickup_names, factory_wah_types, factory_compressor_attack, \
+    factory_compressor_ratio, factory_whammy_shift, factory_ips_shift, factory_ips_scale, factory_ips_key, factory_waveforms
+
+MNFR_ID = [0x00, 0x00, 0x10]
+DEVICE_ID = 0x56
+
+# one value: its name, and the values it can take, a range or the labels for each value (None for unchecked)
+class Parameter:
+
+    def __init__(self, name, maximum = None, labels = None, minimum = 0):
+        self.name = name
+        self.labels = labels
+        self.minimum = minimum
+        self.maximum = max(labels) if labels != None else maximum
+
+    def valid(self, value):
+        if self.labels != None:
+            return value in self.labels
+        return self.maximum == None or self.minimum <= value <= self.maximum
+
+    def label(self, value):
+        if self.labels != None:
+            return self.labels.get(value, str(value))
+        return str(value)
+
+# one effect in the 0x24 dump: marker, effect code bytes, value count, type, then the values in 0x2C order
+# variants: for sections where the values depend on the type, those present and their ranges by type
+class Section:
+
+    def __init__(self, code, name, title, marker, parameters, codes = 0, variants = None, effect_code = None):
+        self.code = code                    # section number in 0x2C
+        self.name = name
+        self.title = title
+        self.marker = bytes(marker)
+        self.parameters = parameters        # every parameter, by number in 0x2C
+        self.codes = codes                  # bytes after the marker that change with the type
+        self.effect_code = effect_code      # type: those bytes, None when only a received dump knows them
+        self.by_name = {p.name: p for p in parameters}
+        self.variants = {}
+        for type, overrides in (variants or {}).items():
+            self.variants[type] = [self.by_name[p] if isinstance(p, str) else p for p in overrides]
+
+    def names(self):
+        return [p.name for p in self.parameters]
+
+    # the parameters after the type as they are in the dump, None for a type it doesn't have
+    def layout(self, type):
+        if not self.variants:
+            return self.parameters[1:]
+        variant = self.variants.get(type)
+        if variant == None:
+            return None
+        return [self.by_name["on"]] + variant
+
+    def parameter(self, name, type = None):
+        for p in self.layout(type) or []:
+            if p.name == name:
+                return p
+        return self.by_name.get(name)
+
+    # values that are in range, and what is wrong with the rest; type is the current one when values doesn't change it
+    def validate(self, values, type = None):
+        type = values.get("type", type)
+        valid = {}
+        errors = []
+        for name, value in values.items():
+            p = self.parameter(name, type)
+            if value == None or p == None:
+                valid[name] = value         # not a device parameter, left to the face
+            elif isinstance(value, int) and p.valid(value):
+                valid[name] = value
+            else:
+                errors.append(f"Error in {self.title} {name.replace('_', ' ')} value ({value})")
+        return valid, errors
+
+P = Parameter
+
+def amp(code, name, title):
+    return Section(code, name, title, [0x3C, code, 0x01, 0x2C],
+                   [P("type", 26), P("gain", 99), P("bass_freq", 250), P("bass_level", 99), P("mid_freq", 4700), P("mid_level", 99),
+                    P("treble_freq", 7500), P("treble_level", 99), P("level", 99)])
+
+def cab(code, name, title):
+    return Section(code, name, title, [0x3D, code, 0x01, 0x5E], [P("type", 18), P("tuning", 48)])
+
+WHAMMY_TYPES = {0: "Whammy", 1: "IPS", 2: "Detune", 3: "Pitch"}
+GATE_TYPES = {0: "Silencer", 1: "Pluck"}
+MOD_TYPES = {0: "Chorus", 1: "Flanger", 2: "Phaser", 3: "Triggered Flanger", 4: "Triggered Phaser", 5: "Tremolo", 6: "Panner",
+             7: "Vibrato", 8: "Rotary", 9: "Auto Ya", 10: "Ya Ya", 11: "Synth Talk", 12: "Envelope", 13: "Detune", 14: "Pitch"}
+
+# mod parameter maxima by type, param_1 onwards
+MOD_LIMITS = [[98, 98, 19, 2, 198, 99], [98, 98, 99, 2, 198, 99], [98, 98, 99, 2, 198, 99], [98, 98, 99, 99], [98, 98, 99, 99],
+              [98, 99, 2], [98, 99, 2], [98, 98, 2], [99, 99, 99, 130, 198, 99], [98, 98, 50, 198, 99], [99, 98, 50, 198, 99],
+              [99, 100, 99, 198, 99], [98, 98, 198, 99], [48, 198, 99], [36, 198, 99]]
+
+# in dump order; no range where the faces never checked one
+SCHEMA = [
+    Section(0x01, "pickup", "Pickup", [0x50, 0x01, 0x01, 0x90], [P("type", labels = factory_pickup_names)]),
+    Section(0x02, "wah", "Wah", [0x51, 0x02, 0x01, 0xC3],
+            [P("type", labels = factory_wah_types), P("on", labels = factory_onoff), P("min", 99), P("max", 99), P("pedal", 99)]),
+    Section(0x03, "compressor", "Compressor", [0x52, 0x03, 0x01, 0xF4],
+            [P("type"), P("on", labels = factory_onoff), P("attack", labels = factory_compressor_attack),
+             P("ratio", labels = factory_compressor_ratio), P("threshold", 99), P("gain", 20)]),
+    Section(0x04, "whammy", "Whammy", [0x53, 0x04, 0x03],
+            [P("type", labels = WHAMMY_TYPES), P("on", labels = factory_onoff), P("param_1", 99), P("param_2", 99), P("param_3", 99),
+             P("param_4", 99)],
+            codes = 1, effect_code = lambda type: [0x84 + type],
+            variants = {0: [P("param_1", labels = factory_whammy_shift), "param_2", "param_3"],
+                        1: [P("param_1", labels = factory_ips_shift), P("param_2", labels = factory_ips_scale),
+                            P("param_3", labels = factory_ips_key), "param_4"],
+                        2: [P("param_1", 24), "param_2"],
+                        3: [P("param_1", 48), "param_2"]}),
+    Section(0x05, "warp", "Warp", [0x28, 0x05, 0x00, 0xC8],
+            [P("type", 0), P("amp_select", 2), P("amp_warp", 99), P("cab_warp", 99), P("warpD", 99)]),
+    amp(0x06, "green_amp", "Green Amp"),
+    cab(0x07, "green_cab", "Green Cabinet"),
+    amp(0x08, "red_amp", "Red Amp"),
+    cab(0x09, "red_cab", "Red Cabinet"),
+    Section(0x0A, "gate", "Gate", [0x54, 0x0A, 0x02],
+            [P("type", labels = GATE_TYPES), P("on", labels = factory_onoff), P("param_1", 40), P("param_2", 9), P("param_3", 99)],
+            codes = 1, effect_code = lambda type: [0x26 + type],
+            variants = {0: ["param_1", "param_2"], 1: ["param_1", "param_2", "param_3"]}),
+    Section(0x0B, "mod", "Modulation", [0x55, 0x0B],
+            [P("type", labels = MOD_TYPES), P("on", labels = factory_onoff)] + [P(f"param_{k}", 198) for k in range(1, 7)],
+            codes = 2,
+            variants = {type: [P(f"param_{k + 1}", limit) for k, limit in enumerate(limits)] for type, limits in enumerate(MOD_LIMITS)}),
+    Section(0x0C, "delay", "Delay", [0x56, 0x0C, 0x02, 0x58],
+            [P("type", 3), P("on", labels = factory_onoff), P("param_1", 2000), P("param_2", 100), P("param_3", 99), P("param_4", 99),
+             P("param_5", 198), P("param_6", 99)]),
+    Section(0x0D, "reverb", "Reverb", [0x57, 0x0D, 0x02, 0xBD],
+            [P("type", 9), P("on", labels = factory_onoff), P("param_1", 15), P("param_2", 98), P("param_3", 99), P("param_4", 198),
+             P("param_5", 99)]),
+]
+SECTIONS = {section.code: section for section in SCHEMA}
+BY_NAME = {section.name: section for section in SCHEMA}
+
+# LFO settings in the 0x26 block
+LFO = [P("speed", 185), P("waveform", labels = factory_waveforms)]
+
+HEADER = bytes([0x02, 0x02])
+HEADER_TAIL = bytes([0x10, 0x00, 0x00, 0x00, 0x00, 0x00])
+TRAILER = bytes([0x14, 0x0E, 0x00, 0x64, 0x06, 0x00])
+TRAILER_TAIL = bytes([0x02, 0x0F, 0x00, 0x02, 0x00])
+LIVE_BYTES = 5                              # volume pre and post (modified by pedal and LFO), amp footswitch, LFO1 and LFO2 speed
+
+# what is in a 0x24 dump: the section values and the bytes around them that the device wants back as they were
+class Dump:
+
+    def __init__(self, sections, flag = 0x00, codes = None, live = None):
+        self.sections = sections            # section name: {parameter: value}
+        self.flag = flag                    # 0x00, or 0x09 after an error
+        self.codes = codes or {}            # section name: (type, effect code bytes) as received
+        self.live = live or bytes(LIVE_BYTES)
+
+# (section, marker, marker length, effect code length, parameter names by type), worked out once for the decoder
+COMPILED = [(s, s.marker, len(s.marker), s.codes,
+             {type: ["type"] + [p.name for p in s.layout(type)] for type in s.variants} if s.variants else ["type"] + s.names()[1:])
+            for s in SCHEMA]
+
+def expect(data, n, pattern):
+    if data[n:n + len(pattern)] != pattern:
+        raise Exception(f"Pattern mis-match at {n}")
+    return n + len(pattern)
+
+# one pass over the unpacked data: marker, effect codes, value count, then the values, numbers as getnum reads them
+def decode24(msg):
+    data = sysex.payload(msg)
+    n = expect(data, 0, HEADER)
+    flag = data[n]
+    n = expect(data, n + 1, HEADER_TAIL)
+    sections = {}
+    codes = {}
+    for section, marker, length, ncodes, names in COMPILED:
+        if data[n:n + length] != marker:
+            raise Exception(f"Pattern mis-match at {n}")
+        n += length
+        if ncodes:
+            codes[section.name] = data[n:n + ncodes]
+            n += ncodes
+        values = []
+        count = data[n]
+        n += 1
+        for k in range(count):
+            b = data[n]
+            n += 1
+            if b & 0x80:
+                v = 0
+                for c in range(b & 0x7F):
+                    v = (v * 256) + data[n]
+                    n += 1
+                b = v
+            values.append(b)
+        if isinstance(names, dict):
+            names = names.get(values[0])
+            if names == None:
+                raise Exception(f"Unrecognised {section.name} type {values[0]}")
+        if len(names) != count:
+            raise Exception(f"{section.title} type {values[0]} has {count - 1} values, expected {len(names) - 1}")
+        sections[section.name] = dict(zip(names, values))
+        if ncodes:
+            codes[section.name] = (values[0], codes[section.name])
+    n = expect(data, n, TRAILER)
+    live = data[n:n + LIVE_BYTES]
+    expect(data, n + LIVE_BYTES, TRAILER_TAIL)
+    return Dump(sections, flag, codes, live)
+
+# a 0x24 frame from the dump, the sections as they are now; a type change needs the effect code for the new type
+def encode24(dump, channel):
+    data = list(HEADER) + [dump.flag] + list(HEADER_TAIL)
+    for section in SCHEMA:
+        values = dump.sections[section.name]
+        type = values["type"]
+        layout = section.layout(type)
+        if layout == None:
+            raise ValueError(f"Unrecognised {section.name} type {type}")
+        data += section.marker
+        if section.codes:
+            received_type, code = dump.codes.get(section.name, (None, None))
+            if received_type != type:
+                if section.effect_code == None:
+                    raise ValueError(f"No effect code for {section.title} type {type}")
+                code = section.effect_code(type)
+            data += code
+        data += compile_number(len(layout) + 1) + compile_number(type)
+        for p in layout:
+            data += compile_number(values[p.name])
+    data += TRAILER + dump.live + TRAILER_TAIL
+    return sysex.encode(channel, MNFR_ID, DEVICE_ID, 0x24, data)
+
+# everything out of range in a patch: (section name, message)
+def validate(sections):
+    errors = []
+    for section in SCHEMA:
+        values = sections.get(section.name)
+        if values == None:
+            errors.append((section.name, f"{section.title} missing"))
+            continue
+        if section.layout(values.get("type")) == None:
+            errors.append((section.name, f"Unrecognised {section.name} type {values.get('type')}"))
+            continue
+        errors += [(section.name, e) for e in section.validate(values)[1]]
+    return errors
+
+# labels for a section's values where the schema has them, for listings and diffs
+def describe(name, values):
+    section = BY_NAME[name]
+    labels = {}
+    for k, v in values.items():
+        p = section.parameter(k, values.get("type"))
+        labels[k] = p.label(v) if p != None and v != None else v
+    return labels
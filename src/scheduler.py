@@ -0,0 +1,186 @@
+# scheduler.py
+#
+# GNXEdit timed jobs and the MIDI watchdog, run on a monotonic clock
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# like GNXSession nothing in here knows about Qt or threads: poll() is called from one timer on the Qt main thread,
+# so jobs run on that thread and can emit signals and touch widgets directly
+
+import heapq
+import itertools
+import time
+
+class Job:
+
+    def __init__(self, when, interval, callback, args):
+        self.when = when
+        self.interval = interval        # None: run once
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class Scheduler:
+
+    def __init__(self, clock = time.monotonic):
+        self.clock = clock
+        self.queue = []                 # (when, sequence, job), sequence keeps jobs due together in order
+        self.sequence = itertools.count()
+        self.late = 0.0                 # worst lateness of a job so far, seconds
+
+    def call_at(self, when, callback, *args, interval = None):
+        job = Job(when, interval, callback, args)
+        heapq.heappush(self.queue, (when, next(self.sequence), job))
+        return job
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.clock() + delay, callback, *args)
+
+    # first run one interval from now unless delay is given
+    def call_every(self, interval, callback, *args, delay = None):
+        return self.call_at(self.clock() + (interval if delay == None else delay), callback, *args, interval = interval)
+
+    # run everything due, a repeating job is rescheduled from its due time so it doesn't drift
+    def poll(self, now = None):
+        if now == None:
+            now = self.clock()
+        while self.queue and self.queue[0][0] <= now:
+            when, sequence, job = heapq.heappop(self.queue)
+            if job.cancelled:
+                continue
+            self.late = max(self.late, now - when)
+            if job.interval != None:
+                job.when = max(when + job.interval, now)      # skip beats missed while the event loop was blocked
+                heapq.heappush(self.queue, (job.when, next(self.sequence), job))
+            job.callback(*job.args)
+
+    # seconds until the next job, None when there is nothing scheduled
+    def next_due(self, now = None):
+        while self.queue and self.queue[0][2].cancelled:
+            heapq.heappop(self.queue)
+        if not self.queue:
+            return None
+        return max(0.0, self.queue[0][0] - (self.clock() if now == None else now))
+
+    def clear(self):
+        for when, sequence, job in self.queue:
+            job.cancel()
+        self.queue = []
+
+# beats every interval: a beat with no frame received since the last one is missed,
+# more than limit missed in a row bites (resync) and the next bite waits twice as long, up to backoff_max
+class Watchdog:
+
+    def __init__(self, scheduler, interval, limit, beat, bite, backoff_max = 30.0):
+        self.scheduler = scheduler
+        self.interval = interval
+        self.limit = limit
+        self.beat_handler = beat        # called on every beat that doesn't bite, returns True if a keep-alive was sent
+        self.bite_handler = bite
+        self.backoff_max = max(1, int(backoff_max / (interval * max(1, limit))))     # as a multiplier of limit
+        self.job = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.beats = 0
+        self.missed = 0                 # in a row
+        self.missed_total = 0
+        self.bites = 0
+        self.backoff = 1                # multiplier of limit before the next bite
+        self.last_inbound = None
+        self.inbound = False            # a frame arrived since the last beat
+        self.keep_alive_sent = None     # time of the outstanding keep-alive
+        self.keep_alives = 0
+        self.keep_alives_lost = 0
+        self.rtt = [0, 0.0, 0.0, 0.0]   # count, total, max, last seconds
+
+    def start(self):
+        self.stop()
+        self.last_inbound = self.scheduler.clock()
+        self.inbound = False
+        self.missed = 0
+        self.job = self.scheduler.call_every(self.interval, self.beat)
+
+    def stop(self):
+        if self.job != None:
+            self.job.cancel()
+            self.job = None
+        self.keep_alive_sent = None
+
+    def running(self):
+        return self.job != None
+
+    # any frame from the device
+    def feed(self):
+        self.last_inbound = self.scheduler.clock()
+        self.inbound = True
+        self.missed = 0
+        self.backoff = 1
+
+    # the device acknowledged the keep-alive
+    def acknowledged(self):
+        if self.keep_alive_sent == None:
+            return
+        elapsed = self.scheduler.clock() - self.keep_alive_sent
+        self.keep_alive_sent = None
+        self.rtt[0] += 1
+        self.rtt[1] += elapsed
+        self.rtt[2] = max(self.rtt[2], elapsed)
+        self.rtt[3] = elapsed
+
+    def beat(self):
+        self.beats += 1
+        if self.keep_alive_sent != None:
+            self.keep_alives_lost += 1
+            self.keep_alive_sent = None
+        if self.inbound:
+            self.inbound = False
+        else:
+            self.missed += 1
+            self.missed_total += 1
+
+        if self.missed > self.limit * self.backoff:
+            self.bites += 1
+            self.missed = 0
+            self.backoff = min(self.backoff * 2, self.backoff_max)
+            self.bite_handler()
+        elif self.beat_handler():
+            self.keep_alives += 1
+            self.keep_alive_sent = self.scheduler.clock()
+
+    def since_inbound(self):
+        if self.last_inbound == None:
+            return None
+        return self.scheduler.clock() - self.last_inbound
+
+    def stats(self):
+        count, total, worst, last = self.rtt
+        return {"beats": self.beats, "missed": self.missed, "missed_total": self.missed_total, "bites": self.bites,
+                "backoff": self.backoff, "since_inbound_ms": None if self.last_inbound == None else self.since_inbound() * 1000,
+                "keep_alives": self.keep_alives, "keep_alives_lost": self.keep_alives_lost,
+                "rtt_mean_ms": total * 1000 / count if count else None, "rtt_max_ms": worst * 1000, "rtt_last_ms": last * 1000,
+                "scheduler_late_ms": self.scheduler.late * 1000}
+
+    def report(self):
+        s = self.stats()
+        rtt = "--" if s["rtt_mean_ms"] == None else f"{s['rtt_mean_ms']:.1f} mean, {s['rtt_max_ms']:.1f} max, {s['rtt_last_ms']:.1f} last"
+        since = "--" if s["since_inbound_ms"] == None else f"{s['since_inbound_ms']:.0f}"
+        return (f"watchdog: beats {s['beats']}, missed {s['missed_total']} ({s['missed']} in a row), bites {s['bites']}, "
+                f"backoff x{s['backoff']}, last frame {since} ms ago\n"
+                f"keep-alive: sent {s['keep_alives']}, lost {s['keep_alives_lost']}, rtt ms {rtt}, scheduler late {s['scheduler_late_ms']:.1f} ms")
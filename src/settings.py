@@ -22,10 +22,11 @@ import os
 from appdirs import user_config_dir
 import shutil
 import common
-from db import gnxDB
 import sqlite3
+import migrations
 
-def appconfig():
+# check_database: gnxedit-cli has no Qt for gnxDB's alerts and opens the library itself
+def appconfig(check_database = True):
 
     common.GNXEDIT_CONFIG_PATH = user_config_dir(appname = 'GNXEdit')
     source_settings = os.path.join(os.path.dirname(__file__), "GNXEdit.json")
@@ -54,19 +55,24 @@ def appconfig():
     # database
     if not os.path.isfile(common.GNXEDIT_DATABASE_FILE):
         shutil.copy2(source_library, common.GNXEDIT_CONFIG_PATH)
-    else:
+    if check_database:
         #check version
+        from db import gnxDB
         db = gnxDB()
         if db.conn == None:
             return
     
-        cur = db.conn.cursor()
-        cur.execute("SELECT version FROM app")
-        rc = cur.fetchone()
-        if rc[0] != common.APP_VERSION:
-            # do database file version update here
-            pass
-        db.conn.close()
+        # library schema up to date, backed up first
+        try:
+            applied = migrations.run(db.conn)
+        except Exception as e:
+            from PySide6.QtWidgets import QMessageBox
+            from exceptions import GNXError
+            raise GNXError(icon = QMessageBox.Critical, title = "Library Update Error", text = f"{e}", buttons = QMessageBox.Ok)
+        finally:
+            db.conn.close()
+        for version, description, result in applied:
+            print(f"Library updated to version {version}: {description}")
     # load up settings into global variable
     common.GNXEDIT_CONFIG = get_settings()
 
@@ -0,0 +1,163 @@
+# stats.py
+#
+# GNXEdit fixed bucket histograms for request latency and decoder time
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import bisect
+import collections
+import json
+import time
+
+import sysex
+
+# bucket upper edges, the last bucket takes everything above the last edge
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+DECODER_BUCKETS_US = (5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 50000)
+
+ACK = 0x7E
+
+# what the GNX1 answers each request with, anything not listed is acknowledged with 7E [01 opcode status]
+RESPONSES = {0x01: 0x02, 0x05: 0x06, 0x07: 0x08, 0x12: 0x13, 0x20: 0x21, 0x7E: 0x24}
+
+def key_name(key):
+    if isinstance(key, tuple):
+        return f"{key[0]:02X}:{key[1]:02X}"
+    return f"{key:02X}"
+
+class Histogram:
+
+    def __init__(self, edges):
+        self.edges = edges
+        self.clear()
+
+    def clear(self):
+        self.counts = [0] * (len(self.edges) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.last = None
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.edges, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min == None else min(self.min, value)
+        self.max = value if self.max == None else max(self.max, value)
+        self.last = value
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    # upper edge of the bucket holding the p'th percentile, max for the open ended bucket
+    def percentile(self, p):
+        if self.count == 0:
+            return None
+        target = self.count * p / 100
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target and n > 0:
+                return self.edges[i] if i < len(self.edges) else self.max
+        return self.max
+
+    def to_dict(self):
+        labels = [f"<={e}" for e in self.edges] + [f">{self.edges[-1]}"]
+        return {"count": self.count, "mean": self.mean(), "min": self.min, "max": self.max, "last": self.last,
+                "p50": self.percentile(50), "p95": self.percentile(95),
+                "buckets": {label: n for label, n in zip(labels, self.counts)}}
+
+class Histograms:
+
+    def __init__(self, edges, unit):
+        self.edges = edges
+        self.unit = unit
+        self.histograms = {}
+
+    # created on first use, the same object from then on so callers can hold on to it
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram == None:
+            histogram = self.histograms[name] = Histogram(self.edges)
+        return histogram
+
+    def record(self, name, value):
+        self.histogram(name).record(value)
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.clear()
+
+    def to_dict(self):
+        return {"unit": self.unit, "edges": list(self.edges),
+                "histograms": {name: h.to_dict() for name, h in sorted(self.histograms.items()) if h.count > 0}}
+
+    def report(self):
+        lines = [f"{'':16s} {'count':>7s} {'mean':>9s} {'p50':>7s} {'p95':>7s} {'max':>9s}  ({self.unit})"]
+        for name, h in sorted(self.histograms.items()):
+            if h.count == 0:
+                continue
+            lines.append(f"{name:16s} {h.count:7d} {h.mean():9.2f} {h.percentile(50):7g} {h.percentile(95):7g} {h.max:9.2f}")
+        return "\n".join(lines)
+
+# matches frames we send to the frames that answer them, oldest first, and records the round trip per opcode pair
+# e.g. "05>06" or "2D>7E:2D"; timed from when the frame is queued for sending
+class RoundTrips:
+
+    def __init__(self, expiry = 5.0, clock = time.perf_counter):
+        self.latency = Histograms(LATENCY_BUCKETS_MS, "ms")
+        self.expiry = expiry            # seconds before an unanswered frame is forgotten
+        self.clock = clock
+        self.outstanding = collections.defaultdict(collections.deque)      # response key: (request opcode, time sent)
+        self.unanswered = collections.Counter()
+        self.last = None                # (opcode pair, ms) of the latest round trip
+
+    def sent(self, msg):
+        if len(msg) < 10 or msg[0] != 0xF0:
+            return
+        opcode = msg[sysex.OPCODE_OFFSET]
+        if opcode == ACK and sysex.payload(msg)[1:2] != b"\x21":      # only our acknowledgement of the patch name is answered (the dump)
+            return
+        key = RESPONSES.get(opcode, (ACK, opcode))
+        self.outstanding[key].append((opcode, self.clock()))
+
+    def received(self, key):
+        waiting = self.outstanding.get(key)
+        if not waiting:
+            return
+        now = self.clock()
+        while waiting and now - waiting[0][1] > self.expiry:
+            opcode, sent = waiting.popleft()
+            self.unanswered[f"{opcode:02X}>{key_name(key)}"] += 1
+        if waiting:
+            opcode, sent = waiting.popleft()
+            self.last = (f"{opcode:02X}>{key_name(key)}", (now - sent) * 1000)
+            self.latency.record(*self.last)
+
+    def reset(self):
+        self.latency.reset()
+        self.outstanding.clear()
+        self.unanswered.clear()
+        self.last = None
+
+# everything in one file, for comparing interfaces and spotting regressions
+def dump_json(file, latency, decoders, extra = None):
+    d = {"saved": time.time(), "latency": latency.to_dict(), "decoders": decoders.to_dict()}
+    if extra != None:
+        d.update(extra)
+    with open(file, "w") as f:
+        json.dump(d, f, indent = 4)
@@ -22,7 +22,7 @@ import common
 
 from PySide6.QtUiTools import QUiLoader
 from PySide6.QtWidgets import QApplication, QTabWidget, QWidget, QStatusBar, QLabel
-from PySide6.QtCore import QFile, QIODevice, QCoreApplication, QDir, Slot, Signal, QObject, Qt
+from PySide6.QtCore import QFile, QIODevice, QCoreApplication, QDir, Slot, Signal, QObject, Qt, QTimer
 
 class StatusControl(QObject):
     connected = False
@@ -42,6 +42,12 @@ class StatusControl(QObject):
         self.uploading_label.setToolTip("Uploading to GNX1 Status")
         self.status_bar.addPermanentWidget(self.uploading_label)
 
+        # editor showing the device snapshot until the sync confirms it
+        self.cached_label = QLabel("CACHED", self.status_bar)
+        self.cached_label.setToolTip("Patch shown from the last session, not yet confirmed by the GNX1")
+        self.status_bar.addPermanentWidget(self.cached_label)
+        self.setStateStale(False)
+
         # resyncing
         self.resync_label = QLabel("RESYNC", self.status_bar)
         self.resync_label.setToolTip("Resync Status")
@@ -52,6 +58,14 @@ class StatusControl(QObject):
         self.watchdog_label.setToolTip("Watchdog Status")
         self.status_bar.addPermanentWidget(self.watchdog_label)
 
+        # latest request round trip, histograms in the tooltip
+        self.latency_label = QLabel("RTT: --", self.status_bar)
+        self.latency_label.setToolTip("Request round trip times")
+        self.status_bar.addPermanentWidget(self.latency_label)
+        self.latency_timer = QTimer(self)
+        self.latency_timer.setInterval(1000)
+        self.latency_timer.timeout.connect(self.updateLatency)
+
         # MIDI channel
         self.midi_channel_label = QLabel("MIDI Channel: --", self.status_bar)
         self.midi_channel_label.setToolTip("GNX MIDI channel number")
@@ -85,6 +99,8 @@ class StatusControl(QObject):
         gnx.commsModeChanged.connect(self.setCommsMode)
         gnx.commsPhaseChanged.connect(self.setCommsPhase)
         gnx.watchDogBite.connect(self.setWatchdog)
+        gnx.deviceStateStale.connect(self.setStateStale)
+        self.latency_timer.start()
 
     def setBusyIndicator(self):
         app = QApplication.instance()
@@ -134,6 +150,23 @@ class StatusControl(QObject):
         self.commsMode = newmode
         self.setBusyIndicator()
 
+    @Slot()
+    def updateLatency(self):
+        last = self.gnx.round_trips.last
+        if last == None:
+            return
+        name, ms = last
+        self.latency_label.setText(f"RTT: {name} {ms:.1f} ms")
+        self.latency_label.setToolTip(f"<pre>Round trip\n{self.gnx.round_trips.latency.report()}\n\n"
+                                      f"Decoders\n{self.gnx.dispatch.timings.report()}</pre>")
+
+    @Slot()
+    def setStateStale(self, stale):
+        if stale:
+            self.cached_label.setStyleSheet("color: orange;")
+        else:
+            self.cached_label.setStyleSheet("color: gray;")
+
     @Slot()
     def setConnected(self, connected):
         if connected:
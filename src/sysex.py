@@ -0,0 +1,131 @@
+# sysex.py
+#
+# GNXEdit system exclusive codec for Digitech GNX1
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# frame: F0 <mnfr id x3> <channel> <device id> <opcode> <packed data> <checksum> F7
+# packed data: groups of 1 MSB byte + (up to) 7 data bytes, MSB of data byte j is bit (6 - j) of the first byte
+# everything here accepts bytes, bytearray, memoryview or a list of ints and returns bytes
+
+SYSEX_START = 0xF0
+SYSEX_END = 0xF7
+OPCODE_OFFSET = 6
+DATA_OFFSET = 7
+SHORT_CHECKSUM = 48         # below this a plain loop beats the big integer fold
+
+# MSB byte -> the 0x80 bits it holds for its 7 data bytes
+EXPAND_TABLE = [bytes(0x80 if m & (0x40 >> j) else 0x00 for j in range(7)) for m in range(256)]
+# data byte -> 1 if its MSB is set
+HIGH_TABLE = bytes(1 if d & 0x80 else 0 for d in range(256))
+LOW_TABLE = bytes(d & 0x7F for d in range(256))
+# group of (up to) 7 HIGH_TABLE bytes -> its MSB byte
+HEADER_TABLE = {}
+for n in range(1, 8):
+    for m in range(1 << n):
+        bits = bytes((m >> (n - 1 - j)) & 1 for j in range(n))
+        HEADER_TABLE[bits] = sum(0x40 >> j for j in range(n) if bits[j])
+
+# unpack buf[start:stop]: MSB bytes are deleted in one go and OR'ed back in as one big integer
+def unpack(buf, start = 0, stop = None):
+    data = bytearray(buf[start:stop])
+    headers = bytes(data[::8])
+    del data[::8]
+    if headers.count(0) == len(headers):         # nothing above 0x7F
+        return bytes(data)
+    high = b"".join(map(EXPAND_TABLE.__getitem__, headers))
+    return (int.from_bytes(data) | int.from_bytes(high[:len(data)])).to_bytes(len(data))
+
+def pack(data):
+    data = bytes(data)
+    low = data.translate(LOW_TABLE)
+    if low == data:                             # nothing above 0x7F, all MSB bytes zero
+        return b"".join([b"\x00" + low[i:i + 7] for i in range(0, len(low), 7)])
+
+    high = data.translate(HIGH_TABLE)
+    out = bytearray()
+    for i in range(0, len(data), 7):
+        out.append(HEADER_TABLE[high[i:i + 7]])
+        out += low[i:i + 7]
+    return bytes(out)
+
+# XOR of buf[start:stop], short runs byte by byte, long runs folded over one big integer
+def checksum(buf, start = 1, stop = -2):
+    data = buf[start:stop]
+    n = len(data)
+    if n <= SHORT_CHECKSUM:
+        cx = 0
+        for d in data:
+            cx ^= d
+        return cx
+    x = int.from_bytes(data)
+    while n > 1:
+        half = n // 2
+        x = (x >> (8 * half)) ^ (x & ((1 << (8 * half)) - 1))
+        n -= half
+    return x
+
+# returns checksum and whether the frame carries it
+def verify(msg):
+    cx = checksum(msg)
+    return cx, len(msg) > 2 and cx == msg[-2]
+
+def build(channel, mnfr_id, device_id, opcode, payload = b""):
+    msg = bytearray((SYSEX_START, *mnfr_id, channel, device_id, opcode))
+    msg += bytes(payload)
+    msg.append(checksum(msg, 1, len(msg)))
+    msg.append(SYSEX_END)
+    return bytes(msg)
+
+# build frame from unpacked data
+def encode(channel, mnfr_id, device_id, opcode, data):
+    return build(channel, mnfr_id, device_id, opcode, pack(data))
+
+# same frame on another channel
+def rechannel(msg, channel):
+    msg = bytearray(msg)
+    msg[4] = channel
+    msg[-2] = checksum(msg)
+    return bytes(msg)
+
+# unpacked data of a frame: the 2 bytes before F7 are checksum and end
+def payload(msg):
+    return unpack(msg, DATA_OFFSET, -2)
+
+# frame built up piecewise in reusable buffers: begin(), write() any number of times, end()
+class Encoder:
+
+    def __init__(self):
+        self.header = bytearray()
+        self.data = bytearray()
+        self.frame = bytearray()
+
+    def begin(self, channel, mnfr_id, device_id, opcode):
+        self.header[:] = (SYSEX_START, *mnfr_id, channel, device_id, opcode)
+        self.data.clear()
+        return self
+
+    def write(self, data):
+        self.data.extend(data)
+        return self
+
+    # packs once, however many writes there were
+    def end(self):
+        self.frame[:] = self.header
+        self.frame += pack(self.data)
+        self.frame.append(checksum(self.frame, 1, len(self.frame)))
+        self.frame.append(SYSEX_END)
+        return bytes(self.frame)
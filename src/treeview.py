@@ -23,14 +23,22 @@ import re
 from exceptions import GNXError
 import sqlite3
 from db import gnxDB
+import blobstore
+import patchdiff
+import duplicates
+import librarydb
+import time
 
 from PySide6.QtUiTools import QUiLoader
 from PySide6.QtWidgets import QStyledItemDelegate, QWidget, QSpinBox, QTreeWidget, QPlainTextEdit, QTreeView, QDialogButtonBox, \
-            QAbstractItemView, QMenu, QLineEdit, QMessageBox, QStyleOptionViewItem, QLabel, QWidgetAction, QPushButton, QGroupBox, QTextEdit
+            QAbstractItemView, QMenu, QLineEdit, QMessageBox, QStyleOptionViewItem, QLabel, QWidgetAction, QPushButton, QGroupBox, QTextEdit, \
+            QTreeWidgetItem, QApplication
 from PySide6.QtCore import QFile, QIODevice, Qt, Signal, Slot, QObject, QModelIndex, QItemSelectionModel, QRegularExpression, QTime, \
             QPropertyAnimation, QRect, QSequentialAnimationGroup, QEvent, QCoreApplication, QEventLoop
 from PySide6.QtGui import QStandardItemModel, QStandardItem, QAction, QPainter, QRegularExpressionValidator, QFontMetrics
 
+COMPARE_LINES = 30              # lines in a compare message, the rest are counted
+
 class CustomDelegate(QStyledItemDelegate):
     def __init__(self, tree, treehandler):
         super().__init__(tree)
@@ -125,7 +133,8 @@ def findByData(parent, data):
         return None
     return None
 
-def add_category_to_tree(tree, model, parent, cid, name, enabled, handler = None):
+# expand = False leaves the parent as it is, for loading many rows at once: expanded, every row added lays out the tree again
+def add_category_to_tree(tree, model, parent, cid, name, enabled, handler = None, expand = True):
     # add to tree
     if parent != None:     
         cat = QStandardItem(name)
@@ -138,14 +147,15 @@ def add_category_to_tree(tree, model, parent, cid, name, enabled, handler = None
         ctx = model.indexFromItem(cat)
         tree.setItemDelegateForRow(ctx.row(), CustomDelegate(tree, handler))
         tree.setFirstColumnSpanned(ctx.row(), model.indexFromItem(parent), True)
-        tree.setExpanded(model.indexFromItem(parent), True)
+        if expand:
+            tree.setExpanded(model.indexFromItem(parent), True)
         model.layoutChanged
         return cat
     else:
         return None
 
 def add_patch_to_tree(tree = None, model = None, parent = None, type = "", bank = None, patch_num = None,
-                               patch_id = None, name = "", description = "", tags = "", handler = None):
+                               patch_id = None, name = "", description = "", tags = "", handler = None, expand = True):
     if type == "library":
         w1 = QStandardItem(name)
         w1.setForeground(Qt.green)
@@ -158,7 +168,8 @@ def add_patch_to_tree(tree = None, model = None, parent = None, type = "", bank
         ctx = model.indexFromItem(w1)
         tree.setItemDelegateForRow(ctx.row(), CustomDelegate(tree, handler))
         tree.setFirstColumnSpanned(ctx.row(), model.indexFromItem(parent), True)
-        tree.setExpanded(model.indexFromItem(parent), True)
+        if expand:
+            tree.setExpanded(model.indexFromItem(parent), True)
         w2 = None
         
     else:
@@ -185,7 +196,7 @@ def add_patch_to_tree(tree = None, model = None, parent = None, type = "", bank
     return w1, w2
 
 def add_amp_to_tree(tree = None, model = None, parent = None, type = "", bank = None, patch_num = None,
-                               patch_id = None, name = "", description = "", tags = "", handler = None ):
+                               patch_id = None, name = "", description = "", tags = "", handler = None, expand = True):
     if type == "library":
         w1 = QStandardItem(name)
         w1.setForeground(Qt.yellow)
@@ -198,7 +209,8 @@ def add_amp_to_tree(tree = None, model = None, parent = None, type = "", bank =
         ctx = model.indexFromItem(w1)
         tree.setItemDelegateForRow(ctx.row(), CustomDelegate(tree, handler))
         tree.setFirstColumnSpanned(ctx.row(), model.indexFromItem(parent), True)
-        tree.setExpanded(model.indexFromItem(parent), True)
+        if expand:
+            tree.setExpanded(model.indexFromItem(parent), True)
         w2 = None
 
     model.layoutChanged
@@ -216,6 +228,7 @@ class TreeHandler(QObject):
 
         self.window = window
         self.gnx = gnx
+        self.devicemanager = None
         self.blockPatchChange = False
         self.blockSelectionChange = False
 
@@ -319,46 +332,36 @@ class TreeHandler(QObject):
                 return
             db.conn.row_factory = sqlite3.Row
             cur = db.conn.cursor()
-            cur.execute("SELECT NULL AS cat_parent, 0 AS cat_id, 'LIBRARY' AS cat_name, \
-		                    p.type AS patch_type, p.id AS patch_id, p.name AS patch_name, p.description AS patch_description, p.tags AS patch_tags, \
-                            0 AS parent_id FROM \
-	                        	(SELECT 'patch' AS type, id, name, description, tags, category FROM patches WHERE category = 0 \
-	                        		UNION SELECT 'amp' AS type, id, name, description, tags, category FROM amps WHERE category = 0) AS p \
-                        UNION \
-                        SELECT c.parent AS cat_parent, c.id AS cat_id, c.name AS cat_name, \
-		                    p.type AS patch_type, p.id AS patch_id, p.name AS patch_name, p.description AS patch_description, p.tags AS patch_tags, \
-                            c2.id AS parent_id \
-	                        FROM categories AS c \
-	                        LEFT JOIN \
-	                        	(SELECT 'patch' AS type, id, name, description, tags, category FROM patches \
-	                        		UNION SELECT 'amp' AS type, id, name, description, tags, category FROM amps) \
-	                        AS p ON p.category = c.id \
-                            LEFT JOIN categories AS c2 on c.parent = c2.id \
-                            WHERE cat_parent IS NOT NULL \
-                            ORDER by cat_parent, cat_id, patch_name ASC")
+            cur.execute(librarydb.TREE_QUERY)
             rc = cur.fetchall()
             crows = [dict(row) for row in rc]
 
             last_cat = 0
             cat = self.libHeader
+            cats = {0: self.libHeader}      # added so far, parents looked up here rather than through the tree
 
+            # collapsed while loading, expanded as each add would have left it once loaded
+            self.tree.setExpanded(self.libHeader.index(), False)
             for c in crows:
                 if last_cat != c["cat_id"]:
-                    data = {"role": "header", "type": "library", "category": c["cat_parent"]} # look for parent
-                    pcat = findByData(self.libHeader, data)
+                    pcat = cats.get(c["cat_parent"])
                     if pcat != None:
-                        cat = add_category_to_tree(self.tree, self.model, pcat, c["cat_id"], c["cat_name"], True)
+                        cat = add_category_to_tree(self.tree, self.model, pcat, c["cat_id"], c["cat_name"], True, expand = False)
+                        cats[c["cat_id"]] = cat
                         last_cat = c["cat_id"]
 
                 if c["patch_id"] != None:
                     if c["patch_type"] == "patch":
                         add_patch_to_tree(tree = self.tree, model = self.model, parent = cat, type = "library", 
                             patch_id = c["patch_id"], name = c["patch_name"], description = c["patch_description"], tags = c["patch_tags"],
-                            handler = self)
+                            handler = self, expand = False)
                     else:
                         add_amp_to_tree(tree = self.tree, model = self.model, parent = cat, type = "library", 
                             patch_id = c["patch_id"], name = c["patch_name"], description = c["patch_description"], tags = c["patch_tags"],
-                            handler = self)                        
+                            handler = self, expand = False)
+            for cat in cats.values():
+                if cat.hasChildren():
+                    self.tree.setExpanded(cat.index(), True)
 
             db.conn.close()
 
@@ -384,7 +387,9 @@ class TreeHandler(QObject):
                     actions = [{"text": "Add Category", "connect": self.addCategory},
                             {"text": "---", "connect": None},
                             {"text": "Copy", "connect": self.copyBranch},
-                            {"text": "Paste", "connect": self.pasteBranch}
+                            {"text": "Paste", "connect": self.pasteBranch},
+                            {"text": "---", "connect": None},
+                            {"text": "Find Duplicates", "connect": self.findDuplicates}
                     ]
 
                 else:
@@ -395,8 +400,16 @@ class TreeHandler(QObject):
                             {"text": "Copy", "connect": self.copyBranch},
                             {"text": "Paste", "connect": self.pasteBranch},
                             {"text": "---", "connect": None},
+                            {"text": "Find Duplicates", "connect": self.findDuplicates},
+                            {"text": "---", "connect": None},
                             {"text": "Delete", "connect": self.deleteCategory}
                     ]
+                    if len(self.unitTargets()) > 0:
+                        actions += [{"text": "---", "connect": None},
+                                    {"text": "Back Up Rack Here", "connect": self.backupRack}]
+                if self.editBuffer() != None:
+                    actions += [{"text": "---", "connect": None},
+                                {"text": "Compare with GNX", "connect": self.compareCategory}]
 
             elif d1 != None and d1["role"] == "patch" and (d1["type"] == "user" or d1["type"] == "factory"):
                 title = "PATCH"
@@ -413,6 +426,14 @@ class TreeHandler(QObject):
                            {"text": "---", "connect": None},
                            {"text": "Delete", "connect": self.deletePatch}
                 ]
+                if self.editBuffer() != None:
+                    actions[2:2] = [{"text": "Compare with GNX", "connect": self.comparePatch}]
+                # other units found by the device manager
+                units = self.unitTargets()
+                if len(units) > 0:
+                    actions[2:2] = [{"text": f"Send Patch to {u.label}", "connect": self.sendPatchToUnits, "units": [u]} for u in units]
+                    if len(units) > 1:
+                        actions[2 + len(units):2 + len(units)] = [{"text": "Send Patch to All Units", "connect": self.sendPatchToUnits, "units": units}]
 
             elif d1 != None and d1["role"] == "amp" and d1["type"] == "library":
                 title = "AMP/CAB"
@@ -444,7 +465,7 @@ class TreeHandler(QObject):
                     else:
                         action = QAction(a["text"])
                         action.triggered.connect(a["connect"])
-                        action.setData(d1)
+                        action.setData(d1 if "units" not in a else dict(d1, units = [u.key for u in a["units"]]))
                         cm.addAction(action)
                         x = cm.actions()
 
@@ -483,6 +504,128 @@ class TreeHandler(QObject):
         data = sender.data()
         self.gnx.send_to_device(data)
 
+    def unitTargets(self):
+        return [] if self.devicemanager == None else self.devicemanager.targets()
+
+    # library patch as (name, blocks) ready for GNXUnit.upload_steps
+    def patchBlocks(self, id):
+        db = gnxDB()
+        if db.conn == None:
+            return None
+        try:
+            return blobstore.patch_blocks(db.conn.cursor(), id)
+        finally:
+            db.conn.close()
+
+    # same library patch into the edit buffer of each unit, all at once
+    @Slot()
+    def sendPatchToUnits(self):
+        data = self.sender().data()
+        units = [self.devicemanager.units[k] for k in data["units"] if k in self.devicemanager.units]
+        try:
+            patch = self.patchBlocks(data["patch"])
+        except Exception as e:
+            patch = None
+        if patch == None:
+            e = GNXError(icon = QMessageBox.Critical, title = "Send to Unit Error", text = f"No patch data with id {data['patch']} in database\n", \
+                         buttons = QMessageBox.Ok)
+            self.gnxAlert.emit(e)
+            return
+
+        name, blocks = patch
+        future = self.devicemanager.run_all(units, lambda unit: unit.upload_steps(name, blocks), "upload")
+        future.add_done_callback(lambda f: self.unitsDone(f.result, f"Send {name} to Units", "sent"))
+
+    # current patch of every unit into this category, the units dumped in parallel
+    @Slot()
+    def backupRack(self):
+        data = self.sender().data()
+        category = data["category"]
+        units = self.unitTargets()
+
+        def saved(future):
+            for key, result in future.result.items():
+                if isinstance(result, Exception):
+                    continue
+                name, blocks = result
+                description = f"BACKUP {self.devicemanager.units[key].label}".upper()
+                try:
+                    db = gnxDB()
+                    if db.conn == None:
+                        return
+                    cur = db.conn.cursor()
+                    blobstore.insert_patch(cur, category, name, description, "", blocks)
+                    db.conn.commit()
+                    db.conn.close()
+                    self.patchAdded("patch", category, cur.lastrowid, name, description, "")
+                except Exception as e:
+                    future.result[key] = e
+            self.unitsDone(future.result, "Back Up Rack", "saved")
+
+        self.devicemanager.run_all(units, lambda unit: unit.dump_steps(), "backup").add_done_callback(saved)
+
+    def unitsDone(self, results, title, verb):
+        lines = []
+        for key, result in sorted(results.items()):
+            label = self.devicemanager.units[key].label if key in self.devicemanager.units else str(key)
+            lines.append(f"{label}: {result}" if isinstance(result, Exception) else f"{label}: {verb}")
+        failed = any(isinstance(r, Exception) for r in results.values())
+        e = GNXError(icon = QMessageBox.Warning if failed else QMessageBox.Information, title = title, text = "\n".join(lines), \
+                     buttons = QMessageBox.Ok)
+        self.gnxAlert.emit(e)
+
+    # the patch in the GNX edit buffer as it is now, edits included, None until one has been received
+    def editBuffer(self):
+        if self.gnx == None or not self.gnx.has_patch():
+            return None
+        return self.gnx.model.patch.edited_blocks(self.gnx.midi_channel)
+
+    # library patch against the edit buffer, parameter by parameter
+    @Slot()
+    def comparePatch(self):
+        data = self.sender().data()
+        try:
+            patch = self.patchBlocks(data["patch"])
+        except Exception as e:
+            patch = None
+        blocks = self.editBuffer()
+        if patch == None or blocks == None:
+            e = GNXError(icon = QMessageBox.Critical, title = "Compare Error", text = f"No patch data with id {data['patch']} in database\n", \
+                         buttons = QMessageBox.Ok)
+            self.gnxAlert.emit(e)
+            return
+
+        name, library = patch
+        lines = patchdiff.describe(patchdiff.DIFFER.diff(library, blocks))
+        if len(lines) == 0:
+            text = f"{name} is the same as the patch on the GNX"
+        else:
+            text = f"{name} -> GNX, {len(lines)} differences:\n" + "\n".join(lines[:COMPARE_LINES]) + \
+                   (f"\n... and {len(lines) - COMPARE_LINES} more" if len(lines) > COMPARE_LINES else "")
+        e = GNXError(icon = QMessageBox.Information, title = "Compare with GNX", text = text, buttons = QMessageBox.Ok)
+        self.gnxAlert.emit(e)
+
+    # every patch in a category and below against the edit buffer, closest first
+    @Slot()
+    def compareCategory(self):
+        data = self.sender().data()
+        blocks = self.editBuffer()
+        db = gnxDB()
+        if db.conn == None or blocks == None:
+            return
+        try:
+            results = patchdiff.DIFFER.diff_category(db.conn, data["category"], blocks)
+        finally:
+            db.conn.close()
+
+        lines = [f"{name}: " + (f"{len(differences)} differences" if differences else "same") for id, name, differences in results[:COMPARE_LINES]]
+        text = f"{len(results)} patches compared with the GNX, closest first:\n" + "\n".join(lines) if results else "No patches in this category"
+        e = GNXError(icon = QMessageBox.Information, title = "Compare with GNX", text = text, buttons = QMessageBox.Ok)
+        self.gnxAlert.emit(e)
+
+    def setDeviceManager(self, devicemanager):
+        self.devicemanager = devicemanager
+
     @Slot()
     def sendPatchChange(self):
         sender = self.sender()
@@ -620,6 +763,164 @@ class TreeHandler(QObject):
             db.conn.close() 
             self.model.layoutChanged
 
+    # library patches by id, the tree walked once however many there are
+    def libraryPatchItems(self, ids):
+        items = {}
+        parents = [self.libHeader]
+        while len(parents) > 0:
+            parent = parents.pop()
+            for row in range(parent.rowCount()):
+                item = parent.child(row, 0)
+                data = item.data(Qt.UserRole)
+                if data != None and data["role"] == "patch" and data["type"] == "library" and data["patch"] in ids:
+                    items[data["patch"]] = item
+                if item.hasChildren():
+                    parents.append(item)
+        return items
+
+    # patches in a category and below with the same parameters (or nearly), to be merged into one
+    @Slot()
+    def findDuplicates(self):
+        def find():
+            distance = inputDistance.value()
+            treeGroups.clear()
+            groups = []
+            db = gnxDB()
+            if db.conn == None:
+                return
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+            try:
+                start = time.perf_counter()
+                if distance == 0:
+                    groups = [(members, [0] * len(members)) for members in duplicates.exact(db.conn, data["category"])]
+                else:
+                    groups = duplicates.near(db.conn, data["category"], distance)
+                elapsed = time.perf_counter() - start
+                cur = db.conn.cursor()
+                cur.execute("SELECT id, name FROM categories")
+                names = dict(cur.fetchall())
+            except Exception as ex:
+                e = GNXError(icon = QMessageBox.Critical, title = "Find Duplicates Error", \
+                                            text = f"Unable to search library for duplicates\n{ex}", \
+                                            buttons = QMessageBox.Ok)
+                self.gnxAlert.emit(e)
+                return
+            finally:
+                db.conn.close()
+                QApplication.restoreOverrideCursor()
+
+            groups.sort(key = lambda g: (-len(g[0]), g[0][0][0]))
+            treeGroups.setUpdatesEnabled(False)
+            # near duplicates are left unticked, only the same patch as the first is merged without a look
+            for members, apart in groups:
+                furthest = max(apart)
+                group = QTreeWidgetItem([f"{len(members)} patches " + (f"up to {furthest} parameters from the first" if furthest > 0 else "the same"), ""])
+                for (id, name, category), d in zip(members, apart):
+                    item = QTreeWidgetItem(group, [name, names.get(category, "LIBRARY")])
+                    item.setData(0, Qt.UserRole, id)
+                    item.setCheckState(0, Qt.Checked if d == 0 else Qt.Unchecked)
+                    if d > 0:
+                        item.setToolTip(0, f"{d} parameters from {members[0][1]}")
+                treeGroups.addTopLevelItem(group)
+            treeGroups.setUpdatesEnabled(True)
+            treeGroups.resizeColumnToContents(0)
+
+            count = sum(len(members) for members, apart in groups)
+            labelSummary.setText(f"{len(groups)} groups of {count} patches, {count - len(groups)} could go ({elapsed:.2f} s)" \
+                                 if len(groups) > 0 else f"No duplicates found ({elapsed:.2f} s)")
+
+        # (keep, others) for a group: the selected patch kept if it is ticked, otherwise the first ticked
+        def choice(group, selected = None):
+            ticked = [group.child(n) for n in range(group.childCount()) if group.child(n).checkState(0) == Qt.Checked]
+            if len(ticked) < 2:
+                return None
+            keep = selected if selected in ticked else ticked[0]
+            return keep.data(0, Qt.UserRole), [item.data(0, Qt.UserRole) for item in ticked if item is not keep]
+
+        def merge(groups):
+            groups = [g for g in groups if g[1] != None]
+            if len(groups) == 0:
+                return
+            count = sum(len(others) for item, (keep, others) in groups)
+            result = QMessageBox.question(dialog, "Merge Duplicates",
+                                          f"This will permanently delete {count} patches, their tags kept with the patch merged into.\n" +
+                                          "Are you sure you want to continue?",
+                                          QMessageBox.Cancel | QMessageBox.Yes, QMessageBox.Cancel)
+            if result != QMessageBox.Yes:
+                return
+            db = gnxDB()
+            if db.conn == None:
+                return
+            try:
+                deleted = duplicates.merge(db.conn, [g for item, g in groups])
+                kept = [keep for item, (keep, others) in groups]
+                cur = db.conn.cursor()
+                tags = {}
+                for n in range(0, len(kept), blobstore.CHUNK):
+                    chunk = kept[n:n + blobstore.CHUNK]
+                    cur.execute(f"SELECT id, tags FROM patches WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+                    tags.update(cur.fetchall())
+            except Exception as ex:
+                e = GNXError(icon = QMessageBox.Critical, title = "Merge Duplicates Error", \
+                                            text = f"Unable to merge duplicates, nothing has been changed.\n{ex}", \
+                                            buttons = QMessageBox.Ok)
+                self.gnxAlert.emit(e)
+                return
+            finally:
+                db.conn.close()
+
+            # remove from tree, merged tags onto the patches kept
+            items = self.libraryPatchItems(set(deleted) | set(kept))
+            for id in deleted:
+                if id in items:
+                    self.model.removeRow(items[id].row(), items[id].index().parent())
+            for id in kept:
+                if id in items:
+                    d = items[id].data(Qt.UserRole)
+                    d["tags"] = tags.get(id, d["tags"])
+                    items[id].setData(d, Qt.UserRole)
+            for item, g in groups:
+                treeGroups.takeTopLevelItem(treeGroups.indexOfTopLevelItem(item))
+            labelSummary.setText(f"{len(deleted)} patches merged into {len(groups)}")
+            self.model.layoutChanged
+
+        def mergeGroup():
+            item = treeGroups.currentItem()
+            if item == None:
+                return
+            group = item if item.parent() == None else item.parent()
+            merge([(group, choice(group, item))])
+
+        def mergeAll():
+            merge([(treeGroups.topLevelItem(n), choice(treeGroups.topLevelItem(n))) for n in range(treeGroups.topLevelItemCount())])
+
+        data = self.sender().data()
+
+        ui_file_name = "src/ui/duplicatesdialog.ui"
+        ui_file = QFile(ui_file_name)
+        if not ui_file.open(QIODevice.ReadOnly):
+            e = GNXError(icon = QMessageBox.Critical, title = "Find Duplicates Error", \
+                                        text = f"Cannot open {ui_file_name}: {ui_file.errorString()}", \
+                                        buttons = QMessageBox.Ok)
+            self.gnxAlert.emit(e)
+            return
+
+        loader = QUiLoader()
+        dialog = loader.load(ui_file)
+
+        ui_file.close()
+        inputDistance = dialog.findChild(QSpinBox, "inputDistance")
+        labelSummary = dialog.findChild(QLabel, "labelSummary")
+        treeGroups = dialog.findChild(QTreeWidget, "treeGroups")
+        dialog.findChild(QPushButton, "buttonFind").clicked.connect(find)
+        dialog.findChild(QPushButton, "buttonMerge").clicked.connect(mergeGroup)
+        dialog.findChild(QPushButton, "buttonMergeAll").clicked.connect(mergeAll)
+
+        dialog.setParent(self.window, Qt.Dialog)
+        dialog.setWindowTitle(f"Find Duplicates in {data.get('name', 'LIBRARY')}")
+        dialog.show()
+        find()
+
     @Slot()
     def addCategory(self):
         sender = self.sender()
@@ -777,7 +1078,7 @@ class TreeHandler(QObject):
                     return
                 db.conn.row_factory = sqlite3.Row
                 cur = db.conn.cursor()
-                cur.execute("SELECT * FROM categories WHERE id = ?", [data1["category"]])
+                cur.execute("SELECT * FROM categories WHERE id = ? AND id <> 0", [data1["category"]])     # the root isn't copied
                 rc = cur.fetchall()
                 row = [dict(row) for row in rc]
                 if len(row) > 0:
@@ -812,6 +1113,7 @@ class TreeHandler(QObject):
 
         parents = {}
         parents[data["category"]] = data["category"]
+        cut = []        # cut categories, deleted once what was in them has moved (deleting one deletes its contents)
 
         if self.clipBoard[0]["mode"] == "cut":
 
@@ -841,30 +1143,31 @@ class TreeHandler(QObject):
                     else:
                         newparent = parents[clipdata["category"]]
                     
+                    # only the block hashes are copied, a cut patch just changes category
                     cur = db.conn.cursor()
-                    cur.execute("INSERT INTO patches (category, name, description, tags, C24, C26, C28, C3C06, C3D07, C3C08, C3D09) \
-                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", 
-                                [newparent, clipdata["name"], clipdata["description"], clipdata["tags"],
-                                clipdata["C24"], clipdata["C26"], clipdata["C28"], clipdata["C3C06"], clipdata["C3D07"], 
-                                clipdata["C3C08"], clipdata["C3D09"]])
+                    if clip["mode"] == "cut":
+                        cur.execute("UPDATE patches SET category = ? WHERE id = ?", [newparent, clipdata["id"]])
+                        id = clipdata["id"]
+                        clip["mode"] = "copy"   # moved, pasting again makes copies
+
+                        # remove from tree
+                        dpatch = {"role": "patch", "type": "library", "bank": None, "patch": clipdata["id"]}
+                        patch = findByData(self.libHeader, dpatch)
+                        if patch != None:
+                            self.model.removeRow(patch.index().row(), patch.index().parent())
+                    else:
+                        cur.execute(f"INSERT INTO patches (category, name, description, tags, {', '.join(blobstore.COLUMNS)}) \
+                                    VALUES (?, ?, ?, ?, {', '.join('?' * len(blobstore.COLUMNS))})",
+                                    [newparent, clipdata["name"], clipdata["description"], clipdata["tags"]] +
+                                    [clipdata[c] for c in blobstore.COLUMNS])
+                        id = cur.lastrowid
                     db.conn.commit()
 
                     # add to tree
                     pcat = findByData(self.libHeader, {"role": "header", "type": "library", "category": newparent})
-                    id = cur.lastrowid
                     add_patch_to_tree(tree = self.tree, model = self.model, parent = pcat, type="library", patch_id = id,
                                     name = clipdata["name"], description = clipdata["description"], tags = clipdata["tags"],
                                     handler = self)
-                    
-                    if clip["mode"] == "cut":
-                        cur.execute("DELETE FROM patches WHERE id = ?", [clipdata["id"]])
-                        db.conn.commit()
-
-                        # remove from tree
-                        dpatch = {"role": "patch", "type": "library", "bank": None, "patch": clipdata["id"]}
-                        patch = findByData(self.libHeader, dpatch)
-                        if patch != None:   # already deleted, multiple pastes
-                            self.model.removeRow(patch.index().row(), patch.index().parent())        
             
                 except Exception as e:
                     e = GNXError(icon = QMessageBox.Critical, title = "Paste Patch Error", \
@@ -943,9 +1246,7 @@ class TreeHandler(QObject):
                     add_category_to_tree(tree = self.tree, model = self.model, parent = pcat, cid = id, name = clipdata["name"], enabled = True)
                     
                     if clip["mode"] == "cut":
-
-                        cur.execute("DELETE FROM categories WHERE id = ?", [clipdata["id"]])
-                        db.conn.commit()
+                        cut.append(clipdata["id"])
 
                         # remove from tree
                         dpatch = {"role": "header", "type": "library", "category": clipdata["id"]}
@@ -960,6 +1261,21 @@ class TreeHandler(QObject):
                     self.gnxAlert.emit(e)     
                 db.conn.close()
 
+        if len(cut) > 0:
+            try:
+                db = gnxDB()
+                if db.conn == None:
+                    return
+                cur = db.conn.cursor()
+                cur.executemany("DELETE FROM categories WHERE id = ?", [[id] for id in cut])
+                db.conn.commit()
+            except Exception as e:
+                e = GNXError(icon = QMessageBox.Critical, title = "Paste Category Error", \
+                                                        text = f"Unable to delete cut category from database\n{e}", \
+                                                        buttons = QMessageBox.Ok)
+                self.gnxAlert.emit(e)
+            db.conn.close()
+
     @Slot()
     def deleteCategory(self):
         sender = self.sender()
@@ -976,31 +1292,8 @@ class TreeHandler(QObject):
             
                 cur = db.conn.cursor()
 
-                cur.execute("DELETE FROM categories WHERE parent = ? OR id = ?", [data["category"], data["category"]])
-                db.conn.commit()
-
-                # clean up
-                while True:
-                    cur.execute("DELETE FROM categories WHERE id IN \
-                                    (SELECT c.id AS id FROM categories AS c \
-                                        LEFT JOIN categories AS c2 ON c.parent = c2.id \
-                                        WHERE c2.id IS NULL AND c.parent <> 0)")
-
-                    db.conn.commit()
-                    if cur.rowcount == 0:
-                        break
-
-                # delete all orphan patches
-                cur.execute("DELETE FROM patches WHERE id IN \
-                                (SELECT p.id AS id FROM patches AS p \
-                                    LEFT JOIN categories AS c ON p.category = c.id \
-                                    WHERE c.id IS NULL)")
-                
-                # delete all orphan amps
-                cur.execute("DELETE FROM amps WHERE id IN \
-                                (SELECT p.id AS id FROM amps AS p \
-                                    LEFT JOIN categories AS c ON p.category = c.id \
-                                    WHERE c.id IS NULL)")
+                # categories below it, their patches and amps go with it (ON DELETE CASCADE)
+                cur.execute("DELETE FROM categories WHERE id = ?", [data["category"]])
                 db.conn.commit()
 
                 # remove from tree
@@ -1354,10 +1647,16 @@ class TreeHandler(QObject):
                                     tags LIKE ?", [wc, wc, wc, wc, wc, wc])
                 rc = cur.fetchall()
                 prows = [dict(row) for row in rc]
-                
+
+                # every hit's path from one read of the categories
+                cur.execute("SELECT id, parent, name FROM categories")
+                categories = {row["id"]: (row["parent"], row["name"]) for row in cur.fetchall()}
+                paths = {}
                 for p in prows:
                     # find parents
-                    path, pathlink = self.getPatchPath(db, p["category"])
+                    if p["category"] not in paths:
+                        paths[p["category"]] = self.getPatchPath(categories, p["category"])
+                    path, pathlink = paths[p["category"]]
                     self.searchResults.addPathLink(f"LIBRARY>{path}{p["name"]}", f"2>{pathlink}{p["id"]}")
 
                 db.conn.close()
@@ -1371,27 +1670,16 @@ class TreeHandler(QObject):
         if self.searchResults.document().isEmpty():
             self.searchResults.setText("No matching results for this search.")
         
-    def getPatchPath(self, db, id, path = "", pathlink = ""):
-        if id == 0:
-            return path, pathlink
-
-        try:
-            db = gnxDB()
-            if db.conn == None:
-                return
-
-            db.conn.row_factory = sqlite3.Row
-            cur = db.conn.cursor()
-            cur.execute("SELECT parent, name FROM categories WHERE id = ?", [id])
-            rc = cur.fetchone()
-            if rc:
-                path = f"{rc[1]}>{path}"
-                pathlink = f"{id}>{pathlink}" 
-                return self.getPatchPath(db, rc[0], path, pathlink)
-            else:
-                return path, pathlink
-        except Exception as e:
-            raise e
+    # categories: {id: (parent, name)}
+    def getPatchPath(self, categories, id, path = "", pathlink = ""):
+        for n in range(len(categories)):       # no further than there are categories, whatever the parents say
+            if id == 0 or id not in categories:
+                break
+            parent, name = categories[id]
+            path = f"{name}>{path}"
+            pathlink = f"{id}>{pathlink}"
+            id = parent
+        return path, pathlink
                 
     def findAnchorInTree(self, anchor):
         self.tree.collapseAll()
@@ -0,0 +1,199 @@
+# uploader.py
+#
+# GNXEdit patch upload: the blocks sent one at a time, each acknowledged before the next goes and resent on 0x7F
+# or timeout, and any number of patches queued to go one after the other; or, for a patch close to the edit
+# buffer, only the parameters that differ
+#
+# Copyright 2024 gary-1959
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# no Qt: the steps run in a GNXSession.Task, GNX1 for the editor and GNXUnit for the others
+
+import time
+
+import common
+import patchdiff
+import sysex
+from GNXSession import Future, ACK
+from devicemodel import MNFR_ID, DEVICE_ID
+from devicestate import BLOCK_KEYS
+from patchschema import BY_NAME
+
+DELTA_LIMIT = 40                    # parameter changes before the full upload is quicker (delta_upload_limit in GNXEdit.json)
+
+# parameter changes taking the edit buffer from current to target, both keyed as BLOCK_KEYS:
+# ([(section, parameter, value)] as sent in 0x2C, True if the 0x26 block differs), None when it needs the full upload
+def delta(current, target, limit = None):
+    limit = limit if limit != None else common.GNXEDIT_CONFIG["midi"].get("delta_upload_limit", DELTA_LIMIT)
+    changed = {}                    # section: [parameter names], schema order
+    expression = False
+    for section, parameter, old, new in patchdiff.DIFFER.diff(current, target):
+        if section.startswith("expression_") or section.startswith("lfo_"):
+            expression = True
+            continue
+        s = BY_NAME.get(section)
+        if s == None or parameter not in s.by_name:
+            return None             # a block the schema can't decode, or a custom amp or cab
+        if parameter == "type" and s.marker[0] in (0x3C, 0x3D):
+            return None             # amp or cab model, the device loads its defaults with it
+        if new != None:             # one the new type doesn't have
+            changed.setdefault(section, []).append(parameter)
+
+    values = patchdiff.DIFFER.decoded("24", target["24"])
+    changes = []
+    for section, parameters in changed.items():
+        s = BY_NAME[section]
+        # a new effect type may reset its parameters on the device, so all of them follow it
+        if "type" in parameters:
+            parameters = ["type"] + [p.name for p in s.layout(values[(section, "type")]) or []]
+        names = s.names()
+        changes += [(s.code, names.index(p), values[(section, p)]) for p in parameters if (section, p) in values]
+    if len(changes) + expression > limit:
+        return None
+    return changes, expression
+
+class UploadStats:
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.patches = 0
+        self.failed = 0
+        self.blocks = 0                 # acknowledged, the patch name, end of patch and save not counted
+        self.bytes = 0                  # of the acknowledged blocks
+        self.sent = 0                   # every frame sent, retransmissions included
+        self.resent = 0
+        self.naks = 0
+        self.timeouts = 0
+        self.elapsed = 0.0              # seconds spent uploading
+        self.deltas = 0                 # patches sent as parameter changes, not in the counts above
+        self.changes = 0                # frames they took
+        self.delta_elapsed = 0.0
+
+    def delta(self, changes, elapsed):
+        self.deltas += 1
+        self.changes += changes
+        self.delta_elapsed += elapsed
+
+    def bytes_per_second(self):
+        return self.bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def patches_per_second(self):
+        return self.patches / self.elapsed if self.elapsed > 0 else 0.0
+
+    # retransmissions per frame sent
+    def error_rate(self):
+        return self.resent / self.sent if self.sent > 0 else 0.0
+
+    def to_dict(self):
+        return {"patches": self.patches, "failed": self.failed, "blocks": self.blocks, "bytes": self.bytes, "sent": self.sent,
+                "resent": self.resent, "naks": self.naks, "timeouts": self.timeouts, "elapsed": self.elapsed,
+                "bytes_per_second": self.bytes_per_second(), "patches_per_second": self.patches_per_second(),
+                "error_rate": self.error_rate(), "deltas": self.deltas, "changes": self.changes, "delta_elapsed": self.delta_elapsed}
+
+    def report(self):
+        return f"{self.patches} patches uploaded, {self.failed} failed, {self.blocks} blocks ({self.bytes} bytes) in {self.elapsed:.1f} s: " + \
+               f"{self.patches_per_second():.2f} patches/s, {self.bytes_per_second():.0f} bytes/s, " + \
+               f"{self.resent} resent ({self.naks} rejected), {self.timeouts} timed out, error rate {self.error_rate() * 100:.1f}%; " + \
+               f"{self.deltas} sent as {self.changes} changes in {self.delta_elapsed * 1000:.0f} ms"
+
+class UploadJob:
+
+    def __init__(self, name, blocks, target = None):
+        self.name = name
+        self.blocks = blocks            # keyed as BLOCK_KEYS, frames on any channel
+        self.target = target            # (bank, patch) to save it to, None leaves it in the edit buffer
+        self.future = Future(f"upload {name}")
+
+class Uploader:
+
+    def __init__(self, session, channel, retries = None):
+        self.session = session
+        self.channel = channel
+        self.retries = retries if retries != None else common.GNXEDIT_CONFIG["midi"].get("upload_retries", 3)
+        self.jobs = []
+        self.stats = UploadStats()
+
+    def build(self, opcode, data):
+        return sysex.encode(self.channel, MNFR_ID, DEVICE_ID, opcode, data)
+
+    # the future resolves with the name when the patch is in, or with the exception that stopped it
+    def queue(self, name, blocks, target = None):
+        job = UploadJob(name, blocks, target)
+        self.jobs.append(job)
+        return job.future
+
+    def pending(self):
+        return len(self.jobs)
+
+    # every queued patch, one after the other, including any queued while it runs; a failed patch doesn't stop the rest
+    def queue_steps(self):
+        while self.jobs:
+            job = self.jobs.pop(0)
+            try:
+                yield from self.upload_steps(job.name, job.blocks, job.target)
+                job.future.set_result(job.name)
+            except Exception as e:
+                job.future.set_exception(e)
+        return self.stats
+
+    # each block is acknowledged, or resent until it is, before the next goes: the unit takes them in order, and
+    # uploads are bound by the wire rather than the round trip, so blocks sent ahead gained nothing
+    def upload_steps(self, name, blocks, target = None, progress = None):
+        session = self.session
+        resent, naks, timeouts = session.resent, session.naks, session.timeouts
+        started = time.perf_counter()
+        name = (name.upper() + "      ")[:6]
+        block = None                    # future of the block sent and not yet acknowledged
+        try:
+            yield session.request(self.build(0x21, [0x01, 0x02, 0x00] + [ord(c) for c in name] + [0x00, 0x00, 0x08, 0x09, 0x7C]),
+                                  (ACK, 0x21), retries = self.retries, label = "upload 21")
+            self.stats.sent += 1
+            for k in BLOCK_KEYS:
+                msg = sysex.rechannel(blocks[k], self.channel)
+                code = msg[sysex.OPCODE_OFFSET]
+                block = session.request(msg, (ACK, code), retries = self.retries, label = f"upload {code:02X}")
+                self.stats.sent += 1
+                yield block
+                block = None
+                self.stats.blocks += 1
+                self.stats.bytes += len(msg)
+                if progress != None:
+                    progress()
+            yield session.request(self.build(0x22, [0x01]), (ACK, 0x22), retries = self.retries, label = "upload 22")
+            self.stats.sent += 1
+            if target != None:
+                yield from self.store_steps(target[0], target[1], name)
+            self.stats.patches += 1
+        except BaseException as e:      # a cancelled task closes the generator, the block waiting goes too
+            if block != None:
+                session.cancel(block, f"upload stopped: {e}" if isinstance(e, Exception) else "upload stopped")
+            if isinstance(e, Exception):
+                self.stats.failed += 1
+            raise
+        finally:
+            self.stats.resent += session.resent - resent
+            self.stats.sent += session.resent - resent
+            self.stats.naks += session.naks - naks
+            self.stats.timeouts += session.timeouts - timeouts
+            self.stats.elapsed += time.perf_counter() - started
+        return name
+
+    # edit buffer into a stored patch, as GNX1.save_patch; saving it again is harmless so it is retried like a block
+    def store_steps(self, bank, patch, name):
+        yield self.session.request(self.build(0x2E, [0x01, 0x02, 0x00, bank, patch] + [ord(c) for c in name] + [0x00, 0xFF]),
+                                   (ACK, 0x2E), retries = self.retries, label = "save patch 2E")
+        self.stats.sent += 1